@@ -26,15 +26,38 @@ ENHANCEMENTS, OR MODIFICATIONS.
 import logging
 import os
 
-ADVISORY_LOCK_ID_CANVAS_POLLER = 1000
 ADVISORY_LOCK_ID_WHITEBOARD_HOUSEKEEPING = 2000
 
 API_PREFIX = 'https://example.com/api'
 
+ASSET_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# 'redirect' sends downloads to a short-lived presigned S3 URL; 'proxy' streams them through the app, honoring Range and
+# If-None-Match.
+ASSET_DOWNLOAD_MODE = 'redirect'
+ASSET_DOWNLOAD_URL_EXPIRES_IN = 5 * 60
+
+# Seconds to reuse an Asset Library search total while paging through results.
+ASSET_TOTAL_CACHE_TTL_SECONDS = 60
+# Uploaded files, and files the bookmarklet fetches, are refused once they grow past this size.
+ASSET_UPLOAD_MAX_BYTES = 500 * 1024 * 1024
+# Asset views are buffered in memory and written in batches at this interval. Zero writes each view as it happens.
+ASSET_VIEWS_FLUSH_INTERVAL_SECONDS = 10
+# Should the database be unavailable, a batch of views is put back for this many attempts in all before it is dropped.
+ASSET_VIEWS_FLUSH_MAX_ATTEMPTS = 10
+
 AWS_ACCESS_KEY_ID = 'some id'
 AWS_SECRET_ACCESS_KEY = 'some secret'
 AWS_S3_BUCKET_FOR_ASSETS = None
 AWS_S3_REGION = 'us-west-2'
+# Connections each process's shared S3 client keeps open.
+AWS_S3_MAX_POOL_CONNECTIONS = 25
+# Part size for streaming (multipart) uploads to S3. S3 requires at least 5 MB for all parts but the last.
+AWS_S3_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+# Parts of one streaming upload sent at once. Each upload buffers roughly (concurrency + 1) parts in memory.
+AWS_S3_MULTIPART_MAX_CONCURRENCY = 2
+# Signed URLs for preview images are cached per process, and reused while they have at least an hour to live.
+AWS_S3_SIGNED_URL_CACHE_SIZE = 10000
+AWS_S3_SIGNED_URL_EXPIRES_IN = 2 * 60 * 60
 
 # Base directory for the application (one level up from this config file).
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -44,9 +67,58 @@ BOOKMARKLET_ENCRYPTION_KEY = b'32 url-safe base64-encoded bytes'
 CAS_SERVER = 'https://auth-test.berkeley.edu/cas/'
 CAS_LOGOUT_URL = 'https://auth-test.berkeley.edu/cas/logout'
 
+# Rarely-changing Canvas API responses are cached ('disk' or 'redis') and revalidated with If-None-Match on each request.
+CANVAS_API_CACHE_BACKEND = 'disk'
+# Defaults to a directory under the system temp dir.
+CANVAS_API_CACHE_DIR = None
+CANVAS_API_CACHE_ENDPOINTS = [
+    r'/api/v1/courses/\d+/assignments(\?|$)',
+    r'/api/v1/courses/\d+/group_categories(\?|$)',
+    r'/api/v1/courses/\d+/sections(\?|$)',
+    r'/api/v1/courses/\d+/tabs(\?|$)',
+]
+# Cached responses, on disk or in Redis, expire this long after they were written.
+CANVAS_API_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# Concurrent requests per Canvas API domain, adjusted downward when the X-Rate-Limit-Remaining quota drops below threshold.
+CANVAS_API_MAX_CONCURRENCY = 8
+CANVAS_API_RATE_LIMIT_BACKOFF_SECONDS = 2
+CANVAS_API_RATE_LIMIT_RETRIES = 3
+CANVAS_API_RATE_LIMIT_THRESHOLD = 200
+
 CANVAS_POLLER = True
 CANVAS_POLLER_ACCEPTABLE_HOURS_SINCE_LAST = 1
+# Submission attachments are streamed to S3 by a pool of threads per Canvas API domain. A full queue blocks the poller.
+CANVAS_POLLER_ATTACHMENT_MAX_ATTEMPTS = 3
+CANVAS_POLLER_ATTACHMENT_MAX_BYTES = 10485760
+CANVAS_POLLER_ATTACHMENT_QUEUE_SIZE = 100
+CANVAS_POLLER_ATTACHMENT_RETRY_SECONDS = 2
+CANVAS_POLLER_ATTACHMENT_WORKERS = 4
+# Number of courses claimed by a poller worker per round trip to the database.
+CANVAS_POLLER_BATCH_SIZE = 3
+# Weight given to the latest poll when averaging how often polls find changes.
+CANVAS_POLLER_CHANGE_RATE_DECAY = 0.7
 CANVAS_POLLER_DEACTIVATION_THRESHOLD = 90
+# Between full syncs, the poller fetches only what changed since the per-course sync cursors.
+CANVAS_POLLER_FULL_SYNC_INTERVAL_HOURS = 24
+# A claimed course is not handed to another worker until its lease expires.
+CANVAS_POLLER_LEASE_SECONDS = 600
+# Hot courses are polled every few minutes and cold ones daily. See squiggy/lib/poll_scheduler.py.
+CANVAS_POLLER_MAX_INTERVAL_MINUTES = 1440
+CANVAS_POLLER_MIN_INTERVAL_MINUTES = 5
+CANVAS_POLLER_PRIORITY_HALF_LIFE_HOURS = 24
+CANVAS_POLLER_PRIORITY_WEIGHTS = {
+    'activity': 0.35,
+    'changeRate': 0.25,
+    'dueDate': 0.25,
+    'launch': 0.15,
+}
+# A course whose poll fails is retried after this long, doubling with each consecutive failure.
+CANVAS_POLLER_RETRY_MINUTES = 5
+CANVAS_POLLER_SLEEP_SECONDS = 5
+CANVAS_POLLER_SYNC_OVERLAP_SECONDS = 300
+# Concurrent poller workers per Canvas API domain. Override per domain, e.g. {'bcourses.berkeley.edu': 8}.
+CANVAS_POLLER_WORKERS = 4
+CANVAS_POLLER_WORKERS_PER_DOMAIN = {}
 
 COUNTDOWN = '2025-06-30'
 
@@ -92,7 +164,27 @@ PREVIEWS_API_KEY = 'someKey'
 # running locally (unreachable by preview-service) then use PREVIEWS_CALLBACK_API_PREFIX to point at squiggy-dev.
 # If PREVIEWS_CALLBACK_API_PREFIX is nil then Squiggy uses API_PREFIX config value.
 PREVIEWS_CALLBACK_API_PREFIX = None
+# Requests to the preview service are queued in the preview_requests table, in the same transaction as the asset, and
+# sent in batches by a background dispatcher. A claimed request not settled within the lease (say, its process died) is
+# claimed again. Failures are retried with exponential backoff; after the last attempt the preview status is 'error'.
+PREVIEWS_DISPATCH_BATCH_SIZE = 25
+PREVIEWS_DISPATCH_CONCURRENCY = 4
+PREVIEWS_DISPATCH_INTERVAL_SECONDS = 2
+PREVIEWS_DISPATCH_LEASE_SECONDS = 120
+PREVIEWS_DISPATCH_MAX_ATTEMPTS = 6
+PREVIEWS_DISPATCH_MAX_RETRY_SECONDS = 30 * 60
+PREVIEWS_DISPATCH_RETRY_SECONDS = 15
 PREVIEWS_ENABLED = True
+# Optionally, previews of small images and PDFs are made in-process, by a pool of worker processes, and only other files
+# go to the preview service. Requires Pillow, and pypdfium2 for PDFs. Images are scaled down to PREVIEWS_LOCAL_IMAGE_WIDTH
+# and thumbnails to fit a PREVIEWS_LOCAL_THUMBNAIL_SIZE square.
+PREVIEWS_LOCAL_ENABLED = False
+PREVIEWS_LOCAL_IMAGE_WIDTH = 1280
+PREVIEWS_LOCAL_MAX_BYTES = 20 * 1024 * 1024
+PREVIEWS_LOCAL_THUMBNAIL_SIZE = 320
+PREVIEWS_LOCAL_TIMEOUT_SECONDS = 10
+PREVIEWS_LOCAL_WORKERS = 2
+PREVIEWS_REQUEST_TIMEOUT_SECONDS = 10
 PREVIEWS_URL = 'https://example.com/previews'
 PREVIEWS_UNSUPPORTED_MIME_TYPES = ['image/heic', 'image/webp']
 
@@ -140,6 +232,20 @@ TIMEZONE = 'America/Los_Angeles'
 # This base-URL config should only be non-None in the "local" env where the Vue front-end runs on port 8080.
 VUE_LOCALHOST_BASE_URL = None
 
+# Whiteboard updates are sent to each room in frames of this length, one emit per frame, keeping only the latest update
+# to each element. A client with more packets than WHITEBOARD_BROADCAST_MAX_QUEUED_PACKETS waiting to go out is skipped
+# until it catches up. Zero emits every update as it arrives.
+WHITEBOARD_BROADCAST_FRAME_MILLISECONDS = 40
+WHITEBOARD_BROADCAST_MAX_QUEUED_PACKETS = 32
+
+# Edits made over socket.io are broadcast at once, but saved in batches at this interval, keeping only the latest
+# state of each element. Meanwhile they are journaled, and replayed by another process if this one dies: in Redis when
+# REDIS_HOST is set, else under WHITEBOARD_EDITS_JOURNAL_DIR (by default, a directory in the system temp dir), which
+# only a process on the same host will replay. Each process buffers its own edits, so a request served by another
+# worker may read a whiteboard up to one interval stale. Zero saves every edit as it arrives.
+WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS = 250
+WHITEBOARD_EDITS_JOURNAL_DIR = None
+
 WHITEBOARD_HOUSEKEEPING_ACCEPTABLE_MINUTES_SINCE_LAST = 60
 WHITEBOARD_SESSION_EXPIRATION_MINUTES = 2
 # The following value is in milliseconds.
@@ -0,0 +1,162 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import event
+from sqlalchemy.sql import text
+from squiggy import db
+from squiggy.factory import create_app
+from squiggy.models.asset import Asset
+
+"""Measure the latency and statement count of opening an asset, i.e. Asset.to_api_json.
+
+From the project root, against a disposable database:
+    ``PYTHONPATH=. python scripts/benchmarks/asset_detail.py --owners 3 --comments 50``
+
+Each run creates a scratch course with multi-owner assets and rolls everything back when done.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', type=int, default=50, help='Assets to open')
+    parser.add_argument('--categories', type=int, default=3, help='Categories per asset')
+    parser.add_argument('--comments', type=int, default=50, help='Comments per asset')
+    parser.add_argument('--owners', type=int, default=3, help='Owners per asset')
+    args = parser.parse_args()
+
+    app, socketio = create_app()
+    with app.app_context():
+        try:
+            _benchmark(args)
+        finally:
+            db.session.rollback()
+
+
+def _benchmark(args):
+    db.session.execute(text("""
+        INSERT INTO canvas (canvas_api_domain, api_key, lti_key, lti_secret)
+        VALUES ('benchmark.example.com', 'benchmark', 'benchmark', 'benchmark')
+    """))
+    course_id = db.session.execute(text("""
+        INSERT INTO courses (canvas_api_domain, canvas_course_id, name)
+        VALUES ('benchmark.example.com', -1, 'Asset detail benchmark') RETURNING id
+    """)).scalar()
+    params = {'course_id': course_id}
+    user_ids = [
+        row['id'] for row in db.session.execute(
+            text("""
+                INSERT INTO users (course_id, canvas_user_id, canvas_course_role, canvas_enrollment_state, canvas_full_name, bookmarklet_token)
+                SELECT :course_id, -n, 'Learner', 'active', 'Benchmark user ' || n, md5(n::text)
+                FROM generate_series(1, :owners + 1) AS n
+                RETURNING id
+            """),
+            {**params, 'owners': args.owners},
+        )
+    ]
+    viewer_id = user_ids.pop()
+    # Every owner belongs to a group and collaborates on a few whiteboards, as they would by mid-semester.
+    db.session.execute(
+        text("""
+            WITH g AS (
+                INSERT INTO course_groups (course_id, canvas_group_id, name, category_name)
+                VALUES (:course_id, -1, 'Benchmark group', 'Benchmark groups') RETURNING id
+            )
+            INSERT INTO course_group_memberships (course_id, course_group_id, canvas_user_id)
+            SELECT :course_id, g.id, u.canvas_user_id FROM g, users u WHERE u.course_id = :course_id
+        """),
+        params,
+    )
+    for user_id in user_ids:
+        db.session.execute(
+            text("""
+                WITH w AS (
+                    INSERT INTO whiteboards (course_id, created_by, title)
+                    SELECT :course_id, :user_id, 'Benchmark whiteboard ' || n FROM generate_series(1, 5) AS n RETURNING id
+                )
+                INSERT INTO whiteboard_users (whiteboard_id, user_id) SELECT w.id, :user_id FROM w
+            """),
+            {**params, 'user_id': user_id},
+        )
+    category_ids = [
+        row['id'] for row in db.session.execute(
+            text("""
+                INSERT INTO categories (course_id, title, visible)
+                SELECT :course_id, 'Benchmark category ' || n, TRUE FROM generate_series(1, :categories) AS n
+                RETURNING id
+            """),
+            {**params, 'categories': args.categories},
+        )
+    ]
+    asset_ids = [
+        row['id'] for row in db.session.execute(
+            text("""
+                INSERT INTO assets (course_id, created_by, type, title, url)
+                SELECT :course_id, :created_by, 'link', 'Benchmark asset ' || n, 'https://www.example.com/' || n
+                FROM generate_series(1, :assets) AS n
+                RETURNING id
+            """),
+            {**params, 'assets': args.assets, 'created_by': user_ids[0]},
+        )
+    ]
+    db.session.execute(
+        text("""
+            INSERT INTO asset_users (asset_id, user_id)
+                SELECT a, u FROM unnest(CAST(:asset_ids AS integer[])) AS a, unnest(CAST(:user_ids AS integer[])) AS u;
+            INSERT INTO asset_categories (asset_id, category_id)
+                SELECT a, c FROM unnest(CAST(:asset_ids AS integer[])) AS a, unnest(CAST(:category_ids AS integer[])) AS c;
+            INSERT INTO comments (asset_id, user_id, body)
+                SELECT a, :viewer_id, 'Benchmark comment ' || n FROM unnest(CAST(:asset_ids AS integer[])) AS a, generate_series(1, :comments) AS n;
+        """),
+        {'asset_ids': asset_ids, 'category_ids': category_ids, 'comments': args.comments, 'user_ids': user_ids, 'viewer_id': viewer_id},
+    )
+    db.session.execute(text('ANALYZE'))
+
+    statement_counts = []
+    engine = db.session.get_bind().engine
+
+    def _count_statement(*args):
+        statement_counts[-1] += 1
+    event.listen(engine, 'before_cursor_execute', _count_statement)
+    latencies = []
+    try:
+        for asset_id in asset_ids:
+            db.session.expire_all()
+            statement_counts.append(0)
+            start = time.perf_counter()
+            Asset.find_by_id(asset_id).to_api_json(user_id=viewer_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        event.remove(engine, 'before_cursor_execute', _count_statement)
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    print(f"{'owners':>6}  {'statements':>10}  {'median ms':>9}  {'p95 ms':>8}")
+    print(f'{args.owners:>6}  {statistics.median(statement_counts):>10}  {statistics.median(latencies):>9.2f}  {p95:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
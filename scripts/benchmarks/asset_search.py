@@ -0,0 +1,134 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import argparse
+import json
+from random import Random
+import statistics
+import time
+
+from sqlalchemy.sql import text
+from squiggy import db
+from squiggy.factory import create_app
+
+"""Compare Asset Library keyword search latency: ILIKE versus the maintained full-text search vector.
+
+From the project root, against a disposable database:
+    ``PYTHONPATH=. python scripts/benchmarks/asset_search.py --assets 10000 100000``
+
+Each run creates a scratch course full of generated assets and rolls everything back when done.
+"""
+
+BATCH_SIZE = 5000
+
+PAGE_SQL = """
+    SELECT a.id FROM assets a
+    WHERE a.course_id = :course_id AND a.deleted_at IS NULL AND a.visible = TRUE AND {predicate}
+    ORDER BY a.id DESC LIMIT 20
+"""
+
+COUNT_SQL = """
+    SELECT COUNT(*) FROM assets a
+    WHERE a.course_id = :course_id AND a.deleted_at IS NULL AND a.visible = TRUE AND {predicate}
+"""
+
+PREDICATES = {
+    'ilike': '(a.title ILIKE :keywords OR a.description ILIKE :keywords)',
+    'tsvector': "a.search_vector @@ to_tsquery('simple', :search_query)",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', nargs='+', type=int, default=[10000, 100000], help='Asset counts to benchmark')
+    parser.add_argument('--queries', type=int, default=50, help='Searches per method and asset count')
+    args = parser.parse_args()
+
+    app, socketio = create_app()
+    with app.app_context():
+        print(f"{'assets':>8}  {'method':<9}  {'median ms':>9}  {'p95 ms':>8}")
+        for asset_count in args.assets:
+            try:
+                _benchmark(asset_count=asset_count, query_count=args.queries)
+            finally:
+                db.session.rollback()
+
+
+def _benchmark(asset_count, query_count):
+    random = Random(asset_count)
+    vocabulary = _generate_vocabulary(random)
+    db.session.execute(text("""
+        INSERT INTO canvas (canvas_api_domain, api_key, lti_key, lti_secret)
+        VALUES ('benchmark.example.com', 'benchmark', 'benchmark', 'benchmark')
+    """))
+    course_id = db.session.execute(text("""
+        INSERT INTO courses (canvas_api_domain, canvas_course_id, name)
+        VALUES ('benchmark.example.com', -1, 'Asset search benchmark') RETURNING id
+    """)).scalar()
+    for offset in range(0, asset_count, BATCH_SIZE):
+        rows = [
+            {
+                'description': ' '.join(random.choices(vocabulary, k=30)),
+                'title': ' '.join(random.choices(vocabulary, k=5)),
+                'url': f'https://www.example.com/{random.choice(vocabulary)}/{offset + i}',
+            } for i in range(min(BATCH_SIZE, asset_count - offset))
+        ]
+        db.session.execute(
+            text("""
+                INSERT INTO assets (course_id, created_by, type, title, description, url)
+                SELECT :course_id, 0, 'link', r.title, r.description, r.url
+                FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS r(title text, description text, url text)
+            """),
+            {'course_id': course_id, 'rows': json.dumps(rows)},
+        )
+    db.session.execute(text('ANALYZE assets'))
+
+    searches = []
+    for _ in range(query_count):
+        # What a student might have typed so far: a whole word, then the start of another.
+        terms = [random.choice(vocabulary), random.choice(vocabulary)[:4]]
+        searches.append({
+            'course_id': course_id,
+            'keywords': '%' + '%'.join(terms) + '%',
+            'search_query': ' & '.join(f'{term}:*' for term in terms),
+        })
+    for method, predicate in PREDICATES.items():
+        latencies = []
+        for params in searches:
+            start = time.perf_counter()
+            db.session.execute(text(PAGE_SQL.format(predicate=predicate)), params).fetchall()
+            db.session.execute(text(COUNT_SQL.format(predicate=predicate)), params).scalar()
+            latencies.append((time.perf_counter() - start) * 1000)
+        p95 = statistics.quantiles(latencies, n=20)[-1]
+        print(f'{asset_count:>8}  {method:<9}  {statistics.median(latencies):>9.2f}  {p95:>8.2f}')
+
+
+def _generate_vocabulary(random, size=5000):
+    syllables = ['ba', 'ce', 'di', 'fo', 'gu', 'ka', 'le', 'mi', 'no', 'pu', 'ra', 'se', 'ti', 'vo', 'xu', 'za']
+    return [''.join(random.choices(syllables, k=random.randint(2, 5))) for _ in range(size)]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import argparse
+from collections import Counter
+import statistics
+from threading import Lock
+import time
+from uuid import uuid4
+
+import requests
+import socketio
+
+"""Load test of whiteboard broadcasts: messages per second and fan-out latency on a busy board.
+
+Against a running Squiggy with DEVELOPER_AUTH_ENABLED, and a whiteboard whose collaborators include the given users:
+    ``python scripts/benchmarks/whiteboard_broadcasts.py --whiteboard-id 1 --user-ids 1 2 3 --clients 40 --senders 10``
+
+Every client joins the whiteboard; each sender drags its own text element at --rate updates per second. Fan-out latency
+is the time from a sender's emit to each other client's receipt of the update, on one clock since everything runs here.
+Run it with WHITEBOARD_BROADCAST_FRAME_MILLISECONDS set to zero, then to its default, to compare. The elements are
+deleted when done.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--base-url', default='http://localhost:5000', help='Squiggy, as served by application.py')
+    parser.add_argument('--clients', type=int, default=40, help='Clients on the whiteboard')
+    parser.add_argument('--password', default='shotz_brewery', help='DEVELOPER_AUTH_PASSWORD')
+    parser.add_argument('--rate', type=int, default=30, help='Updates per second per sender')
+    parser.add_argument('--seconds', type=int, default=20, help='Duration of the test')
+    parser.add_argument('--senders', type=int, default=10, help='Clients dragging an element')
+    parser.add_argument('--user-ids', nargs='+', type=int, required=True, help='Users who may update the whiteboard')
+    parser.add_argument('--whiteboard-id', type=int, required=True)
+    args = parser.parse_args()
+
+    stats = _Stats()
+    clients = [_connect(args, args.user_ids[i % len(args.user_ids)], stats) for i in range(args.clients)]
+    senders = clients[:args.senders]
+    uuids = {client.sid: str(uuid4()) for client in senders}
+    print(f'{len(clients)} clients on whiteboard {args.whiteboard_id}, {len(senders)} sending {args.rate} updates per second')
+
+    interval = 1 / args.rate
+    started_at = time.time()
+    try:
+        step = 0
+        while time.time() - started_at < args.seconds:
+            tick = time.time()
+            for client in senders:
+                client.emit('upsert_whiteboard_element', {
+                    'whiteboardElements': [_text_element(uuids[client.sid], left=step % 800, sent_at=time.time())],
+                    'whiteboardId': args.whiteboard_id,
+                })
+            step += 1
+            time.sleep(max(0, interval - (time.time() - tick)))
+        # Let the last frames arrive.
+        time.sleep(1)
+    finally:
+        elapsed = time.time() - started_at
+        _delete_elements(args, clients[0], list(uuids.values()))
+        for client in clients:
+            client.emit('leave', {'whiteboardId': args.whiteboard_id})
+            client.disconnect()
+    stats.report(elapsed=elapsed, sent=step * len(senders))
+
+
+class _Stats:
+
+    def __init__(self):
+        self.latencies = []
+        self.lock = Lock()
+        self.messages = Counter()
+        self.updates = 0
+
+    def receive(self, client, data):
+        received_at = time.time()
+        with self.lock:
+            self.messages[client.sid] += 1
+            for update in data:
+                if update.get('socketId') == client.sid:
+                    continue
+                sent_at = (update.get('element') or {}).get('loadTestSentAt')
+                if sent_at:
+                    self.latencies.append((received_at - sent_at) * 1000)
+                    self.updates += 1
+
+    def report(self, elapsed, sent):
+        messages = sum(self.messages.values())
+        print(f'Updates sent:          {sent} ({sent / elapsed:.0f} per second)')
+        print(f'Messages received:     {messages} ({messages / elapsed:.0f} per second, all clients)')
+        print(f'Updates received:      {self.updates} ({self.updates / elapsed:.0f} per second, all clients)')
+        if len(self.latencies) > 1:
+            percentiles = statistics.quantiles(self.latencies, n=100)
+            print(f'Fan-out latency (ms):  median {statistics.median(self.latencies):.1f}, p99 {percentiles[98]:.1f}')
+
+
+def _connect(args, user_id, stats):
+    http_session = requests.Session()
+    response = http_session.post(
+        f'{args.base_url}/api/auth/dev_auth_login',
+        json={'password': args.password, 'userId': user_id},
+    )
+    response.raise_for_status()
+    client = socketio.Client(http_session=http_session)
+    client.http_session = http_session
+    client.on('upsert_whiteboard_elements', lambda data: stats.receive(client, data))
+    client.connect(args.base_url)
+    client.call('join', {'whiteboardId': args.whiteboard_id})
+    return client
+
+
+def _delete_elements(args, client, uuids):
+    client.http_session.delete(
+        f'{args.base_url}/api/whiteboard_elements/delete',
+        json={'socketId': client.sid, 'uuids': uuids, 'whiteboardId': args.whiteboard_id},
+    )
+
+
+def _text_element(uuid, left, sent_at):
+    return {
+        'assetId': None,
+        'element': {
+            'fill': 'rgb(0,0,0)',
+            'fontSize': 14,
+            'left': left,
+            'loadTestSentAt': sent_at,
+            'text': 'Load test',
+            'top': 100,
+            'type': 'i-text',
+            'uuid': uuid,
+        },
+        'uuid': uuid,
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -40,11 +40,15 @@ ALTER TABLE IF EXISTS ONLY public.activities DROP CONSTRAINT IF EXISTS activitie
 ALTER TABLE IF EXISTS ONLY public.activities DROP CONSTRAINT IF EXISTS activities_reciprocal_id_fkey;
 ALTER TABLE IF EXISTS ONLY public.activities DROP CONSTRAINT IF EXISTS activities_user_id_fkey;
 
+ALTER TABLE IF EXISTS ONLY public.activity_counts DROP CONSTRAINT IF EXISTS activity_counts_user_id_fkey;
+
 ALTER TABLE IF EXISTS ONLY public.activity_types DROP CONSTRAINT IF EXISTS activity_types_course_id_fkey;
 
 ALTER TABLE IF EXISTS ONLY public.asset_categories DROP CONSTRAINT IF EXISTS asset_categories_asset_id_fkey;
 ALTER TABLE IF EXISTS ONLY public.asset_categories DROP CONSTRAINT IF EXISTS asset_categories_category_id_fkey;
 
+ALTER TABLE IF EXISTS ONLY public.asset_section_visibility DROP CONSTRAINT IF EXISTS asset_section_visibility_asset_id_fkey;
+
 ALTER TABLE IF EXISTS ONLY public.asset_users DROP CONSTRAINT IF EXISTS asset_users_asset_id_fkey;
 ALTER TABLE IF EXISTS ONLY public.asset_users DROP CONSTRAINT IF EXISTS asset_users_user_id_fkey;
 
@@ -66,9 +70,16 @@ ALTER TABLE IF EXISTS ONLY public.course_groups DROP CONSTRAINT IF EXISTS course
 
 ALTER TABLE IF EXISTS ONLY public.courses DROP CONSTRAINT IF EXISTS courses_canvas_api_domain_fkey;
 
+ALTER TABLE IF EXISTS ONLY public.canvas_attachments DROP CONSTRAINT IF EXISTS canvas_attachments_asset_id_fkey;
+ALTER TABLE IF EXISTS ONLY public.canvas_attachments DROP CONSTRAINT IF EXISTS canvas_attachments_course_id_fkey;
+
 ALTER TABLE IF EXISTS ONLY public.canvas_poller_api_keys
   DROP CONSTRAINT IF EXISTS canvas_poller_api_keys_canvas_api_domain_fkey;
 
+ALTER TABLE IF EXISTS ONLY public.canvas_sync_cursors DROP CONSTRAINT IF EXISTS canvas_sync_cursors_course_id_fkey;
+
+ALTER TABLE IF EXISTS ONLY public.stored_files DROP CONSTRAINT IF EXISTS stored_files_course_id_fkey;
+
 ALTER TABLE IF EXISTS ONLY public.users DROP CONSTRAINT IF EXISTS users_course_id_fkey;
 
 ALTER TABLE IF EXISTS ONLY public.whiteboard_elements DROP CONSTRAINT IF EXISTS whiteboard_elements_asset_id_fkey;
@@ -87,6 +98,8 @@ ALTER TABLE IF EXISTS ONLY public.whiteboards DROP CONSTRAINT IF EXISTS whiteboa
 ALTER TABLE IF EXISTS ONLY public.activities DROP CONSTRAINT IF EXISTS activities_pkey;
 ALTER TABLE IF EXISTS public.activities ALTER COLUMN id DROP DEFAULT;
 
+ALTER TABLE IF EXISTS ONLY public.activity_counts DROP CONSTRAINT IF EXISTS activity_counts_pkey;
+
 ALTER TABLE IF EXISTS ONLY public.activity_types DROP CONSTRAINT IF EXISTS activity_types_pkey;
 ALTER TABLE IF EXISTS public.activity_types ALTER COLUMN id DROP DEFAULT;
 
@@ -105,9 +118,13 @@ ALTER TABLE IF EXISTS ONLY public.canvas DROP CONSTRAINT IF EXISTS canvas_lti_ke
 ALTER TABLE IF EXISTS ONLY public.canvas DROP CONSTRAINT IF EXISTS canvas_lti_secret_key;
 ALTER TABLE IF EXISTS ONLY public.canvas DROP CONSTRAINT IF EXISTS canvas_pkey;
 
+ALTER TABLE IF EXISTS ONLY public.canvas_attachments DROP CONSTRAINT IF EXISTS canvas_attachments_pkey;
+
 ALTER TABLE IF EXISTS ONLY public.canvas_poller_api_keys
   DROP CONSTRAINT IF EXISTS canvas_poller_api_keys_pkey;
 
+ALTER TABLE IF EXISTS ONLY public.canvas_sync_cursors DROP CONSTRAINT IF EXISTS canvas_sync_cursors_pkey;
+
 ALTER TABLE IF EXISTS ONLY public.categories DROP CONSTRAINT IF EXISTS categories_pkey;
 ALTER TABLE IF EXISTS public.categories ALTER COLUMN id DROP DEFAULT;
 
@@ -120,6 +137,11 @@ ALTER TABLE IF EXISTS public.course_groups ALTER COLUMN id DROP DEFAULT;
 ALTER TABLE IF EXISTS ONLY public.courses DROP CONSTRAINT IF EXISTS courses_pkey;
 ALTER TABLE IF EXISTS public.courses ALTER COLUMN id DROP DEFAULT;
 
+ALTER TABLE IF EXISTS ONLY public.preview_requests DROP CONSTRAINT IF EXISTS preview_requests_pkey;
+ALTER TABLE IF EXISTS public.preview_requests ALTER COLUMN id DROP DEFAULT;
+
+ALTER TABLE IF EXISTS ONLY public.stored_files DROP CONSTRAINT IF EXISTS stored_files_pkey;
+
 ALTER TABLE IF EXISTS ONLY public.users DROP CONSTRAINT IF EXISTS users_pkey;
 ALTER TABLE IF EXISTS public.users ALTER COLUMN id DROP DEFAULT;
 
@@ -141,27 +163,41 @@ DROP INDEX IF EXISTS activity_types_type_course_id_idx;
 DROP INDEX IF EXISTS asset_categories_asset_id_idx;
 DROP INDEX IF EXISTS asset_categories_category_id_idx;
 
+DROP INDEX IF EXISTS assets_course_id_content_hash_idx;
+DROP INDEX IF EXISTS assets_course_id_id_idx;
+DROP INDEX IF EXISTS assets_search_vector_idx;
+
+DROP INDEX IF EXISTS asset_section_visibility_asset_id_canvas_course_section_idx;
+
 DROP INDEX IF EXISTS asset_users_asset_id_idx;
 DROP INDEX IF EXISTS asset_users_user_id_idx;
 
 DROP INDEX IF EXISTS course_group_memberships_canvas_user_id_idx;
 
-DROP INDEX IF EXISTS whiteboard_elements_created_at_uuid_whiteboard_id_idx;
+DROP INDEX IF EXISTS courses_active_canvas_api_domain_next_poll_at_idx;
+
+DROP INDEX IF EXISTS preview_requests_next_attempt_at_idx;
+
+DROP INDEX IF EXISTS whiteboard_elements_whiteboard_id_uuid_idx;
 
 --
 
 DROP SEQUENCE IF EXISTS public.activities_id_seq;
 DROP TABLE IF EXISTS public.activities;
+DROP TABLE IF EXISTS public.activity_counts;
 DROP SEQUENCE IF EXISTS public.activity_types_id_seq;
 DROP TABLE IF EXISTS public.activity_types;
 DROP TABLE IF EXISTS public.asset_categories;
+DROP TABLE IF EXISTS public.asset_section_visibility;
 DROP TABLE IF EXISTS public.asset_users;
 DROP TABLE IF EXISTS public.asset_whiteboard_elements;
 DROP SEQUENCE IF EXISTS public.assets_id_seq;
 DROP TABLE IF EXISTS public.assets;
 DROP TABLE IF EXISTS public.background_jobs;
 DROP TABLE IF EXISTS public.canvas;
+DROP TABLE IF EXISTS public.canvas_attachments;
 DROP TABLE IF EXISTS public.canvas_poller_api_keys;
+DROP TABLE IF EXISTS public.canvas_sync_cursors;
 DROP SEQUENCE IF EXISTS public.categories_id_seq;
 DROP TABLE IF EXISTS public.categories;
 DROP SEQUENCE IF EXISTS public.comments_id_seq;
@@ -171,6 +207,9 @@ DROP SEQUENCE IF EXISTS public.course_groups_id_seq;
 DROP TABLE IF EXISTS public.course_groups;
 DROP SEQUENCE IF EXISTS public.courses_id_seq;
 DROP TABLE IF EXISTS public.courses;
+DROP SEQUENCE IF EXISTS public.preview_requests_id_seq;
+DROP TABLE IF EXISTS public.preview_requests;
+DROP TABLE IF EXISTS public.stored_files;
 DROP SEQUENCE IF EXISTS public.users_id_seq;
 DROP TABLE IF EXISTS public.users;
 DROP TABLE IF EXISTS public.whiteboard_elements;
@@ -182,6 +221,15 @@ DROP TABLE IF EXISTS public.whiteboards;
 
 --
 
+DROP FUNCTION IF EXISTS public.asset_search_vector;
+DROP FUNCTION IF EXISTS public.update_activity_counts;
+DROP FUNCTION IF EXISTS public.update_asset_search_vector;
+DROP FUNCTION IF EXISTS public.update_asset_section_visibility;
+DROP FUNCTION IF EXISTS public.update_stored_file_ref_count;
+DROP FUNCTION IF EXISTS public.update_whiteboard_next_z_index;
+
+--
+
 DROP TYPE IF EXISTS public.enum_activities_object_type;
 DROP TYPE IF EXISTS public.enum_activities_type;
 DROP TYPE IF EXISTS public.enum_assets_type;
@@ -120,6 +120,42 @@ CREATE INDEX activities_created_at_idx ON activities USING btree (created_at);
 
 --
 
+CREATE TABLE activity_counts (
+    user_id integer NOT NULL,
+    activity_type enum_activities_type NOT NULL,
+    count integer DEFAULT 0 NOT NULL
+);
+
+ALTER TABLE ONLY activity_counts
+    ADD CONSTRAINT activity_counts_pkey PRIMARY KEY (user_id, activity_type);
+
+-- Per-user counts of each activity type, kept current by the triggers below, so that points can be recalculated without
+-- scanning activities.
+CREATE FUNCTION update_activity_counts() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE activity_counts c SET count = c.count - o.count
+        FROM (SELECT user_id, type, COUNT(*) AS count FROM old_activities GROUP BY user_id, type) o
+        WHERE c.user_id = o.user_id AND c.activity_type = o.type;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO activity_counts (user_id, activity_type, count)
+        SELECT user_id, type, COUNT(*) FROM new_activities GROUP BY user_id, type
+        ON CONFLICT (user_id, activity_type) DO UPDATE SET count = activity_counts.count + excluded.count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER activities_delete_counts_trigger AFTER DELETE ON activities
+    REFERENCING OLD TABLE AS old_activities FOR EACH STATEMENT EXECUTE FUNCTION update_activity_counts();
+CREATE TRIGGER activities_insert_counts_trigger AFTER INSERT ON activities
+    REFERENCING NEW TABLE AS new_activities FOR EACH STATEMENT EXECUTE FUNCTION update_activity_counts();
+CREATE TRIGGER activities_update_counts_trigger AFTER UPDATE ON activities
+    REFERENCING OLD TABLE AS old_activities NEW TABLE AS new_activities FOR EACH STATEMENT EXECUTE FUNCTION update_activity_counts();
+
+--
+
 CREATE TABLE activity_types (
     id integer NOT NULL,
     type enum_activities_type NOT NULL,
@@ -161,6 +197,15 @@ CREATE INDEX asset_categories_category_id_idx ON asset_categories USING btree (c
 
 --
 
+CREATE TABLE asset_section_visibility (
+    asset_id integer NOT NULL,
+    canvas_course_section character varying(255)
+);
+
+CREATE INDEX asset_section_visibility_asset_id_canvas_course_section_idx ON asset_section_visibility USING btree (asset_id, canvas_course_section);
+
+--
+
 CREATE TABLE asset_users (
     asset_id integer NOT NULL,
     user_id integer NOT NULL,
@@ -196,6 +241,7 @@ CREATE TABLE assets (
     body text,
     canvas_assignment_id integer,
     comment_count integer DEFAULT 0,
+    content_hash character(64),
     course_id integer NOT NULL,
     deleted_at TIMESTAMP WITH TIME ZONE,
     description text,
@@ -214,6 +260,7 @@ CREATE TABLE assets (
     url text,
     views integer DEFAULT 0,
     visible boolean DEFAULT true NOT NULL,
+    search_vector tsvector,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
     created_by integer NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
@@ -231,6 +278,10 @@ ALTER TABLE ONLY assets ALTER COLUMN id SET DEFAULT nextval('assets_id_seq'::reg
 ALTER TABLE ONLY assets
     ADD CONSTRAINT assets_pkey PRIMARY KEY (id);
 
+CREATE INDEX assets_course_id_content_hash_idx ON assets USING btree (course_id, content_hash) WHERE content_hash IS NOT NULL;
+CREATE INDEX assets_course_id_id_idx ON assets USING btree (course_id, id) WHERE deleted_at IS NULL;
+CREATE INDEX assets_search_vector_idx ON assets USING gin (search_vector);
+
 --
 
 CREATE TABLE background_jobs (
@@ -264,6 +315,23 @@ ALTER TABLE ONLY canvas
 
 --
 
+CREATE TABLE canvas_attachments (
+    course_id integer NOT NULL,
+    canvas_attachment_id integer NOT NULL,
+    asset_id integer,
+    content_hash character(64),
+    content_type character varying(255),
+    download_url character varying(255) NOT NULL,
+    size bigint,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY canvas_attachments
+    ADD CONSTRAINT canvas_attachments_pkey PRIMARY KEY (course_id, canvas_attachment_id);
+
+--
+
 CREATE TABLE canvas_poller_api_keys (
     canvas_api_domain character varying(255) NOT NULL,
     api_key character varying(255) NOT NULL,
@@ -276,6 +344,20 @@ ALTER TABLE ONLY canvas_poller_api_keys
 
 --
 
+CREATE TABLE canvas_sync_cursors (
+    course_id integer NOT NULL,
+    resource character varying(255) NOT NULL,
+    etags character varying(255)[],
+    last_synced_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY canvas_sync_cursors
+    ADD CONSTRAINT canvas_sync_cursors_pkey PRIMARY KEY (course_id, resource);
+
+--
+
 CREATE TABLE categories (
     id integer NOT NULL,
     title character varying(255) NOT NULL,
@@ -333,6 +415,7 @@ CREATE TABLE course_groups (
     canvas_group_id integer NOT NULL,
     name character varying(255),
     category_name character varying(255),
+    membership_hash character varying(64),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
 );
@@ -381,6 +464,12 @@ CREATE TABLE courses (
     whiteboards_url character varying(255),
     impact_studio_url character varying(255),
     protects_assets_per_section boolean DEFAULT false NOT NULL,
+    last_launched_at TIMESTAMP WITH TIME ZONE,
+    next_due_at TIMESTAMP WITH TIME ZONE,
+    next_poll_at TIMESTAMP WITH TIME ZONE,
+    poll_change_rate double precision DEFAULT 0 NOT NULL,
+    poll_failures integer DEFAULT 0 NOT NULL,
+    poll_priority double precision DEFAULT 0 NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
 );
@@ -398,6 +487,51 @@ ALTER TABLE ONLY courses
     ADD CONSTRAINT courses_pkey PRIMARY KEY (id);
 
 CREATE INDEX courses_last_polled_idx ON courses USING btree (last_polled);
+CREATE INDEX courses_active_canvas_api_domain_next_poll_at_idx ON courses USING btree (canvas_api_domain, next_poll_at) WHERE active IS TRUE;
+
+--
+
+CREATE TABLE preview_requests (
+    id integer NOT NULL,
+    object_type character varying(255) NOT NULL,
+    object_id integer NOT NULL,
+    object_url text NOT NULL,
+    attempts integer DEFAULT 0 NOT NULL,
+    last_error text,
+    next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+CREATE SEQUENCE preview_requests_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+ALTER SEQUENCE preview_requests_id_seq OWNED BY preview_requests.id;
+ALTER TABLE ONLY preview_requests ALTER COLUMN id SET DEFAULT nextval('preview_requests_id_seq'::regclass);
+
+ALTER TABLE ONLY preview_requests
+    ADD CONSTRAINT preview_requests_pkey PRIMARY KEY (id);
+
+CREATE INDEX preview_requests_next_attempt_at_idx ON preview_requests USING btree (next_attempt_at);
+
+--
+
+CREATE TABLE stored_files (
+    course_id integer NOT NULL,
+    content_hash character(64) NOT NULL,
+    content_type character varying(255),
+    download_url character varying(255) NOT NULL,
+    ref_count integer DEFAULT 0 NOT NULL,
+    size bigint,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY stored_files
+    ADD CONSTRAINT stored_files_pkey PRIMARY KEY (course_id, content_hash);
 
 --
 
@@ -442,6 +576,7 @@ CREATE TABLE whiteboard_elements (
     whiteboard_id integer NOT NULL,
     asset_id integer,
     z_index integer NOT NULL,
+    version integer DEFAULT 1 NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
 );
@@ -455,7 +590,7 @@ CREATE SEQUENCE whiteboard_elements_id_seq
 ALTER SEQUENCE whiteboard_elements_id_seq OWNED BY whiteboard_elements.id;
 ALTER TABLE ONLY whiteboard_elements ALTER COLUMN id SET DEFAULT nextval('whiteboard_elements_id_seq'::regclass);
 
-CREATE UNIQUE INDEX whiteboard_elements_created_at_uuid_whiteboard_id_idx ON whiteboard_elements USING btree (uuid, whiteboard_id, created_at);
+CREATE UNIQUE INDEX whiteboard_elements_whiteboard_id_uuid_idx ON whiteboard_elements USING btree (whiteboard_id, uuid);
 
 --
 
@@ -491,6 +626,7 @@ CREATE TABLE whiteboards (
     id integer NOT NULL,
     course_id integer NOT NULL,
     image_url character varying(255),
+    next_z_index integer DEFAULT 0 NOT NULL,
     thumbnail_url character varying(255),
     title character varying(255),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
@@ -513,6 +649,121 @@ ALTER TABLE ONLY whiteboards
 
 --
 
+-- Asset keyword search runs against a weighted document of title, description, category titles, link URL and comment
+-- bodies, kept current by the triggers below.
+CREATE FUNCTION asset_search_vector(asset_id integer, title text, description text, url text) RETURNS tsvector AS $$
+BEGIN
+    RETURN setweight(to_tsvector('simple', COALESCE(title, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(description, '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE((
+            SELECT string_agg(c.title, ' ') FROM asset_categories ac JOIN categories c ON c.id = ac.category_id
+            WHERE ac.asset_id = asset_search_vector.asset_id), '')), 'B')
+        || setweight(to_tsvector('simple', regexp_replace(COALESCE(url, ''), '\W+', ' ', 'g')), 'C')
+        || setweight(to_tsvector('simple', COALESCE((
+            SELECT string_agg(c.body, ' ') FROM comments c WHERE c.asset_id = asset_search_vector.asset_id), '')), 'D');
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE FUNCTION update_asset_search_vector() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'assets' THEN
+        NEW.search_vector := asset_search_vector(NEW.id, NEW.title, NEW.description, NEW.url);
+        RETURN NEW;
+    END IF;
+    IF TG_TABLE_NAME = 'categories' THEN
+        UPDATE assets a SET search_vector = asset_search_vector(a.id, a.title, a.description, a.url)
+        FROM asset_categories ac WHERE ac.category_id = NEW.id AND a.id = ac.asset_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE assets a SET search_vector = asset_search_vector(a.id, a.title, a.description, a.url) WHERE a.id = OLD.asset_id;
+    ELSE
+        UPDATE assets a SET search_vector = asset_search_vector(a.id, a.title, a.description, a.url) WHERE a.id = NEW.asset_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER assets_search_vector_trigger BEFORE INSERT OR UPDATE OF title, description, url ON assets
+    FOR EACH ROW EXECUTE FUNCTION update_asset_search_vector();
+CREATE TRIGGER asset_categories_search_vector_trigger AFTER INSERT OR DELETE ON asset_categories
+    FOR EACH ROW EXECUTE FUNCTION update_asset_search_vector();
+CREATE TRIGGER categories_search_vector_trigger AFTER UPDATE OF title ON categories
+    FOR EACH ROW EXECUTE FUNCTION update_asset_search_vector();
+CREATE TRIGGER comments_search_vector_trigger AFTER INSERT OR UPDATE OF body OR DELETE ON comments
+    FOR EACH ROW EXECUTE FUNCTION update_asset_search_vector();
+
+-- Which sections may see an asset in a section-protected course: those of its owner, or every section (NULL) if the owner
+-- is not a student. Kept current as assets are created and as roster syncs change users' roles and sections.
+CREATE FUNCTION update_asset_section_visibility() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM asset_section_visibility v USING assets a
+    WHERE v.asset_id = a.id AND (
+        (TG_TABLE_NAME = 'assets' AND a.id = NEW.id) OR (TG_TABLE_NAME = 'users' AND a.created_by = NEW.id)
+    );
+    INSERT INTO asset_section_visibility (asset_id, canvas_course_section)
+    SELECT a.id, s.section
+    FROM assets a
+    JOIN users u ON u.id = a.created_by
+    CROSS JOIN LATERAL unnest(
+        CASE WHEN lower(u.canvas_course_role) ~ '(student|learner)' THEN u.canvas_course_sections ELSE ARRAY[NULL]::varchar[] END
+    ) AS s(section)
+    WHERE (TG_TABLE_NAME = 'assets' AND a.id = NEW.id) OR (TG_TABLE_NAME = 'users' AND a.created_by = NEW.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER assets_section_visibility_trigger AFTER INSERT OR UPDATE OF created_by ON assets
+    FOR EACH ROW EXECUTE FUNCTION update_asset_section_visibility();
+CREATE TRIGGER users_section_visibility_trigger AFTER UPDATE OF canvas_course_role, canvas_course_sections ON users
+    FOR EACH ROW
+    WHEN (OLD.canvas_course_role IS DISTINCT FROM NEW.canvas_course_role OR OLD.canvas_course_sections IS DISTINCT FROM NEW.canvas_course_sections)
+    EXECUTE FUNCTION update_asset_section_visibility();
+
+-- How many live assets refer to each stored file. Its S3 object may be removed only once no asset refers to it.
+CREATE FUNCTION update_stored_file_ref_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        IF OLD.content_hash IS NOT NULL AND OLD.deleted_at IS NULL THEN
+            UPDATE stored_files SET ref_count = ref_count - 1, updated_at = now()
+            WHERE course_id = OLD.course_id AND content_hash = OLD.content_hash;
+        END IF;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        IF NEW.content_hash IS NOT NULL AND NEW.deleted_at IS NULL THEN
+            UPDATE stored_files SET ref_count = ref_count + 1, updated_at = now()
+            WHERE course_id = NEW.course_id AND content_hash = NEW.content_hash;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER assets_stored_file_ref_count_trigger AFTER INSERT OR DELETE ON assets
+    FOR EACH ROW EXECUTE FUNCTION update_stored_file_ref_count();
+CREATE TRIGGER assets_stored_file_ref_count_update_trigger AFTER UPDATE OF content_hash, course_id, deleted_at ON assets
+    FOR EACH ROW
+    WHEN (
+        OLD.content_hash IS DISTINCT FROM NEW.content_hash OR OLD.course_id IS DISTINCT FROM NEW.course_id
+        OR (OLD.deleted_at IS NULL) <> (NEW.deleted_at IS NULL)
+    )
+    EXECUTE FUNCTION update_stored_file_ref_count();
+
+-- Whiteboards hand out z-indexes for new elements from next_z_index. Elements inserted with z-indexes of their own (say, by
+-- a remix) move the counter past them.
+CREATE FUNCTION update_whiteboard_next_z_index() RETURNS trigger AS $$
+BEGIN
+    UPDATE whiteboards w SET next_z_index = e.max_z_index + 1
+    FROM (SELECT whiteboard_id, max(z_index) AS max_z_index FROM inserted_elements GROUP BY whiteboard_id) e
+    WHERE w.id = e.whiteboard_id AND w.next_z_index <= e.max_z_index;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER whiteboard_elements_next_z_index_trigger AFTER INSERT ON whiteboard_elements
+    REFERENCING NEW TABLE AS inserted_elements
+    FOR EACH STATEMENT EXECUTE FUNCTION update_whiteboard_next_z_index();
+
+--
+
 ALTER TABLE ONLY activities
     ADD CONSTRAINT activities_actor_id_fkey FOREIGN KEY (actor_id) REFERENCES users(id) ON UPDATE CASCADE ON DELETE SET NULL;
 ALTER TABLE ONLY activities
@@ -523,12 +774,16 @@ ALTER TABLE ONLY activities
     ADD CONSTRAINT activities_reciprocal_id_fkey FOREIGN KEY (reciprocal_id) REFERENCES activities(id) ON UPDATE CASCADE ON DELETE SET NULL;
 ALTER TABLE ONLY activities
     ADD CONSTRAINT activities_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY activity_counts
+    ADD CONSTRAINT activity_counts_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY activity_types
     ADD CONSTRAINT activity_types_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY asset_categories
     ADD CONSTRAINT asset_categories_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY asset_categories
     ADD CONSTRAINT asset_categories_category_id_fkey FOREIGN KEY (category_id) REFERENCES categories(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY asset_section_visibility
+    ADD CONSTRAINT asset_section_visibility_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY asset_users
     ADD CONSTRAINT asset_users_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY asset_users
@@ -539,8 +794,14 @@ ALTER TABLE ONLY asset_whiteboard_elements
     ADD CONSTRAINT asset_whiteboard_elements_element_asset_id_fkey FOREIGN KEY (element_asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY assets
     ADD CONSTRAINT assets_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY canvas_attachments
+    ADD CONSTRAINT canvas_attachments_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE SET NULL;
+ALTER TABLE ONLY canvas_attachments
+    ADD CONSTRAINT canvas_attachments_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY canvas_poller_api_keys
     ADD CONSTRAINT canvas_poller_api_keys_canvas_api_domain_fkey FOREIGN KEY (canvas_api_domain) REFERENCES canvas(canvas_api_domain) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY canvas_sync_cursors
+    ADD CONSTRAINT canvas_sync_cursors_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY categories
     ADD CONSTRAINT categories_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE SET NULL;
 ALTER TABLE ONLY comments
@@ -557,6 +818,8 @@ ALTER TABLE ONLY course_groups
     ADD CONSTRAINT course_groups_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY courses
     ADD CONSTRAINT courses_canvas_api_domain_fkey FOREIGN KEY (canvas_api_domain) REFERENCES canvas(canvas_api_domain) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE ONLY stored_files
+    ADD CONSTRAINT stored_files_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY users
     ADD CONSTRAINT users_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
 ALTER TABLE ONLY whiteboard_elements
@@ -0,0 +1,47 @@
+BEGIN;
+
+-- Hold off activity writes until the triggers are in place and the backfill is done.
+LOCK TABLE activities IN SHARE ROW EXCLUSIVE MODE;
+
+CREATE TABLE IF NOT EXISTS activity_counts (
+    user_id integer NOT NULL,
+    activity_type enum_activities_type NOT NULL,
+    count integer DEFAULT 0 NOT NULL
+);
+
+ALTER TABLE ONLY activity_counts
+    ADD CONSTRAINT activity_counts_pkey PRIMARY KEY (user_id, activity_type);
+
+ALTER TABLE ONLY activity_counts
+    ADD CONSTRAINT activity_counts_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON UPDATE CASCADE ON DELETE CASCADE;
+
+CREATE OR REPLACE FUNCTION update_activity_counts() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE activity_counts c SET count = c.count - o.count
+        FROM (SELECT user_id, type, COUNT(*) AS count FROM old_activities GROUP BY user_id, type) o
+        WHERE c.user_id = o.user_id AND c.activity_type = o.type;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO activity_counts (user_id, activity_type, count)
+        SELECT user_id, type, COUNT(*) FROM new_activities GROUP BY user_id, type
+        ON CONFLICT (user_id, activity_type) DO UPDATE SET count = activity_counts.count + excluded.count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS activities_delete_counts_trigger ON activities;
+CREATE TRIGGER activities_delete_counts_trigger AFTER DELETE ON activities
+    REFERENCING OLD TABLE AS old_activities FOR EACH STATEMENT EXECUTE FUNCTION update_activity_counts();
+DROP TRIGGER IF EXISTS activities_insert_counts_trigger ON activities;
+CREATE TRIGGER activities_insert_counts_trigger AFTER INSERT ON activities
+    REFERENCING NEW TABLE AS new_activities FOR EACH STATEMENT EXECUTE FUNCTION update_activity_counts();
+DROP TRIGGER IF EXISTS activities_update_counts_trigger ON activities;
+CREATE TRIGGER activities_update_counts_trigger AFTER UPDATE ON activities
+    REFERENCING OLD TABLE AS old_activities NEW TABLE AS new_activities FOR EACH STATEMENT EXECUTE FUNCTION update_activity_counts();
+
+INSERT INTO activity_counts (user_id, activity_type, count)
+    SELECT user_id, type, COUNT(*) FROM activities GROUP BY user_id, type;
+
+COMMIT;
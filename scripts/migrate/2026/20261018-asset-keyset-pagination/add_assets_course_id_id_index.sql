@@ -0,0 +1,5 @@
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS assets_course_id_id_idx ON assets USING btree (course_id, id) WHERE deleted_at IS NULL;
+
+COMMIT;
@@ -0,0 +1,55 @@
+BEGIN;
+
+ALTER TABLE assets ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Asset keyword search runs against a weighted document of title, description, category titles, link URL and comment
+-- bodies, kept current by the triggers below.
+CREATE OR REPLACE FUNCTION asset_search_vector(asset_id integer, title text, description text, url text) RETURNS tsvector AS $$
+BEGIN
+    RETURN setweight(to_tsvector('simple', COALESCE(title, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(description, '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE((
+            SELECT string_agg(c.title, ' ') FROM asset_categories ac JOIN categories c ON c.id = ac.category_id
+            WHERE ac.asset_id = asset_search_vector.asset_id), '')), 'B')
+        || setweight(to_tsvector('simple', regexp_replace(COALESCE(url, ''), '\W+', ' ', 'g')), 'C')
+        || setweight(to_tsvector('simple', COALESCE((
+            SELECT string_agg(c.body, ' ') FROM comments c WHERE c.asset_id = asset_search_vector.asset_id), '')), 'D');
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE OR REPLACE FUNCTION update_asset_search_vector() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'assets' THEN
+        NEW.search_vector := asset_search_vector(NEW.id, NEW.title, NEW.description, NEW.url);
+        RETURN NEW;
+    END IF;
+    IF TG_TABLE_NAME = 'categories' THEN
+        UPDATE assets a SET search_vector = asset_search_vector(a.id, a.title, a.description, a.url)
+        FROM asset_categories ac WHERE ac.category_id = NEW.id AND a.id = ac.asset_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE assets a SET search_vector = asset_search_vector(a.id, a.title, a.description, a.url) WHERE a.id = OLD.asset_id;
+    ELSE
+        UPDATE assets a SET search_vector = asset_search_vector(a.id, a.title, a.description, a.url) WHERE a.id = NEW.asset_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS assets_search_vector_trigger ON assets;
+CREATE TRIGGER assets_search_vector_trigger BEFORE INSERT OR UPDATE OF title, description, url ON assets
+    FOR EACH ROW EXECUTE FUNCTION update_asset_search_vector();
+DROP TRIGGER IF EXISTS asset_categories_search_vector_trigger ON asset_categories;
+CREATE TRIGGER asset_categories_search_vector_trigger AFTER INSERT OR DELETE ON asset_categories
+    FOR EACH ROW EXECUTE FUNCTION update_asset_search_vector();
+DROP TRIGGER IF EXISTS categories_search_vector_trigger ON categories;
+CREATE TRIGGER categories_search_vector_trigger AFTER UPDATE OF title ON categories
+    FOR EACH ROW EXECUTE FUNCTION update_asset_search_vector();
+DROP TRIGGER IF EXISTS comments_search_vector_trigger ON comments;
+CREATE TRIGGER comments_search_vector_trigger AFTER INSERT OR UPDATE OF body OR DELETE ON comments
+    FOR EACH ROW EXECUTE FUNCTION update_asset_search_vector();
+
+UPDATE assets SET search_vector = asset_search_vector(id, title, description, url);
+
+CREATE INDEX IF NOT EXISTS assets_search_vector_idx ON assets USING gin (search_vector);
+
+COMMIT;
@@ -0,0 +1,51 @@
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS asset_section_visibility (
+    asset_id integer NOT NULL,
+    canvas_course_section character varying(255)
+);
+
+ALTER TABLE ONLY asset_section_visibility
+    ADD CONSTRAINT asset_section_visibility_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE CASCADE;
+
+CREATE INDEX IF NOT EXISTS asset_section_visibility_asset_id_canvas_course_section_idx
+    ON asset_section_visibility USING btree (asset_id, canvas_course_section);
+
+-- Which sections may see an asset in a section-protected course: those of its owner, or every section (NULL) if the owner
+-- is not a student. Kept current as assets are created and as roster syncs change users' roles and sections.
+CREATE OR REPLACE FUNCTION update_asset_section_visibility() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM asset_section_visibility v USING assets a
+    WHERE v.asset_id = a.id AND (
+        (TG_TABLE_NAME = 'assets' AND a.id = NEW.id) OR (TG_TABLE_NAME = 'users' AND a.created_by = NEW.id)
+    );
+    INSERT INTO asset_section_visibility (asset_id, canvas_course_section)
+    SELECT a.id, s.section
+    FROM assets a
+    JOIN users u ON u.id = a.created_by
+    CROSS JOIN LATERAL unnest(
+        CASE WHEN lower(u.canvas_course_role) ~ '(student|learner)' THEN u.canvas_course_sections ELSE ARRAY[NULL]::varchar[] END
+    ) AS s(section)
+    WHERE (TG_TABLE_NAME = 'assets' AND a.id = NEW.id) OR (TG_TABLE_NAME = 'users' AND a.created_by = NEW.id);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS assets_section_visibility_trigger ON assets;
+CREATE TRIGGER assets_section_visibility_trigger AFTER INSERT OR UPDATE OF created_by ON assets
+    FOR EACH ROW EXECUTE FUNCTION update_asset_section_visibility();
+DROP TRIGGER IF EXISTS users_section_visibility_trigger ON users;
+CREATE TRIGGER users_section_visibility_trigger AFTER UPDATE OF canvas_course_role, canvas_course_sections ON users
+    FOR EACH ROW
+    WHEN (OLD.canvas_course_role IS DISTINCT FROM NEW.canvas_course_role OR OLD.canvas_course_sections IS DISTINCT FROM NEW.canvas_course_sections)
+    EXECUTE FUNCTION update_asset_section_visibility();
+
+INSERT INTO asset_section_visibility (asset_id, canvas_course_section)
+    SELECT a.id, s.section
+    FROM assets a
+    JOIN users u ON u.id = a.created_by
+    CROSS JOIN LATERAL unnest(
+        CASE WHEN lower(u.canvas_course_role) ~ '(student|learner)' THEN u.canvas_course_sections ELSE ARRAY[NULL]::varchar[] END
+    ) AS s(section);
+
+COMMIT;
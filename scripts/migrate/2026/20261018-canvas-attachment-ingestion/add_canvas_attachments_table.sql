@@ -0,0 +1,22 @@
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS canvas_attachments (
+    course_id integer NOT NULL,
+    canvas_attachment_id integer NOT NULL,
+    asset_id integer,
+    content_type character varying(255),
+    download_url character varying(255) NOT NULL,
+    size bigint,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY canvas_attachments
+    ADD CONSTRAINT canvas_attachments_pkey PRIMARY KEY (course_id, canvas_attachment_id);
+
+ALTER TABLE ONLY canvas_attachments
+    ADD CONSTRAINT canvas_attachments_asset_id_fkey FOREIGN KEY (asset_id) REFERENCES assets(id) ON UPDATE CASCADE ON DELETE SET NULL;
+ALTER TABLE ONLY canvas_attachments
+    ADD CONSTRAINT canvas_attachments_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
+
+COMMIT;
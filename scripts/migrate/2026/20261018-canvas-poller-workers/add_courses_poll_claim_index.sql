@@ -0,0 +1,6 @@
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS courses_active_canvas_api_domain_last_polled_idx
+    ON courses USING btree (canvas_api_domain, last_polled) WHERE active IS TRUE;
+
+COMMIT;
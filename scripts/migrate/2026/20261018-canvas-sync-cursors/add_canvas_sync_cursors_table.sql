@@ -0,0 +1,18 @@
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS canvas_sync_cursors (
+    course_id integer NOT NULL,
+    resource character varying(255) NOT NULL,
+    etags character varying(255)[],
+    last_synced_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY canvas_sync_cursors
+    ADD CONSTRAINT canvas_sync_cursors_pkey PRIMARY KEY (course_id, resource);
+
+ALTER TABLE ONLY canvas_sync_cursors
+    ADD CONSTRAINT canvas_sync_cursors_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
+
+COMMIT;
@@ -0,0 +1,5 @@
+BEGIN;
+
+ALTER TABLE course_groups ADD COLUMN IF NOT EXISTS membership_hash character varying(64);
+
+COMMIT;
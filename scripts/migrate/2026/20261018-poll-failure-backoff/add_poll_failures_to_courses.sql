@@ -0,0 +1,5 @@
+BEGIN;
+
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS poll_failures integer DEFAULT 0 NOT NULL;
+
+COMMIT;
@@ -0,0 +1,12 @@
+BEGIN;
+
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS last_launched_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS next_due_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS next_poll_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS poll_change_rate double precision DEFAULT 0 NOT NULL;
+ALTER TABLE courses ADD COLUMN IF NOT EXISTS poll_priority double precision DEFAULT 0 NOT NULL;
+
+DROP INDEX IF EXISTS courses_active_canvas_api_domain_last_polled_idx;
+CREATE INDEX IF NOT EXISTS courses_active_canvas_api_domain_next_poll_at_idx ON courses USING btree (canvas_api_domain, next_poll_at) WHERE active IS TRUE;
+
+COMMIT;
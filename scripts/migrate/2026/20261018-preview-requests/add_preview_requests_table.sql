@@ -0,0 +1,30 @@
+BEGIN;
+
+-- Requests to the preview service, written in the same transaction as the asset and sent by the preview dispatcher.
+CREATE TABLE IF NOT EXISTS preview_requests (
+    id integer NOT NULL,
+    object_type character varying(255) NOT NULL,
+    object_id integer NOT NULL,
+    object_url text NOT NULL,
+    attempts integer DEFAULT 0 NOT NULL,
+    last_error text,
+    next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+CREATE SEQUENCE IF NOT EXISTS preview_requests_id_seq
+    START WITH 1
+    INCREMENT BY 1
+    NO MINVALUE
+    NO MAXVALUE
+    CACHE 1;
+ALTER SEQUENCE preview_requests_id_seq OWNED BY preview_requests.id;
+ALTER TABLE ONLY preview_requests ALTER COLUMN id SET DEFAULT nextval('preview_requests_id_seq'::regclass);
+
+ALTER TABLE ONLY preview_requests
+    ADD CONSTRAINT preview_requests_pkey PRIMARY KEY (id);
+
+CREATE INDEX IF NOT EXISTS preview_requests_next_attempt_at_idx ON preview_requests USING btree (next_attempt_at);
+
+COMMIT;
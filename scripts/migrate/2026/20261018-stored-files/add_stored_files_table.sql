@@ -0,0 +1,56 @@
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS stored_files (
+    course_id integer NOT NULL,
+    content_hash character(64) NOT NULL,
+    content_type character varying(255),
+    download_url character varying(255) NOT NULL,
+    ref_count integer DEFAULT 0 NOT NULL,
+    size bigint,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL
+);
+
+ALTER TABLE ONLY stored_files
+    ADD CONSTRAINT stored_files_pkey PRIMARY KEY (course_id, content_hash);
+ALTER TABLE ONLY stored_files
+    ADD CONSTRAINT stored_files_course_id_fkey FOREIGN KEY (course_id) REFERENCES courses(id) ON UPDATE CASCADE ON DELETE CASCADE;
+
+-- Files uploaded before now keep their timestamped S3 keys and are not deduplicated.
+ALTER TABLE assets ADD COLUMN IF NOT EXISTS content_hash character(64);
+ALTER TABLE canvas_attachments ADD COLUMN IF NOT EXISTS content_hash character(64);
+
+CREATE INDEX IF NOT EXISTS assets_course_id_content_hash_idx ON assets USING btree (course_id, content_hash) WHERE content_hash IS NOT NULL;
+
+-- How many live assets refer to each stored file. Its S3 object may be removed only once no asset refers to it.
+CREATE OR REPLACE FUNCTION update_stored_file_ref_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        IF OLD.content_hash IS NOT NULL AND OLD.deleted_at IS NULL THEN
+            UPDATE stored_files SET ref_count = ref_count - 1, updated_at = now()
+            WHERE course_id = OLD.course_id AND content_hash = OLD.content_hash;
+        END IF;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        IF NEW.content_hash IS NOT NULL AND NEW.deleted_at IS NULL THEN
+            UPDATE stored_files SET ref_count = ref_count + 1, updated_at = now()
+            WHERE course_id = NEW.course_id AND content_hash = NEW.content_hash;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS assets_stored_file_ref_count_trigger ON assets;
+CREATE TRIGGER assets_stored_file_ref_count_trigger AFTER INSERT OR DELETE ON assets
+    FOR EACH ROW EXECUTE FUNCTION update_stored_file_ref_count();
+DROP TRIGGER IF EXISTS assets_stored_file_ref_count_update_trigger ON assets;
+CREATE TRIGGER assets_stored_file_ref_count_update_trigger AFTER UPDATE OF content_hash, course_id, deleted_at ON assets
+    FOR EACH ROW
+    WHEN (
+        OLD.content_hash IS DISTINCT FROM NEW.content_hash OR OLD.course_id IS DISTINCT FROM NEW.course_id
+        OR (OLD.deleted_at IS NULL) <> (NEW.deleted_at IS NULL)
+    )
+    EXECUTE FUNCTION update_stored_file_ref_count();
+
+COMMIT;
@@ -0,0 +1,30 @@
+BEGIN;
+
+-- Elements are upserted by uuid within a whiteboard. Should a uuid have been saved twice on one board, keep the latest.
+DELETE FROM whiteboard_elements e USING whiteboard_elements newer
+WHERE e.whiteboard_id = newer.whiteboard_id AND e.uuid = newer.uuid AND e.id < newer.id;
+
+DROP INDEX IF EXISTS whiteboard_elements_created_at_uuid_whiteboard_id_idx;
+CREATE UNIQUE INDEX IF NOT EXISTS whiteboard_elements_whiteboard_id_uuid_idx ON whiteboard_elements USING btree (whiteboard_id, uuid);
+
+ALTER TABLE whiteboards ADD COLUMN IF NOT EXISTS next_z_index integer DEFAULT 0 NOT NULL;
+
+UPDATE whiteboards w SET next_z_index = e.max_z_index + 1
+FROM (SELECT whiteboard_id, max(z_index) AS max_z_index FROM whiteboard_elements GROUP BY whiteboard_id) e
+WHERE w.id = e.whiteboard_id;
+
+CREATE OR REPLACE FUNCTION update_whiteboard_next_z_index() RETURNS trigger AS $$
+BEGIN
+    UPDATE whiteboards w SET next_z_index = e.max_z_index + 1
+    FROM (SELECT whiteboard_id, max(z_index) AS max_z_index FROM inserted_elements GROUP BY whiteboard_id) e
+    WHERE w.id = e.whiteboard_id AND w.next_z_index <= e.max_z_index;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS whiteboard_elements_next_z_index_trigger ON whiteboard_elements;
+CREATE TRIGGER whiteboard_elements_next_z_index_trigger AFTER INSERT ON whiteboard_elements
+    REFERENCING NEW TABLE AS inserted_elements
+    FOR EACH STATEMENT EXECUTE FUNCTION update_whiteboard_next_z_index();
+
+COMMIT;
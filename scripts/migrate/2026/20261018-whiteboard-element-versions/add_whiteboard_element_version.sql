@@ -0,0 +1,6 @@
+BEGIN;
+
+-- Bumped on every change to an element. Clients patch an element from a given version.
+ALTER TABLE whiteboard_elements ADD COLUMN IF NOT EXISTS version integer DEFAULT 1 NOT NULL;
+
+COMMIT;
@@ -57,11 +57,11 @@ def std_commit(allow_test_environment=False):
             db.session.close()
 
 
-def mock_open_file(path_to_file):
+def mock_open_file(path_to_file, mode='r'):
     @decorator
     def _open_file(func, *args, **kw):
         if app.config['SQUIGGY_ENV'] == 'test':
-            return open(f'{_get_fixtures_path()}/{path_to_file}', 'r')
+            return open(f'{_get_fixtures_path()}/{path_to_file}', mode)
         else:
             return func(*args, **kw)
     return _open_file
@@ -28,19 +28,17 @@ from urllib.parse import urljoin, urlparse
 
 from flask import abort, current_app as app, redirect, request
 from flask_login import current_user, login_user
-from flask_socketio import emit
 from squiggy.lib.errors import BadRequestError, UnauthorizedRequestError
 from squiggy.lib.http import tolerant_jsonify
-from squiggy.lib.util import is_admin, is_teaching, safe_strip
-from squiggy.lib.whiteboard_housekeeping import WhiteboardHousekeeping
+from squiggy.lib.util import safe_strip
+from squiggy.lib.whiteboard_broadcasts import queue_whiteboard_element_broadcast
+from squiggy.lib.whiteboard_edits import buffer_whiteboard_elements, save_whiteboard_elements
 from squiggy.logger import logger
-from squiggy.models.activity import Activity
 from squiggy.models.activity_type import activities_type
 from squiggy.models.asset import Asset, assets_type
 from squiggy.models.canvas import Canvas
 from squiggy.models.user import User
 from squiggy.models.whiteboard import Whiteboard
-from squiggy.models.whiteboard_element import WhiteboardElement
 from squiggy.models.whiteboard_session import WhiteboardSession
 
 SOCKET_IO_NAMESPACE = '/'
@@ -92,12 +90,9 @@ def can_current_user_view_asset(asset):
         return True
     if current_user.course_id != asset.course_id:
         return False
-    if current_user.protect_assets_per_section:
-        asset_owner = User.find_by_id(asset.created_by)
-        if not (is_teaching(asset_owner) or is_admin(asset_owner)):
-            user_sections = current_user.canvas_course_sections
-            if len(list(set(user_sections) & set(asset_owner.canvas_course_sections))) == 0:
-                return False
+    if current_user.protect_assets_per_section and current_user.id != asset.created_by:
+        if not asset.is_visible_to_sections(current_user.canvas_course_sections):
+            return False
     return asset.visible or (asset.id in current_user.asset_ids)
 
 
@@ -144,48 +139,65 @@ def start_login_session(login_session, redirect_path=None, tool_id=None):
         return tolerant_jsonify({'message': f'User {login_session.user_id} failed to authenticate.'}, 403)
 
 
-def upsert_whiteboard_elements(socket_id, whiteboard_elements, whiteboard_id):
+def upsert_whiteboard_elements(socket_id, whiteboard_elements, whiteboard_id, buffered=False):
+    # Buffered upserts, i.e., those from socket.io, are saved by the whiteboard edit buffer. They may patch an element:
+    # {'patch': {...}, 'uuid': ..., 'version': ...} carries the properties changed since the version given. The room gets
+    # the patch, or the full element if the sender's version was out of date; the sender gets new versions.
     if not Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
         raise UnauthorizedRequestError('Unauthorized')
     if not socket_id:
         raise BadRequestError('socket_id is required')
 
-    queue_for_preview_image = False
-    results = []
+    upserts = []
     for whiteboard_element in whiteboard_elements:
+        if whiteboard_element and 'patch' in whiteboard_element:
+            if not buffered:
+                raise BadRequestError('Whiteboard element patches are accepted over socket.io only.')
+            patch = _validate_fabricjs_element_patch(whiteboard_element)
+            if patch:
+                upserts.append({
+                    'course_id': current_user.course_id,
+                    'from_version': whiteboard_element.get('version'),
+                    'patch': patch,
+                    'user_id': current_user.id,
+                    'uuid': whiteboard_element['uuid'],
+                })
+            continue
         element = whiteboard_element.get('element') if whiteboard_element else None
         ignore = not element or (element.get('type') in ['i-text', 'textbox'] and not element.get('text', '').strip())
         if ignore:
             continue
-        queue_for_preview_image = True
-        if WhiteboardElement.get_id_per_uuid(whiteboard_element.get('uuid')):
-            upserted = _update_whiteboard_element(
-                whiteboard_element=whiteboard_element,
-                whiteboard_id=whiteboard_id,
-            )
-        else:
-            z_indexes = [w.z_index for w in WhiteboardElement.find_by_whiteboard_id(whiteboard_id)]
-            next_available_z_index = max(z_indexes) + 1 if z_indexes else 0
-            upserted = _create_whiteboard_element(
-                asset_id=whiteboard_element.get('assetId'),
-                element=element,
-                whiteboard_id=whiteboard_id,
-                z_index=next_available_z_index,
-            )
-            next_available_z_index += 1
-        results.append(upserted)
-    if queue_for_preview_image:
-        WhiteboardHousekeeping.queue_for_preview_image(whiteboard_id)
+        _validate_fabricjs_element(element, True)
+        upserts.append({
+            'asset_id': whiteboard_element.get('assetId'),
+            'course_id': current_user.course_id,
+            'element': element,
+            'user_id': current_user.id,
+            'uuid': element['uuid'],
+        })
+    # Buffered edits are saved later, when the client can no longer be told of a bad asset.
+    _validate_whiteboard_element_assets(upserts)
+    if buffered:
+        results = buffer_whiteboard_elements(
+            whiteboard_elements=upserts,
+            whiteboard_id=whiteboard_id,
+            socket_id=socket_id,
+            user_id=current_user.id,
+        )
+        results = [r for r in results if r]
+        whiteboard_elements = _get_whiteboard_element_broadcast(whiteboard_elements, results)
+    else:
+        results = save_whiteboard_elements(whiteboard_elements=upserts, whiteboard_id=whiteboard_id) if upserts else []
     if not app.config['TESTING']:
         logger.info(f'socketio: Emit upsert_whiteboard_elements where whiteboard_id = {whiteboard_id} AND socket_id = {socket_id}')
-        emit(
-            'upsert_whiteboard_elements',
-            whiteboard_elements,
-            include_self=False,
+        queue_whiteboard_element_broadcast(
+            whiteboard_elements=whiteboard_elements,
             namespace=SOCKET_IO_NAMESPACE,
-            skip_sid=socket_id,
-            to=get_socket_io_room(whiteboard_id),
+            room=get_socket_io_room(whiteboard_id),
+            socket_id=socket_id,
         )
+    if buffered:
+        return [_to_whiteboard_element_api_json(result) for result in results]
     WhiteboardSession.update_updated_at(
         socket_id=socket_id,
         user_id=current_user.id,
@@ -194,48 +206,6 @@ def upsert_whiteboard_elements(socket_id, whiteboard_elements, whiteboard_id):
     return results
 
 
-def _create_whiteboard_element(
-    asset_id,
-    element,
-    whiteboard_id,
-    z_index,
-):
-    _validate_fabricjs_element(element)
-    whiteboard_element = WhiteboardElement.create(
-        asset_id=asset_id,
-        element=element,
-        uuid=element['uuid'],
-        whiteboard_id=whiteboard_id,
-        z_index=z_index,
-    )
-    if asset_id:
-        asset = Asset.find_by_id(asset_id)
-        if asset:
-            user_id = current_user.id
-            if user_id not in [user.id for user in asset.users]:
-                course_id = current_user.course_id
-                whiteboard_activity = Activity.create(
-                    activity_type='whiteboard_add_asset',
-                    course_id=course_id,
-                    user_id=user_id,
-                    object_type='whiteboard',
-                    object_id=whiteboard_id,
-                    asset_id=asset.id,
-                )
-                for asset_user in asset.users:
-                    Activity.create(
-                        activity_type='get_whiteboard_add_asset',
-                        course_id=course_id,
-                        user_id=asset_user.id,
-                        object_type='whiteboard',
-                        object_id=whiteboard_id,
-                        asset_id=asset.id,
-                        actor_id=user_id,
-                        reciprocal_id=whiteboard_activity.id,
-                    )
-    return whiteboard_element.to_api_json()
-
-
 def _is_safe_url(target):
     # Check if the URL is safe for redirects.
     # See http://flask.pocoo.org/snippets/62/ for an example.
@@ -244,21 +214,50 @@ def _is_safe_url(target):
     return test_url.scheme in ('http', 'https') and ref_url.netloc == test_url.netloc
 
 
-def _update_whiteboard_element(whiteboard_element, whiteboard_id):
-    if not whiteboard_element:
-        raise BadRequestError('Element required')
-
-    element = whiteboard_element['element']
-    _validate_fabricjs_element(element, True)
-
-    result = WhiteboardElement.update(
-        asset_id=whiteboard_element.get('assetId'),
-        element=element,
-        uuid=element['uuid'],
-        whiteboard_id=whiteboard_id,
-    )
-    if result:
-        return result.to_api_json()
+def _get_whiteboard_element_broadcast(whiteboard_elements, results):
+    results_by_uuid = {result['uuid']: result for result in results}
+    broadcast = []
+    for whiteboard_element in whiteboard_elements:
+        uuid = (whiteboard_element or {}).get('uuid') or ((whiteboard_element or {}).get('element') or {}).get('uuid')
+        result = results_by_uuid.get(uuid)
+        if not result:
+            # Patches to elements not on the whiteboard go no further; ignored elements go out as they came.
+            if whiteboard_element and 'patch' not in whiteboard_element:
+                broadcast.append(whiteboard_element)
+        elif 'element' in result:
+            broadcast.append(_to_whiteboard_element_api_json(result))
+        elif 'patch' in whiteboard_element:
+            broadcast.append({'patch': whiteboard_element['patch'], 'uuid': uuid, 'version': result['version']})
+        else:
+            broadcast.append({**whiteboard_element, 'version': result['version']})
+    return broadcast
+
+
+def _to_whiteboard_element_api_json(result):
+    api_json = {'uuid': result['uuid'], 'version': result['version']}
+    if 'element' in result:
+        api_json.update({'assetId': result['asset_id'], 'element': result['element']})
+    return api_json
+
+
+def _validate_whiteboard_element_assets(whiteboard_elements):
+    asset_ids = {w['asset_id'] for w in whiteboard_elements if w.get('asset_id')}
+    if asset_ids:
+        found_ids = {asset.id for asset in Asset.query.filter(Asset.id.in_(asset_ids), Asset.course_id == current_user.course_id).all()}
+        if asset_ids - found_ids:
+            raise BadRequestError(f'No asset found with id: {sorted(asset_ids - found_ids)[0]}')
+
+
+def _validate_fabricjs_element_patch(whiteboard_element):
+    patch = whiteboard_element.get('patch')
+    if not isinstance(patch, dict) or not whiteboard_element.get('uuid'):
+        raise BadRequestError('patch and uuid are required when patching a whiteboard_element.')
+    if 'type' in patch:
+        raise BadRequestError('The type of a whiteboard_element cannot be patched.')
+    if 'text' in patch and not safe_strip(patch['text']):
+        # As with full elements, empty text is not saved.
+        return None
+    return {k: v for k, v in patch.items() if k != 'uuid'}
 
 
 def _validate_fabricjs_element(element, is_update=False):
@@ -26,16 +26,17 @@ ENHANCEMENTS, OR MODIFICATIONS.
 import json
 import re
 
-from flask import current_app as app, request, Response
+from flask import current_app as app, redirect, request, Response
 from flask_login import current_user, login_required
+import requests
 from squiggy.api.api_util import can_current_user_update_asset, can_current_user_view_asset
-from squiggy.lib.aws import stream_object, upload_to_s3
+from squiggy.lib.aws import get_s3_object, get_s3_presigned_download_url
 from squiggy.lib.errors import BadRequestError, ResourceNotFoundError
-from squiggy.lib.http import retrieve_to_file, tolerant_jsonify
-from squiggy.lib.previews import get_s3_key_prefix
+from squiggy.lib.http import open_url_stream, tolerant_jsonify
 from squiggy.lib.util import local_now, to_bool_or_none
 from squiggy.models.asset import Asset, validate_asset_url
 from squiggy.models.category import Category
+from squiggy.models.stored_file import StoredFile
 from squiggy.models.user import User
 
 
@@ -43,18 +44,27 @@ from squiggy.models.user import User
 @login_required
 def download(asset_id):
     asset = Asset.find_by_id(asset_id)
-    s3_url = asset.download_url
+    s3_url = asset and asset.download_url
     if asset and s3_url and can_current_user_view_asset(asset=asset):
-        stream = stream_object(s3_url)
-        if stream:
-            now = local_now().strftime('%Y-%m-%d_%H-%M-%S')
-            name = re.sub(r'[^a-zA-Z0-9]', '_', asset.title)
-            extension = s3_url.rsplit('.', 1)[-1]
+        now = local_now().strftime('%Y-%m-%d_%H-%M-%S')
+        name = re.sub(r'[^a-zA-Z0-9]', '_', asset.title)
+        extension = s3_url.rsplit('.', 1)[-1]
+        filename = f'{name}_{now}.{extension}'
+        if app.config['ASSET_DOWNLOAD_MODE'] == 'redirect':
+            return redirect(get_s3_presigned_download_url(s3_url, filename))
+        s3_object = get_s3_object(
+            s3_url,
+            byte_range=request.headers.get('Range'),
+            if_none_match=request.headers.get('If-None-Match'),
+        )
+        if s3_object:
             return Response(
-                stream,
+                s3_object['body'],
                 headers={
-                    'Content-disposition': f'attachment; filename="{name}_{now}.{extension}"',
+                    **s3_object['headers'],
+                    'Content-disposition': f'attachment; filename="{filename}"',
                 },
+                status=s3_object['status'],
             )
     raise ResourceNotFoundError(f'Asset {asset_id} not found.')
 
@@ -76,6 +86,7 @@ def get_asset(asset_id):
 def get_assets():
     params = request.get_json()
     order_by = _get(params, 'orderBy', 'recent')
+    cursor = params.get('cursor')
     offset = params.get('offset')
     limit = params.get('limit')
     filters = {
@@ -88,6 +99,7 @@ def get_assets():
     }
     results = Asset.get_assets(
         current_user=current_user,
+        cursor=cursor,
         filters=filters,
         limit=limit,
         offset=offset,
@@ -121,24 +133,27 @@ def create_asset():
     if not current_user.course_id:
         raise BadRequestError('Course data not found')
 
-    s3_attrs = {}
+    stored_file = None
     if asset_type == 'file':
+        # The file is spooled and hashed as it arrives, and goes to S3 only if the course does not have it already.
+        max_bytes = app.config['ASSET_UPLOAD_MAX_BYTES']
         if from_bookmarklet:
-            file = retrieve_to_file(url)
             name = url.rsplit('/', 1)[-1]
             for char in ['?', '#']:
                 name = name.split(char)[0]
-            file_upload = {
-                'name': name,
-                'byte_stream': file.read(),
-            }
+            try:
+                with open_url_stream(url) as stream:
+                    stored_file, _ = StoredFile.store(course_id=current_user.course_id, filename=name, stream=stream, max_bytes=max_bytes)
+            except requests.RequestException as e:
+                raise BadRequestError(f'Could not retrieve file: {e}')
         else:
             file_upload = _get_upload_from_http_post()
-        s3_attrs = upload_to_s3(
-            filename=file_upload['name'],
-            byte_stream=file_upload['byte_stream'],
-            s3_key_prefix=get_s3_key_prefix(current_user.course_id, 'asset'),
-        )
+            stored_file, _ = StoredFile.store(
+                course_id=current_user.course_id,
+                filename=file_upload['name'],
+                stream=file_upload['stream'],
+                max_bytes=max_bytes,
+            )
 
     asset = Asset.create(
         asset_type=asset_type,
@@ -146,8 +161,9 @@ def create_asset():
         course_id=current_user.course_id,
         created_by=current_user.user_id,
         description=description,
-        download_url=s3_attrs.get('download_url', None),
-        mime=s3_attrs.get('content_type', None),
+        content_hash=stored_file and stored_file.content_hash,
+        download_url=stored_file and stored_file.download_url,
+        mime=stored_file and stored_file.content_type,
         source=source,
         title=title,
         url=url,
@@ -257,5 +273,5 @@ def _get_upload_from_http_post():
 
     return {
         'name': filename.rsplit('/', 1)[-1],
-        'byte_stream': file.read(),
+        'stream': file.stream,
     }
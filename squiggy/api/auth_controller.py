@@ -215,6 +215,7 @@ def _lti_launch_authentication(tool_id):
                 whiteboards_url=external_tool_url if is_whiteboards else None,
             )
             logger.info(f'Created course via LTI launch: {course.to_api_json()}')
+        Course.record_launch(course.id, poll_within_seconds=app.config['CANVAS_POLLER_MIN_INTERVAL_MINUTES'] * 60)
 
         canvas_user_id = lti_params['custom_canvas_user_id']
         user = User.find_by_course_id(canvas_user_id=canvas_user_id, course_id=course.id)
@@ -25,8 +25,9 @@ ENHANCEMENTS, OR MODIFICATIONS.
 
 from flask import current_app as app, request
 from flask_login import current_user, login_required
-from squiggy.api.api_util import teacher_required
+from squiggy.api.api_util import admin_required, teacher_required
 from squiggy.lib.http import tolerant_jsonify
+from squiggy.lib.util import to_int
 from squiggy.models.course import Course
 
 
@@ -44,6 +45,14 @@ def is_active():
     return tolerant_jsonify(Course.is_active(current_user.course_id))
 
 
+@app.route('/api/courses/poll_queue')
+@admin_required
+def get_poll_queue():
+    canvas_api_domain = request.args.get('canvasApiDomain')
+    limit = to_int(request.args.get('limit')) or 100
+    return tolerant_jsonify(Course.get_poll_queue(canvas_api_domain=canvas_api_domain, limit=limit))
+
+
 @app.route('/api/course/<course_id>/advanced_asset_search_options')
 @login_required
 def get_advanced_asset_search_options(course_id):
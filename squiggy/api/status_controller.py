@@ -29,10 +29,13 @@ import pytz
 import redis
 from sqlalchemy.exc import SQLAlchemyError
 from squiggy import db
+from squiggy.lib.aws import get_s3_metrics
 from squiggy.lib.http import tolerant_jsonify
+from squiggy.lib.preview_dispatcher import get_preview_dispatcher_metrics
 from squiggy.lib.previews import ping_preview_service
 from squiggy.lib.socket_io_util import get_queue_url
 from squiggy.lib.util import utc_now
+from squiggy.lib.whiteboard_broadcasts import get_whiteboard_broadcast_metrics
 from squiggy.logger import logger
 
 
@@ -43,7 +46,10 @@ def app_status():
         'cache': _cache_status(),
         'db': _db_status(),
         'poller': _poller_status(),
+        'previewQueue': _preview_queue_status(),
         'previewService': _preview_service_status(),
+        's3': get_s3_metrics(),
+        'whiteboardBroadcasts': get_whiteboard_broadcast_metrics(),
         'whiteboards': _whiteboard_housekeeping_status(),
     }
     return tolerant_jsonify(resp)
@@ -95,6 +101,14 @@ def _poller_status():
         return None
 
 
+def _preview_queue_status():
+    try:
+        return get_preview_dispatcher_metrics()
+    except SQLAlchemyError:
+        logger.exception('Database connection error')
+        return None
+
+
 def _preview_service_status():
     return ping_preview_service()
 
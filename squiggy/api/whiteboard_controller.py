@@ -33,6 +33,7 @@ from squiggy.lib.errors import BadRequestError, ResourceNotFoundError
 from squiggy.lib.file_remover import file_remover
 from squiggy.lib.http import tolerant_jsonify
 from squiggy.lib.util import isoformat, local_now
+from squiggy.lib.whiteboard_edits import flush_whiteboard_edits
 from squiggy.lib.whiteboard_housekeeping import WhiteboardHousekeeping
 from squiggy.lib.whiteboard_util import to_png_file
 from squiggy.logger import logger
@@ -49,6 +50,9 @@ from squiggy.models.whiteboard_session import WhiteboardSession
 @login_required
 def get_whiteboard(whiteboard_id):
     if Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
+        # Whoever opens the whiteboard sees edits not yet saved by this process's whiteboard edit buffer. Those buffered by
+        # other workers are saved within WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS.
+        flush_whiteboard_edits()
         whiteboard = Whiteboard.find_by_id(current_user=current_user, whiteboard_id=whiteboard_id)
         return tolerant_jsonify(whiteboard)
     else:
@@ -85,6 +89,7 @@ def remix_whiteboard():
 @app.route('/api/whiteboard/<whiteboard_id>/export/asset', methods=['POST'])
 @login_required
 def export_as_asset(whiteboard_id):
+    flush_whiteboard_edits()
     whiteboard = Whiteboard.find_by_id(
         current_user=current_user,
         whiteboard_id=whiteboard_id,
@@ -129,6 +134,7 @@ def export_as_asset(whiteboard_id):
 @app.route('/api/whiteboard/<whiteboard_id>/download/png')
 @login_required
 def export_as_png(whiteboard_id):
+    flush_whiteboard_edits()
     whiteboard = Whiteboard.find_by_id(
         current_user=current_user,
         whiteboard_id=whiteboard_id,
@@ -29,6 +29,8 @@ from flask_socketio import emit
 from squiggy.api.api_util import get_socket_io_room, upsert_whiteboard_elements
 from squiggy.lib.errors import BadRequestError, UnauthorizedRequestError
 from squiggy.lib.http import tolerant_jsonify
+from squiggy.lib.whiteboard_broadcasts import discard_whiteboard_element_broadcasts
+from squiggy.lib.whiteboard_edits import flush_whiteboard_edits
 from squiggy.lib.whiteboard_housekeeping import WhiteboardHousekeeping
 from squiggy.logger import logger
 from squiggy.models.asset_whiteboard_element import AssetWhiteboardElement
@@ -55,7 +57,8 @@ def order_whiteboard_elements():
     if len(uuids or []) == 0:
         raise BadRequestError('uuids required')
 
-    # Order the whiteboard_elements
+    # Order the whiteboard_elements, including any new ones still in the whiteboard edit buffer.
+    flush_whiteboard_edits()
     WhiteboardElement.update_z_indexes(
         direction=direction,
         uuids=uuids,
@@ -111,6 +114,8 @@ def delete_whiteboard_elements():
     if not Whiteboard.can_update_whiteboard(current_user=current_user, whiteboard_id=whiteboard_id):
         raise UnauthorizedRequestError('Unauthorized')
 
+    # Buffered edits are saved first, lest a flush bring deleted elements back.
+    flush_whiteboard_edits()
     whiteboard_elements = WhiteboardElement.find_all(uuids=uuids, whiteboard_id=whiteboard_id)
     if len(whiteboard_elements):
         logger.info(f'socketio: Emit delete_whiteboard_elements where whiteboard_id = {whiteboard_id}')
@@ -121,6 +126,7 @@ def delete_whiteboard_elements():
                     uuid=whiteboard_element.uuid,
                 )
         if not app.config['TESTING']:
+            discard_whiteboard_element_broadcasts(namespace=SOCKET_IO_NAMESPACE, room=get_socket_io_room(whiteboard_id), uuids=uuids)
             emit(
                 'delete_whiteboard_elements',
                 uuids,
@@ -23,8 +23,219 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import random
+import re
+from threading import Condition, current_thread, local, Lock
+from time import sleep
+from urllib.parse import parse_qsl, urlencode, urlparse
+
 from canvasapi import Canvas
+from canvasapi.exceptions import RateLimitExceeded
+from canvasapi.requester import Requester
+from canvasapi.util import combine_kwargs
+from flask import current_app as app
+import requests
+from requests.adapters import HTTPAdapter
+from squiggy.externals.canvas_cache import get_response_cache
+
+
+_clients_lock = Lock()
+_sessions_by_domain = {}
+_throttles_by_domain = {}
 
 
 def get_canvas(api_url, access_token):
-    return Canvas(base_url=api_url, access_token=access_token)
+    return PooledCanvas(base_url=api_url, access_token=access_token)
+
+
+def fan_out(fn, items):
+    """Call fn on each item concurrently and return the results in order. Concurrency is bounded by the Canvas throttle.
+
+    Worker threads are named after the calling thread so that their log output lands in the same place.
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [fn(item) for item in items]
+    max_workers = min(len(items), app.config['CANVAS_API_MAX_CONCURRENCY'])
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'{current_thread().name}.fetch') as executor:
+        return list(executor.map(fn, items))
+
+
+class CanvasThrottle:
+    """Limit concurrent requests to a Canvas domain, backing off as the X-Rate-Limit-Remaining quota runs low.
+
+    Concurrency grows by one request per healthy response and halves whenever the remaining quota drops below threshold.
+    """
+
+    def __init__(self, max_concurrency, rate_limit_threshold):
+        self.condition = Condition()
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.max_concurrency = max_concurrency
+        self.rate_limit_threshold = rate_limit_threshold
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= int(self.concurrency):
+                self.condition.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *args):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def back_off(self):
+        with self.condition:
+            self.concurrency = max(1, self.concurrency / 2)
+
+    def update(self, rate_limit_remaining):
+        try:
+            rate_limit_remaining = float(rate_limit_remaining)
+        except (TypeError, ValueError):
+            return
+        if rate_limit_remaining < self.rate_limit_threshold:
+            self.back_off()
+        else:
+            with self.condition:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                self.condition.notify_all()
+
+
+class PooledCanvas(Canvas):
+    """Canvas client whose requester shares a pooled, throttled HTTP session with all other clients of the same domain.
+
+    canvasapi offers no way to pass in a requester: Canvas methods read the private attribute that its constructor sets.
+    Here that attribute is a property, and the plain Requester handed to it is replaced by a PooledRequester.
+    """
+
+    def __init__(self, base_url, access_token):
+        self.requester = None
+        super().__init__(base_url, access_token)
+
+    def _get_requester(self):
+        return self.requester
+
+    def _set_requester(self, requester):
+        # Canvas.__init__ has validated and tidied the URL and token by now.
+        self.requester = PooledRequester(requester.original_url, requester.access_token)
+
+    _Canvas__requester = property(_get_requester, _set_requester)
+
+
+class PooledRequester(Requester):
+
+    def __init__(self, base_url, access_token):
+        self._thread_local = local()
+        super().__init__(base_url, access_token)
+        self.canvas_api_domain = urlparse(base_url).hostname
+        self._session = _get_session(self.canvas_api_domain)
+        self.response_cache = get_response_cache()
+        self.throttle = _get_throttle(self.canvas_api_domain)
+        self.rate_limit_backoff_seconds = app.config['CANVAS_API_RATE_LIMIT_BACKOFF_SECONDS']
+        self.rate_limit_retries = app.config['CANVAS_API_RATE_LIMIT_RETRIES']
+
+    def request(self, method, endpoint=None, headers=None, _kwargs=None, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                with self.throttle:
+                    # The parent request method modifies headers and _kwargs in place, so each attempt gets fresh copies.
+                    response = super().request(method, endpoint, headers=dict(headers or {}), _kwargs=list(_kwargs or []), **kwargs)
+            except RateLimitExceeded:
+                self.throttle.back_off()
+                if attempt >= self.rate_limit_retries:
+                    raise
+                sleep(self.rate_limit_backoff_seconds * (2 ** attempt) * random.uniform(1, 1.5))
+                attempt += 1
+                continue
+            self.throttle.update(response.headers.get('X-Rate-Limit-Remaining'))
+            return response
+
+    @property
+    def _cache(self):
+        # canvasapi keeps its last few responses in an unsynchronized list. Requests on fan_out threads share this
+        # requester, so each thread keeps a list of its own.
+        if not hasattr(self._thread_local, 'cache'):
+            self._thread_local.cache = []
+        return self._thread_local.cache
+
+    @_cache.setter
+    def _cache(self, cache):
+        self._thread_local.cache = cache
+
+    def _get_request(self, url, headers, params=None, **kwargs):
+        # Callers that send their own conditional headers (see get_paginated_if_changed) track changes themselves.
+        if self.response_cache and self.response_cache.is_cacheable(url) and 'If-None-Match' not in headers:
+            return self.response_cache.get(self._session, url, headers, params, self.canvas_api_domain)
+        return super()._get_request(url, headers, params=params, **kwargs)
+
+
+def get_paginated_if_changed(requester, content_class, endpoint, etags=None, extra_attribs=None, **kwargs):
+    """Fetch every page of a Canvas list endpoint, unless all pages match the ETags of a previous fetch.
+
+    Returns a tuple of (objects, etags). If Canvas answers '304 Not Modified' for every page then objects is None.
+    """
+    responses = _get_pages(requester, endpoint, etags or [], **kwargs)
+    if etags and len(responses) == len(etags) and all(r.status_code == 304 for r in responses):
+        return None, etags
+    if any(r.status_code == 304 for r in responses):
+        # Only some pages changed. We have no copy of unchanged pages, so fetch all of them.
+        responses = _get_pages(requester, endpoint, [], **kwargs)
+    objects = []
+    for response in responses:
+        for element in response.json():
+            objects.append(content_class(requester, {**element, **(extra_attribs or {})}))
+    return objects, [r.headers.get('ETag') for r in responses]
+
+
+def _get_pages(requester, endpoint, etags, **kwargs):
+    def _get_page(page_endpoint, page_index, params=None):
+        etag = etags[page_index] if page_index < len(etags) else None
+        headers = {'If-None-Match': etag} if etag else {}
+        return requester.request('GET', page_endpoint, headers=headers, **(params or {}))
+
+    responses = [_get_page(endpoint, 0, params={'_kwargs': combine_kwargs(per_page=100, **kwargs)})]
+    last_link = responses[0].links.get('last')
+    last_page = last_link and dict(parse_qsl(urlparse(last_link['url']).query)).get('page')
+    if last_page and last_page.isdigit():
+        # Numbered pages are known up front and can be fetched concurrently.
+        page_endpoints = [_get_page_endpoint(requester, last_link['url'], page) for page in range(2, int(last_page) + 1)]
+        responses += fan_out(lambda indexed: _get_page(indexed[1], indexed[0]), enumerate(page_endpoints, start=1))
+    else:
+        # Bookmark pagination can only be followed one page at a time.
+        next_link = responses[0].links.get('next')
+        while next_link:
+            responses.append(_get_page(_get_page_endpoint(requester, next_link['url']), len(responses)))
+            next_link = responses[-1].links.get('next')
+    return responses
+
+
+def _get_page_endpoint(requester, url, page=None):
+    if page:
+        parsed_url = urlparse(url)
+        query = [(k, str(page) if k == 'page' else v) for k, v in parse_qsl(parsed_url.query)]
+        url = parsed_url._replace(query=urlencode(query)).geturl()
+    return re.search(f'{re.escape(requester.base_url)}(.*)', url).group(1)
+
+
+def _get_session(canvas_api_domain):
+    with _clients_lock:
+        if canvas_api_domain not in _sessions_by_domain:
+            session = requests.Session()
+            pool_size = app.config['CANVAS_API_MAX_CONCURRENCY']
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+            _sessions_by_domain[canvas_api_domain] = session
+        return _sessions_by_domain[canvas_api_domain]
+
+
+def _get_throttle(canvas_api_domain):
+    with _clients_lock:
+        if canvas_api_domain not in _throttles_by_domain:
+            _throttles_by_domain[canvas_api_domain] = CanvasThrottle(
+                max_concurrency=app.config['CANVAS_API_MAX_CONCURRENCY'],
+                rate_limit_threshold=app.config['CANVAS_API_RATE_LIMIT_THRESHOLD'],
+            )
+        return _throttles_by_domain[canvas_api_domain]
@@ -0,0 +1,214 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+from threading import Lock
+import time
+
+from flask import current_app as app
+import redis
+import requests
+from requests.structures import CaseInsensitiveDict
+from squiggy.lib.socket_io_util import get_queue_url
+from squiggy.logger import logger
+
+
+"""Cache of Canvas API responses that rarely change, revalidated with conditional requests on every use."""
+
+
+CACHED_RESPONSE_HEADERS = ['Content-Type', 'ETag', 'Last-Modified', 'Link']
+DISK_CACHE_PRUNE_INTERVAL_SECONDS = 60 * 60
+
+_caches_lock = Lock()
+_caches_by_backend = {}
+_metrics_by_domain = {}
+
+
+def get_cache_metrics(canvas_api_domain=None):
+    with _caches_lock:
+        if canvas_api_domain:
+            return dict(_metrics_by_domain.get(canvas_api_domain, _new_metrics()))
+        return {domain: dict(metrics) for domain, metrics in _metrics_by_domain.items()}
+
+
+def get_response_cache():
+    backend = app.config['CANVAS_API_CACHE_BACKEND']
+    if not backend:
+        return None
+    with _caches_lock:
+        if backend not in _caches_by_backend:
+            if backend == 'redis':
+                store = RedisCacheStore(app.config['CANVAS_API_CACHE_TTL_SECONDS'])
+            elif backend == 'disk':
+                store = DiskCacheStore(
+                    app.config['CANVAS_API_CACHE_DIR'] or os.path.join(tempfile.gettempdir(), 'squiggy_canvas_api_cache'),
+                    app.config['CANVAS_API_CACHE_TTL_SECONDS'],
+                )
+            else:
+                raise ValueError(f'Unknown CANVAS_API_CACHE_BACKEND: {backend}')
+            _caches_by_backend[backend] = CanvasResponseCache(store, app.config['CANVAS_API_CACHE_ENDPOINTS'])
+        return _caches_by_backend[backend]
+
+
+class CanvasResponseCache:
+
+    def __init__(self, store, endpoint_patterns):
+        self.endpoint_patterns = [re.compile(p) for p in endpoint_patterns]
+        self.store = store
+
+    def is_cacheable(self, url):
+        return any(p.search(url) for p in self.endpoint_patterns)
+
+    def get(self, session, url, headers, params, canvas_api_domain):
+        # Responses depend on the caller's permissions, so the access token is part of the key along with URL and params.
+        key_source = json.dumps([url, sorted((str(k), str(v)) for k, v in (params or [])), headers.get('Authorization')])
+        key = f'{canvas_api_domain}/{hashlib.sha256(key_source.encode()).hexdigest()}'
+        cached = self.store.get(key)
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+        response = session.get(url, headers=headers, params=params)
+
+        if cached and response.status_code == 304:
+            body = base64.b64decode(cached['body'])
+            _increment(canvas_api_domain, hits=1, bytesSaved=len(body))
+            return _to_response(url, cached['headers'], body)
+        _increment(canvas_api_domain, misses=1)
+        if response.status_code == 200 and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+            self.store.put(key, {
+                'body': base64.b64encode(response.content).decode(),
+                'etag': response.headers.get('ETag'),
+                'headers': {h: response.headers[h] for h in CACHED_RESPONSE_HEADERS if h in response.headers},
+                'last_modified': response.headers.get('Last-Modified'),
+            })
+        return response
+
+
+class DiskCacheStore:
+
+    def __init__(self, directory, ttl_seconds):
+        self.directory = directory
+        self.prune_lock = Lock()
+        self.pruned_at = 0
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key):
+        path = os.path.join(self.directory, f'{key}.json')
+        try:
+            # As with Redis, an entry expires its TTL after it was written.
+            if self._is_expired(os.stat(path).st_mtime):
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, value):
+        path = os.path.join(self.directory, f'{key}.json')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so that concurrent readers never see a partial file.
+            with tempfile.NamedTemporaryFile('w', delete=False, dir=os.path.dirname(path), suffix='.tmp') as f:
+                json.dump(value, f)
+            os.replace(f.name, path)
+        except OSError as e:
+            logger.warning(f'Failed to write Canvas API cache entry {path}: {e}')
+        self.prune()
+
+    def prune(self, force=False):
+        # Expired entries, and temp files left by a crashed writer, would otherwise pile up on disk.
+        if not self.ttl_seconds or not self.prune_lock.acquire(blocking=False):
+            return 0
+        try:
+            if not force and time.time() - self.pruned_at < DISK_CACHE_PRUNE_INTERVAL_SECONDS:
+                return 0
+            self.pruned_at = time.time()
+            removed_count = 0
+            for root, _dirs, filenames in os.walk(self.directory):
+                for filename in filenames:
+                    path = os.path.join(root, filename)
+                    try:
+                        if self._is_expired(os.stat(path).st_mtime):
+                            os.remove(path)
+                            removed_count += 1
+                    except OSError as e:
+                        logger.warning(f'Failed to prune Canvas API cache entry {path}: {e}')
+            if removed_count:
+                logger.info(f'Pruned {removed_count} expired Canvas API cache entries from {self.directory}')
+            return removed_count
+        finally:
+            self.prune_lock.release()
+
+    def _is_expired(self, mtime):
+        return bool(self.ttl_seconds) and time.time() - mtime > self.ttl_seconds
+
+
+class RedisCacheStore:
+
+    def __init__(self, ttl_seconds):
+        self.redis = redis.from_url(get_queue_url(app), socket_connect_timeout=1)
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, key):
+        try:
+            value = self.redis.get(f'canvas_api_cache:{key}')
+            return value and json.loads(value)
+        except redis.RedisError as e:
+            logger.warning(f'Failed to read Canvas API cache entry {key}: {e}')
+            return None
+
+    def put(self, key, value):
+        try:
+            self.redis.set(f'canvas_api_cache:{key}', json.dumps(value), ex=self.ttl_seconds)
+        except redis.RedisError as e:
+            logger.warning(f'Failed to write Canvas API cache entry {key}: {e}')
+
+
+def _increment(canvas_api_domain, **kwargs):
+    with _caches_lock:
+        metrics = _metrics_by_domain.setdefault(canvas_api_domain, _new_metrics())
+        for key, value in kwargs.items():
+            metrics[key] += value
+
+
+def _new_metrics():
+    return {'bytesSaved': 0, 'hits': 0, 'misses': 0}
+
+
+def _to_response(url, headers, body):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict(headers)
+    response.url = url
+    response._content = body
+    response.encoding = 'utf-8'
+    return response
@@ -28,8 +28,12 @@ import os
 from flask import Flask
 from squiggy import db
 from squiggy.configs import load_configs
+from squiggy.lib.asset_views import launch_asset_view_aggregator
 from squiggy.lib.canvas_poller import launch_pollers
+from squiggy.lib.preview_dispatcher import launch_preview_dispatcher
 from squiggy.lib.socket_io_util import create_mock_socket, initialize_socket_io
+from squiggy.lib.whiteboard_broadcasts import launch_whiteboard_broadcaster
+from squiggy.lib.whiteboard_edits import launch_whiteboard_edit_flusher
 from squiggy.lib.whiteboard_housekeeping import launch_whiteboard_housekeeping
 from squiggy.logger import initialize_app_logger
 from squiggy.routes import register_routes
@@ -53,5 +57,9 @@ def create_app():
             if app.config['CANVAS_POLLER']:
                 launch_pollers()
             launch_whiteboard_housekeeping()
+            launch_asset_view_aggregator()
+            launch_preview_dispatcher()
+            launch_whiteboard_edit_flusher()
+            launch_whiteboard_broadcaster()
 
     return app, socketio
@@ -0,0 +1,209 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import atexit
+from collections import Counter
+from threading import Lock
+from time import sleep
+
+from flask import current_app as app
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.sql import text
+from squiggy import db
+from squiggy.lib.background_job import BackgroundJob
+from squiggy.lib.util import utc_now
+from squiggy.logger import logger
+from squiggy.models.activity import Activity
+
+
+"""Write-behind buffer of asset views. Opening an asset only records the view in memory; a background thread writes
+views in batches, along with their activities, and increments assets.views rather than recounting."""
+
+
+_lock = Lock()
+_pending_views = []
+_pending_counts = Counter()
+
+
+def buffer_asset_view(asset_id, course_id, user_id):
+    with _lock:
+        _pending_views.append({
+            'asset_id': asset_id,
+            'course_id': course_id,
+            'user_id': user_id,
+            'viewed_at': utc_now(),
+        })
+        _pending_counts[asset_id] += 1
+    if not app.config['ASSET_VIEWS_FLUSH_INTERVAL_SECONDS']:
+        flush_asset_views()
+
+
+def flush_asset_views():
+    with _lock:
+        views = _pending_views.copy()
+        _pending_views.clear()
+    if not views:
+        return 0
+    # Views neither written nor dropped yet. Should the database fail us, these go back in the buffer.
+    unsettled = list(views)
+    requeued = []
+    try:
+        try:
+            _write_views(views)
+            unsettled.clear()
+            return len(views)
+        except (DataError, IntegrityError):
+            # Say, a view of an asset deleted meanwhile. Find the views at fault and drop them, rather than retry forever.
+            db.session.rollback()
+            return _write_views_one_by_one(unsettled)
+    except Exception:
+        db.session.rollback()
+        requeued = _requeue_views(unsettled)
+        raise
+    finally:
+        # Views written, dropped or given up on no longer count toward the asset's views in memory.
+        requeued_ids = {id(v) for v in requeued}
+        _forget_views([v for v in views if id(v) not in requeued_ids])
+
+
+def get_pending_view_count(asset_id):
+    with _lock:
+        return _pending_counts[asset_id]
+
+
+def launch_asset_view_aggregator():
+    AssetViewAggregator().launch()
+
+
+class AssetViewAggregator(BackgroundJob):
+
+    asset_view_aggregator = None
+
+    def __init__(self, **kwargs):
+        super().__init__(thread_name='asset_view_aggregator', **kwargs)
+
+    def launch(self):
+        if not self.asset_view_aggregator and app.config['ASSET_VIEWS_FLUSH_INTERVAL_SECONDS']:
+            logger.info('Launching asset view aggregator')
+            AssetViewAggregator.start()
+            # Views still buffered when the process shuts down are written on the way out.
+            atexit.register(_flush_at_exit, app._get_current_object())
+
+    def run(self):
+        # Every process flushes its own buffer, so there is no advisory lock here.
+        while True:
+            sleep(app.config['ASSET_VIEWS_FLUSH_INTERVAL_SECONDS'])
+            flush_asset_views()
+
+    @classmethod
+    def start(cls):
+        cls.asset_view_aggregator = AssetViewAggregator()
+        cls.asset_view_aggregator.run_async()
+
+
+def _flush_at_exit(flask_app):
+    with flask_app.app_context():
+        try:
+            flush_asset_views()
+        except Exception as e:
+            logger.exception(e)
+
+
+def _forget_views(views):
+    with _lock:
+        _pending_counts.subtract(v['asset_id'] for v in views)
+        for asset_id in [asset_id for asset_id, count in _pending_counts.items() if count <= 0]:
+            del _pending_counts[asset_id]
+
+
+def _requeue_views(views):
+    # Put the views back, ahead of any that arrived meanwhile, for a limited number of further attempts.
+    max_attempts = app.config['ASSET_VIEWS_FLUSH_MAX_ATTEMPTS']
+    requeued = [v for v in views if v.get('attempts', 1) < max_attempts]
+    with _lock:
+        _pending_views[0:0] = [{**v, 'attempts': v.get('attempts', 1) + 1} for v in requeued]
+    if len(requeued) < len(views):
+        logger.error(f'Dropping {len(views) - len(requeued)} asset views after {max_attempts} failed attempts to write them')
+    return requeued
+
+
+def _write_views_one_by_one(unsettled):
+    # Each view leaves the unsettled list once written or dropped, so that an unexpected error leaves the rest to requeue.
+    written_count = 0
+    while unsettled:
+        view = unsettled[0]
+        try:
+            _write_views([view])
+            written_count += 1
+        except (DataError, IntegrityError) as e:
+            db.session.rollback()
+            logger.error(f"Dropping view of asset {view['asset_id']} by user {view['user_id']}: {e}")
+        unsettled.pop(0)
+    return written_count
+
+
+def _write_views(views):
+    asset_ids = list({v['asset_id'] for v in views})
+    owner_ids_by_asset_id = {}
+    sql = 'SELECT asset_id, user_id FROM asset_users WHERE asset_id = ANY(:asset_ids) ORDER BY asset_id, user_id'
+    for row in db.session.execute(text(sql), {'asset_ids': asset_ids}):
+        owner_ids_by_asset_id.setdefault(row['asset_id'], []).append(row['user_id'])
+    with Activity.batch():
+        for view in views:
+            view_activity = Activity.create(
+                activity_type='asset_view',
+                course_id=view['course_id'],
+                user_id=view['user_id'],
+                object_type='asset',
+                object_id=view['asset_id'],
+                asset_id=view['asset_id'],
+                created_at=view['viewed_at'],
+            )
+            for owner_id in owner_ids_by_asset_id.get(view['asset_id'], []):
+                Activity.create(
+                    activity_type='get_asset_view',
+                    course_id=view['course_id'],
+                    user_id=owner_id,
+                    object_type='asset',
+                    object_id=view['asset_id'],
+                    asset_id=view['asset_id'],
+                    actor_id=view['user_id'],
+                    reciprocal_id=view_activity.id,
+                    created_at=view['viewed_at'],
+                )
+        counts = Counter(v['asset_id'] for v in views)
+        sql = """
+            UPDATE assets a SET views = a.views + v.count
+            FROM unnest(CAST(:asset_ids AS integer[]), CAST(:counts AS integer[])) AS v(asset_id, count)
+            WHERE a.id = v.asset_id
+        """
+        db.session.execute(text(sql), {'asset_ids': list(counts.keys()), 'counts': list(counts.values())})
+    # Asset instances already in the session must not hang on to stale counts.
+    from squiggy.models.asset import Asset
+    for asset_id in asset_ids:
+        asset = db.session.identity_map.get(identity_key(Asset, asset_id))
+        if asset:
+            db.session.expire(asset, ['views'])
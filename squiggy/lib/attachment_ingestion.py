@@ -0,0 +1,260 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import os
+from queue import Queue
+import random
+from threading import Lock, Thread
+from time import sleep, time
+
+from flask import current_app as app
+import requests
+from squiggy import db, std_commit
+from squiggy.lib.errors import BadRequestError
+from squiggy.logger import logger
+from squiggy.models.asset import Asset
+from squiggy.models.canvas_attachment import CanvasAttachment
+from squiggy.models.category import Category
+from squiggy.models.stored_file import StoredFile
+from squiggy.models.user import User
+
+
+"""Stream Canvas submission attachments to S3 on a pool of threads, so that one slow file does not stall the poller."""
+
+
+_pipelines_by_domain = {}
+_pipelines_lock = Lock()
+
+
+def get_attachment_pipeline(canvas_api_domain, thread_name_prefix):
+    with _pipelines_lock:
+        if canvas_api_domain not in _pipelines_by_domain:
+            _pipelines_by_domain[canvas_api_domain] = AttachmentIngestionPipeline(
+                canvas_api_domain=canvas_api_domain,
+                thread_name_prefix=thread_name_prefix,
+            )
+        return _pipelines_by_domain[canvas_api_domain]
+
+
+class AttachmentIngestionPipeline:
+
+    def __init__(self, canvas_api_domain, thread_name_prefix):
+        self.app = app._get_current_object()
+        self.canvas_api_domain = canvas_api_domain
+        self.lock = Lock()
+        self.max_attempts = app.config['CANVAS_POLLER_ATTACHMENT_MAX_ATTEMPTS']
+        self.max_bytes = app.config['CANVAS_POLLER_ATTACHMENT_MAX_BYTES']
+        self.retry_seconds = app.config['CANVAS_POLLER_ATTACHMENT_RETRY_SECONDS']
+        # Jobs keyed by (course_id, canvas_attachment_id), from submission until the asset is created. Group submissions share an
+        # attachment: later submitters are added to the pending job rather than queued for a second download.
+        self.pending_jobs = {}
+        self.queue = Queue(maxsize=app.config['CANVAS_POLLER_ATTACHMENT_QUEUE_SIZE'])
+        self.started_at = time()
+        self.metrics = {
+            'bytes': 0,
+            'completed': 0,
+            'deduplicated': 0,
+            'failed': 0,
+            'queued': 0,
+            'retries': 0,
+            'seconds': 0.0,
+            'uploaded': 0,
+        }
+        # Under test, jobs are processed inline on submit.
+        self.is_synchronous = os.environ.get('SQUIGGY_ENV') in ['test', 'testext']
+        if not self.is_synchronous:
+            for index in range(app.config['CANVAS_POLLER_ATTACHMENT_WORKERS']):
+                Thread(target=self._run_worker, name=f'{thread_name_prefix}.attachments-{index}', daemon=True).start()
+
+    def submit(self, attachment, assignment_id, category_id, course_id, user_id):
+        key = (course_id, attachment.id)
+        with self.lock:
+            job = self.pending_jobs.get(key)
+            if job:
+                if user_id not in job['user_ids']:
+                    job['user_ids'].append(user_id)
+                self.metrics['deduplicated'] += 1
+                return
+            job = {
+                'assignment_id': assignment_id,
+                'canvas_attachment_id': attachment.id,
+                'category_id': category_id,
+                'course_id': course_id,
+                'display_name': attachment.display_name,
+                'url': attachment.url,
+                'user_ids': [user_id],
+            }
+            self.pending_jobs[key] = job
+            self.metrics['queued'] += 1
+        if self.is_synchronous:
+            self._process(job)
+        else:
+            # Blocks while the queue is full, which holds the poller back until the workers catch up.
+            self.queue.put(job)
+
+    def get_metrics(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        elapsed = time() - self.started_at
+        metrics.update({
+            'backlog': self.queue.qsize(),
+            'bytesPerSecond': round(metrics['bytes'] / metrics['seconds']) if metrics['seconds'] else 0,
+            'filesPerMinute': round(60 * metrics['completed'] / elapsed, 2) if elapsed else 0,
+        })
+        return metrics
+
+    def _run_worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                with self.app.app_context():
+                    self._process(job)
+            finally:
+                self.queue.task_done()
+
+    def _process(self, job):
+        started_at = time()
+        try:
+            asset = self._ingest(job)
+            self._add_late_users(job, asset)
+            self._increment(completed=1, seconds=time() - started_at)
+        except Exception as e:
+            logger.error(
+                f"Failed to create file asset for attachment {job['canvas_attachment_id']}: "
+                f"users {job['user_ids']}, assignment {job['assignment_id']}, course {job['course_id']}")
+            logger.exception(e)
+            db.session.rollback()
+            with self.lock:
+                self.pending_jobs.pop((job['course_id'], job['canvas_attachment_id']), None)
+            self._increment(failed=1)
+
+    def _ingest(self, job):
+        with self.lock:
+            user_ids = job['added_user_ids'] = list(job['user_ids'])
+        canvas_attachment = CanvasAttachment.find(job['course_id'], job['canvas_attachment_id'])
+        asset = canvas_attachment and canvas_attachment.asset_id and Asset.find_by_id(canvas_attachment.asset_id)
+        if asset:
+            # Seen in an earlier poll: the submission was reprocessed but its asset lives on.
+            self._increment(deduplicated=1)
+            self._add_users(asset, user_ids)
+            return asset
+        if canvas_attachment:
+            # The file is already in S3 even though its asset was deleted.
+            self._increment(deduplicated=1)
+            s3_attrs = {
+                'content_hash': canvas_attachment.content_hash,
+                'content_type': canvas_attachment.content_type,
+                'download_url': canvas_attachment.download_url,
+                'size': canvas_attachment.size,
+            }
+        else:
+            s3_attrs = self._upload_with_retries(job)
+        asset = Asset.create(
+            asset_type='file',
+            canvas_assignment_id=job['assignment_id'],
+            categories=[Category.find_by_id(job['category_id'])],
+            content_hash=s3_attrs['content_hash'],
+            course_id=job['course_id'],
+            created_by=user_ids[0],
+            download_url=s3_attrs['download_url'],
+            mime=s3_attrs['content_type'],
+            title=job['display_name'],
+            users=User.find_by_ids(user_ids),
+            create_activity=False,
+        )
+        CanvasAttachment.upsert(
+            asset_id=asset.id,
+            canvas_attachment_id=job['canvas_attachment_id'],
+            content_hash=s3_attrs['content_hash'],
+            content_type=s3_attrs['content_type'],
+            course_id=job['course_id'],
+            download_url=s3_attrs['download_url'],
+            size=s3_attrs['size'],
+        )
+        return asset
+
+    def _upload_with_retries(self, job):
+        attempt = 1
+        while True:
+            try:
+                return self._upload(job)
+            except BadRequestError:
+                raise
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    raise
+                # Exponential backoff with jitter.
+                delay = self.retry_seconds * (2 ** (attempt - 1)) * random.uniform(1, 1.5)
+                logger.warning(f"Attempt {attempt} to upload attachment {job['canvas_attachment_id']} failed, will retry in {delay:.1f}s: {e}")
+                self._increment(retries=1)
+                sleep(delay)
+                attempt += 1
+
+    def _upload(self, job):
+        with requests.get(job['url'], stream=True, timeout=(10, 60)) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            stored_file, uploaded = StoredFile.store(
+                course_id=job['course_id'],
+                filename=job['display_name'],
+                stream=response.raw,
+                max_bytes=self.max_bytes,
+            )
+        if uploaded:
+            self._increment(bytes=stored_file.size, uploaded=1)
+        else:
+            # Another attachment in the course, perhaps from another group, has the same content.
+            self._increment(deduplicated=1)
+        return {
+            'content_hash': stored_file.content_hash,
+            'content_type': stored_file.content_type,
+            'download_url': stored_file.download_url,
+            'size': stored_file.size,
+        }
+
+    def _add_late_users(self, job, asset):
+        # Pick up group members who submitted the same attachment while the job was in flight.
+        while True:
+            with self.lock:
+                late_user_ids = [user_id for user_id in job['user_ids'] if user_id not in job['added_user_ids']]
+                if not late_user_ids:
+                    self.pending_jobs.pop((job['course_id'], job['canvas_attachment_id']), None)
+                    return
+                job['added_user_ids'] = list(job['user_ids'])
+            self._add_users(asset, late_user_ids)
+
+    def _add_users(self, asset, user_ids):
+        asset_user_ids = [u.id for u in asset.users]
+        new_users = User.find_by_ids([user_id for user_id in user_ids if user_id not in asset_user_ids])
+        if new_users:
+            logger.debug(f'Adding {len(new_users)} users to existing file asset {asset.id}.')
+            asset.users.extend(new_users)
+            db.session.add(asset)
+            std_commit()
+
+    def _increment(self, **kwargs):
+        with self.lock:
+            for key, value in kwargs.items():
+                self.metrics[key] += value
@@ -23,22 +23,65 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
+import hashlib
 import os
 import re
+import tempfile
+from threading import Lock
+import time
 from urllib.parse import parse_qs, urlparse
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
 from flask import current_app as app
 import magic
-import smart_open
-from squiggy.lib.errors import InternalServerError
+from squiggy.lib.errors import BadRequestError, InternalServerError
 from squiggy.lib.util import utc_now
 from squiggy.logger import logger
 
 
 S3_PREVIEW_URL_PATTERN = '^https://suitec-preview-images-\w+\.s3.*\.amazonaws\.com'
 
+# A signed URL handed out to a browser should have at least this long to live.
+SIGNED_URL_MIN_REMAINING_SECONDS = 3600
+
+# Uploads are spooled to a temporary file, in memory up to this size and on disk beyond it, while their hash is computed.
+SPOOL_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
+
+# boto3 clients are thread-safe, and expensive to build, so each process shares one per set of credentials.
+_s3_clients = {}
+_s3_clients_lock = Lock()
+
+# Signed URLs by (bucket, key), least recently used first, with the time they expire.
+_signed_urls = OrderedDict()
+_signed_urls_lock = Lock()
+
+_s3_metrics = {
+    'clientsCreated': 0,
+    'downloadBytesStreamed': 0,
+    'downloadsProxied': 0,
+    'downloadsRedirected': 0,
+    'signedUrlCacheHits': 0,
+    'signedUrlCacheMisses': 0,
+}
+
+
+def get_s3_https_url(s3_url):
+    # The https form of an s3:// URL in our bucket, which get_s3_signed_url will sign for the browser.
+    bucket, key = _parse_s3_url(s3_url)
+    return _get_s3_https_url(bucket, key)
+
+
+def get_s3_metrics():
+    with _signed_urls_lock:
+        return {**_s3_metrics, 'signedUrlCacheSize': len(_signed_urls)}
+
 
 def get_s3_signed_url(url):
     if not is_s3_preview_url(url):
@@ -47,21 +90,35 @@ def get_s3_signed_url(url):
     query_string = parse_qs(parsed_url.query)
 
     # If we already have a signed URL with at least an hour of life left, that will do.
-    if 'Expires' in query_string and (int(query_string['Expires'][0]) - datetime.utcnow().timestamp()) > 3600:
+    if 'Expires' in query_string and (int(query_string['Expires'][0]) - datetime.utcnow().timestamp()) > SIGNED_URL_MIN_REMAINING_SECONDS:
         return url
 
-    s3 = _get_s3_client()
     bucket = re.sub('\..*$', '', parsed_url.hostname)
     key = re.sub('^/', '', parsed_url.path)
+    now = time.time()
+    with _signed_urls_lock:
+        cached = _signed_urls.get((bucket, key))
+        if cached and cached[1] - now > SIGNED_URL_MIN_REMAINING_SECONDS:
+            _signed_urls.move_to_end((bucket, key))
+            _s3_metrics['signedUrlCacheHits'] += 1
+            return cached[0]
 
-    return s3.generate_presigned_url(
+    expires_in = app.config['AWS_S3_SIGNED_URL_EXPIRES_IN']
+    signed_url = _get_s3_client().generate_presigned_url(
         ClientMethod='get_object',
         Params={
             'Bucket': bucket,
             'Key': key,
         },
-        ExpiresIn=3600,
+        ExpiresIn=expires_in,
     )
+    with _signed_urls_lock:
+        _signed_urls[(bucket, key)] = (signed_url, now + expires_in)
+        _signed_urls.move_to_end((bucket, key))
+        while len(_signed_urls) > app.config['AWS_S3_SIGNED_URL_CACHE_SIZE']:
+            _signed_urls.popitem(last=False)
+        _s3_metrics['signedUrlCacheMisses'] += 1
+    return signed_url
 
 
 def put_binary_data_to_s3(bucket, key, binary_data, content_type):
@@ -75,24 +132,72 @@ def put_binary_data_to_s3(bucket, key, binary_data, content_type):
         return None
 
 
-def stream_object(s3_url):
+def get_s3_object(s3_url, byte_range=None, if_none_match=None):
+    # Status and headers for a proxied download, and a generator of the body. S3 itself answers Range and If-None-Match.
+    bucket, key = _parse_s3_url(s3_url)
+    kwargs = {'Bucket': bucket, 'Key': key}
+    if byte_range:
+        kwargs['Range'] = byte_range
+    if if_none_match:
+        kwargs['IfNoneMatch'] = if_none_match
     try:
-        return smart_open.open(s3_url, 'rb', transport_params={'session': _get_session()})
-    except Exception as e:
-        logger.error(f'S3 stream operation failed (s3_url={s3_url})')
+        response = _get_s3_client().get_object(**kwargs)
+    except ClientError as e:
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if status in (304, 416):
+            return {
+                'body': [],
+                'headers': {k: v for k, v in e.response.get('ResponseMetadata', {}).get('HTTPHeaders', {}).items() if k in ('content-range', 'etag')},
+                'status': status,
+            }
+        logger.error(f'S3 get operation failed (s3_url={s3_url})')
         logger.exception(e)
         return None
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Length': str(response['ContentLength']),
+        'Content-Type': response.get('ContentType') or 'application/octet-stream',
+        'ETag': response['ETag'],
+    }
+    if response.get('ContentRange'):
+        headers['Content-Range'] = response['ContentRange']
+    with _signed_urls_lock:
+        _s3_metrics['downloadsProxied'] += 1
+    return {
+        'body': _stream_body(response['Body'], chunk_size=app.config['ASSET_DOWNLOAD_CHUNK_SIZE']),
+        'headers': headers,
+        'status': 206 if response.get('ContentRange') else 200,
+    }
+
+
+def get_s3_presigned_download_url(s3_url, filename):
+    bucket, key = _parse_s3_url(s3_url)
+    with _signed_urls_lock:
+        _s3_metrics['downloadsRedirected'] += 1
+    return _get_s3_client().generate_presigned_url(
+        ClientMethod='get_object',
+        Params={
+            'Bucket': bucket,
+            'Key': key,
+            'ResponseContentDisposition': f'attachment; filename="{filename}"',
+        },
+        ExpiresIn=app.config['ASSET_DOWNLOAD_URL_EXPIRES_IN'],
+    )
+
+
+def download_from_s3(s3_url, file):
+    bucket, key = _parse_s3_url(s3_url)
+    _get_s3_client().download_fileobj(bucket, key, file)
 
 
 def is_s3_preview_url(url):
-    return url and re.compile(S3_PREVIEW_URL_PATTERN).match(url)
+    # Previews come from the preview service's buckets or, when generated locally, from our own.
+    return url and (re.compile(S3_PREVIEW_URL_PATTERN).match(url) or url.startswith(f"https://{app.config['S3_BUCKET']}.s3."))
 
 
 def upload_to_s3(filename, byte_stream, s3_key_prefix):
     bucket = app.config['S3_BUCKET']
-    (basename, extension) = os.path.splitext(filename)
-    # Truncate file basename if longer than 170 characters; the complete constructed S3 URI must come in under 255.
-    key = f"{s3_key_prefix}/{utc_now().strftime('%Y-%m-%d_%H%M%S')}-{basename[0:170]}{extension}"
+    key = _get_s3_key(filename, s3_key_prefix)
     content_type = magic.from_buffer(byte_stream, mime=True)
     if put_binary_data_to_s3(bucket, key, byte_stream, content_type):
         return {
@@ -103,8 +208,80 @@ def upload_to_s3(filename, byte_stream, s3_key_prefix):
         raise InternalServerError('Could not upload file.')
 
 
+def upload_preview_to_s3(binary_data, content_type, key):
+    # An https URL, like those of the preview service, so that get_s3_signed_url will sign it for the browser.
+    bucket = app.config['S3_BUCKET']
+    if not put_binary_data_to_s3(bucket, key, binary_data, content_type):
+        raise InternalServerError('Could not upload preview image.')
+    return _get_s3_https_url(bucket, key)
+
+
+def upload_file_to_s3(file, filename, content_hash, content_type, s3_key_prefix):
+    # Keys are content-addressed: the same bytes uploaded twice in a course land on the same object. Files larger than one
+    # part go up as S3 multipart uploads.
+    bucket = app.config['S3_BUCKET']
+    key = f'{s3_key_prefix}/{content_hash}{os.path.splitext(filename)[1]}'
+    part_size = app.config['AWS_S3_MULTIPART_CHUNK_SIZE']
+    try:
+        _get_s3_client().upload_fileobj(
+            file,
+            bucket,
+            key,
+            Config=TransferConfig(
+                max_concurrency=app.config['AWS_S3_MULTIPART_MAX_CONCURRENCY'],
+                multipart_chunksize=part_size,
+                multipart_threshold=part_size,
+            ),
+            ExtraArgs={'ContentType': content_type},
+        )
+    except Exception as e:
+        logger.error(f'S3 upload failed (bucket={bucket}, key={key})')
+        logger.exception(e)
+        raise InternalServerError('Could not upload file.')
+    return f's3://{bucket}/{key}'
+
+
+@contextmanager
+def spool_stream(stream, max_bytes=None):
+    # Copy the stream to a temporary file, which stays in memory only while small, hashing it along the way. The MIME type
+    # is sniffed from the head of the stream.
+    content_hash = hashlib.sha256()
+    head = b''
+    size = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES) as file:
+        while True:
+            chunk = stream.read(SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise BadRequestError(f'File exceeds the maximum upload size of {max_bytes} bytes.')
+            if len(head) < 2048:
+                head += chunk[:2048 - len(head)]
+            content_hash.update(chunk)
+            file.write(chunk)
+        file.seek(0)
+        yield {
+            'content_hash': content_hash.hexdigest(),
+            'content_type': magic.from_buffer(head, mime=True),
+            'file': file,
+            'size': size,
+        }
+
+
 def _get_s3_client():
-    return _get_session().client('s3')
+    credentials = (app.config['AWS_ACCESS_KEY_ID'], app.config['AWS_SECRET_ACCESS_KEY'])
+    with _s3_clients_lock:
+        s3 = _s3_clients.get(credentials)
+        if not s3:
+            s3 = _get_session().client('s3', config=BotoConfig(max_pool_connections=app.config['AWS_S3_MAX_POOL_CONNECTIONS']))
+            _s3_clients[credentials] = s3
+            _s3_metrics['clientsCreated'] += 1
+    return s3
+
+
+def _get_s3_https_url(bucket, key):
+    return f"https://{bucket}.s3.{app.config['S3_REGION']}.amazonaws.com/{key}"
 
 
 def _get_session():
@@ -112,3 +289,25 @@ def _get_session():
         aws_access_key_id=app.config['AWS_ACCESS_KEY_ID'],
         aws_secret_access_key=app.config['AWS_SECRET_ACCESS_KEY'],
     )
+
+
+def _parse_s3_url(s3_url):
+    parsed_url = urlparse(s3_url)
+    return parsed_url.netloc, parsed_url.path.lstrip('/')
+
+
+def _stream_body(body, chunk_size):
+    # Iterated by the WSGI server after the request is done, so no app context here.
+    try:
+        for chunk in body.iter_chunks(chunk_size=chunk_size):
+            with _signed_urls_lock:
+                _s3_metrics['downloadBytesStreamed'] += len(chunk)
+            yield chunk
+    finally:
+        body.close()
+
+
+def _get_s3_key(filename, s3_key_prefix):
+    (basename, extension) = os.path.splitext(filename)
+    # Truncate file basename if longer than 170 characters; the complete constructed S3 URI must come in under 255.
+    return f"{s3_key_prefix}/{utc_now().strftime('%Y-%m-%d_%H%M%S')}-{basename[0:170]}{extension}"
@@ -23,24 +23,28 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from datetime import timedelta
+import hashlib
 from time import sleep
-from urllib.request import urlopen
 
 from canvasapi.exceptions import ResourceDoesNotExist
+from canvasapi.group import GroupMembership
+from canvasapi.section import Section
+from canvasapi.user import User as CanvasUser
 from flask import current_app as app
-from sqlalchemy import nullsfirst
 from sqlalchemy.orm import joinedload
 from squiggy import db, std_commit
-from squiggy.externals.canvas import get_canvas
-from squiggy.lib.aws import upload_to_s3
+from squiggy.externals.canvas import fan_out, get_canvas, get_paginated_if_changed
+from squiggy.externals.canvas_cache import get_cache_metrics
+from squiggy.lib.attachment_ingestion import get_attachment_pipeline
 from squiggy.lib.background_job import BackgroundJob
-from squiggy.lib.db_util import advisory_lock
-from squiggy.lib.previews import get_s3_key_prefix
+from squiggy.lib.poll_scheduler import get_next_due_at, schedule_next_poll, schedule_poll_retry
 from squiggy.lib.util import utc_now
 from squiggy.logger import initialize_background_logger, logger
 from squiggy.models.activity import Activity
 from squiggy.models.asset import Asset
 from squiggy.models.canvas_poller_api_key import CanvasPollerApiKey
+from squiggy.models.canvas_sync_cursor import CanvasSyncCursor
 from squiggy.models.category import Category
 from squiggy.models.course import Course
 from squiggy.models.course_group import CourseGroup
@@ -50,60 +54,87 @@ from squiggy.models.user import User
 
 def launch_pollers():
     keys = CanvasPollerApiKey.query.all()
-    logger.info(f'Next, we start {len(keys)} poller instances')
+    logger.info(f'Next, we start poller instances for {len(keys)} API keys')
+    workers_per_domain = app.config['CANVAS_POLLER_WORKERS_PER_DOMAIN']
     for (i, key) in enumerate(keys):
-        CanvasPoller(poller_id=i, canvas_api_domain=key.canvas_api_domain, api_key=key.api_key).run_async()
+        worker_count = workers_per_domain.get(key.canvas_api_domain, app.config['CANVAS_POLLER_WORKERS'])
+        initialize_background_logger(
+            name=f'poller-{i}',
+            location=f'poller_{i}_{key.canvas_api_domain}.log',
+        )
+        for worker_id in range(worker_count):
+            CanvasPoller(poller_id=i, worker_id=worker_id, canvas_api_domain=key.canvas_api_domain, api_key=key.api_key).run_async()
 
 
 class CanvasPoller(BackgroundJob):
 
-    def __init__(self, poller_id, **kwargs):
-        thread_name = f'poller-{poller_id}'
-        initialize_background_logger(
-            name=thread_name,
-            location=f"poller_{poller_id}_{kwargs.get('canvas_api_domain')}.log",
-        )
+    def __init__(self, poller_id, worker_id=0, **kwargs):
+        # Worker loggers are children of the 'poller-{id}' logger and write to its log file.
+        thread_name = f'poller-{poller_id}.{worker_id}'
+        self.poller_id = poller_id
         super().__init__(thread_name=thread_name, **kwargs)
 
     def run(self, canvas_api_domain, api_key):
-        logger.info(f'New poller running for {canvas_api_domain}')
+        logger.info(f'New poller worker running for {canvas_api_domain}')
         api_url = f'https://{canvas_api_domain}'
         self.canvas = get_canvas(api_url, api_key)
 
         while True:
-            with advisory_lock(app.config['ADVISORY_LOCK_ID_CANVAS_POLLER']) as has_lock:
-                if has_lock:
-                    course = db.session.query(Course) \
-                        .filter_by(canvas_api_domain=canvas_api_domain, active=True) \
-                        .order_by(nullsfirst(Course.last_polled.asc())) \
-                        .with_for_update() \
-                        .first()
-                    if not course:
-                        logger.info(f'No active courses found: {canvas_api_domain}')
-                    else:
-                        logger.debug(f"Will poll {_format_course(course)}, last polled {course.last_polled or 'never'}")
-                        course.last_polled = utc_now()
-                        db.session.add(course)
-                        std_commit()
-
-                        try:
-                            self.poll_course(course)
-                        except ResourceDoesNotExist:
-                            logger.warn(f'Poller, using Canvas API, did not find course {_format_course(course)}')
-                        except Exception as e:
-                            logger.error(f'Failed to poll course {_format_course(course)}')
-                            logger.exception(e)
-            sleep(5)
+            courses = Course.claim_for_polling(
+                canvas_api_domain=canvas_api_domain,
+                limit=app.config['CANVAS_POLLER_BATCH_SIZE'],
+                lease_seconds=app.config['CANVAS_POLLER_LEASE_SECONDS'],
+            )
+            if not courses:
+                logger.debug(f'No active courses ready for polling: {canvas_api_domain}')
+            for course in courses:
+                logger.debug(f'Will poll {_format_course(course)}')
+                try:
+                    self.poll_course(course)
+                except ResourceDoesNotExist:
+                    logger.warn(f'Poller, using Canvas API, did not find course {_format_course(course)}')
+                    self.back_off(course)
+                except Exception as e:
+                    logger.error(f'Failed to poll course {_format_course(course)}')
+                    logger.exception(e)
+                    db.session.rollback()
+                    self.back_off(course)
+            sleep(app.config['CANVAS_POLLER_SLEEP_SECONDS'])
+
+    def back_off(self, db_course):
+        # Otherwise the course would be claimed again, and fail again, as soon as its lease ran out.
+        try:
+            db_course = schedule_poll_retry(db_course)
+            logger.info(f'Will retry poll at {db_course.next_poll_at} after {db_course.poll_failures} failures: {_format_course(db_course)}')
+        except Exception as e:
+            logger.exception(e)
+            db.session.rollback()
 
     def poll_course(self, db_course):
         api_course = self.canvas.get_course(db_course.canvas_course_id)
         if self.poll_tab_configuration(db_course, api_course) is False:
             return
-        users_by_canvas_id = self.poll_users(db_course, api_course)
-        self.poll_assignments(db_course, api_course, users_by_canvas_id)
-        self.poll_discussions(db_course, api_course, users_by_canvas_id)
-        self.poll_groups(db_course, api_course)
+        sync_started_at = utc_now()
+        cursors = CanvasSyncCursor.get_cursors_per_resource(db_course.id)
+        full_sync_cursor = cursors.get('full_sync')
+        full_sync_interval = timedelta(hours=app.config['CANVAS_POLLER_FULL_SYNC_INTERVAL_HOURS'])
+        is_full_sync = not full_sync_cursor or full_sync_cursor.last_synced_at < sync_started_at - full_sync_interval
+        if is_full_sync:
+            # Ignore change cursors and re-scan everything, as a safety net against missed changes.
+            logger.debug(f'Will run full sync: {_format_course(db_course)}')
+            cursors = {}
+
+        users_by_canvas_id = self.poll_users(db_course, api_course, cursors)
+        next_due_at = self.poll_assignments(db_course, api_course, users_by_canvas_id, cursors, sync_started_at)
+        logger.debug(f'Attachment ingestion metrics: {self.get_attachment_pipeline(db_course).get_metrics()}')
+        self.poll_discussions(db_course, api_course, users_by_canvas_id, cursors, sync_started_at)
+        self.poll_groups(db_course, api_course, cursors)
         self.poll_last_activity(db_course)
+        if is_full_sync:
+            CanvasSyncCursor.update(course_id=db_course.id, resource='full_sync', last_synced_at=sync_started_at)
+        logger.debug(f'Canvas API cache metrics: {get_cache_metrics(db_course.canvas_api_domain)}')
+        db_course = schedule_next_poll(db_course, next_due_at=next_due_at, polled_since=sync_started_at)
+        logger.debug(f'Next poll at {db_course.next_poll_at} (priority {db_course.poll_priority:.2f}): {_format_course(db_course)}')
 
     def poll_tab_configuration(self, db_course, api_course):
         tabs = api_course.get_tabs()
@@ -151,7 +182,7 @@ class CanvasPoller(BackgroundJob):
 
         return course_updates.get('active', True)
 
-    def poll_groups(self, db_course, api_course):
+    def poll_groups(self, db_course, api_course, cursors):
         api_groups = list(api_course.get_groups())
         api_categories_by_id = {c.id: c for c in api_course.get_group_categories()}
         db_groups = db_course.groups
@@ -159,17 +190,23 @@ class CanvasPoller(BackgroundJob):
             return
 
         logger.debug(f'Retrieved {len(api_groups)} groups from Canvas: {_format_course(db_course)}')
+        db_groups_by_canvas_id = {g.canvas_group_id: g for g in db_groups}
+        db_canvas_user_ids_per_group = None
+        memberships_to_add = []
+        memberships_to_remove = []
+        membership_hash_per_group_id = {}
 
         api_group_ids = set()
         for api_group in api_groups:
             api_group_ids.add(api_group.id)
             category = api_categories_by_id.get(api_group.group_category_id)
             category_name = category.name if category else None
-            db_group = next((dbg for dbg in db_groups if dbg.canvas_group_id == api_group.id), None)
+            db_group = db_groups_by_canvas_id.get(api_group.id)
             if db_group:
                 group_modified = False
                 if db_group.name != api_group.name:
                     db_group.name = api_group.name
+                    group_modified = True
                 if category_name and db_group.category_name != category_name:
                     db_group.category_name = category_name
                     group_modified = True
@@ -179,22 +216,75 @@ class CanvasPoller(BackgroundJob):
             else:
                 db_group = CourseGroup.create(course_id=db_course.id, canvas_group_id=api_group.id, name=api_group.name, category_name=category_name)
 
-            api_memberships = list(api_group.get_memberships())
-            db.session.query(CourseGroupMembership).filter_by(course_group_id=db_group.id).delete(synchronize_session=False)
-            for m in api_memberships:
-                CourseGroupMembership.create(course_id=db_course.id, course_group_id=db_group.id, canvas_user_id=m.user_id)
-                logger.debug(f'Group has {len(api_memberships)} memberships: {_format_course(db_course)}, group {api_group.id}')
+            memberships_resource = f'group_memberships/{api_group.id}'
+            api_memberships, etags = get_paginated_if_changed(
+                api_group._requester,
+                GroupMembership,
+                f'groups/{api_group.id}/memberships',
+                etags=_get_etags(cursors, memberships_resource),
+            )
+            if api_memberships is None:
+                continue
+            api_canvas_user_ids = {m.user_id for m in api_memberships}
+            membership_hash = _get_membership_hash(api_canvas_user_ids)
+            if membership_hash != db_group.membership_hash:
+                if db_canvas_user_ids_per_group is None:
+                    db_canvas_user_ids_per_group = CourseGroupMembership.get_canvas_user_ids_per_group(db_course.id)
+                db_canvas_user_ids = db_canvas_user_ids_per_group.get(db_group.id, set())
+                memberships_to_add += [(db_group.id, canvas_user_id) for canvas_user_id in api_canvas_user_ids - db_canvas_user_ids]
+                memberships_to_remove += [(db_group.id, canvas_user_id) for canvas_user_id in db_canvas_user_ids - api_canvas_user_ids]
+                membership_hash_per_group_id[db_group.id] = membership_hash
+            CanvasSyncCursor.update(course_id=db_course.id, resource=memberships_resource, etags=etags)
+
+        CourseGroupMembership.delete_all(memberships_to_remove)
+        CourseGroupMembership.add_all(course_id=db_course.id, memberships=memberships_to_add)
+        CourseGroup.update_membership_hashes(membership_hash_per_group_id)
+        logger.debug(
+            f'Added {len(memberships_to_add)} and removed {len(memberships_to_remove)} group memberships across '
+            f'{len(membership_hash_per_group_id)} changed groups: {_format_course(db_course)}')
 
-        ids_to_delete = [g.id for g in db_groups if g.canvas_group_id not in api_group_ids]
-        if ids_to_delete:
-            db.session.query(CourseGroup).filter(CourseGroup.id.in_(ids_to_delete)).delete(synchronize_session=False)
+        groups_to_delete = [g for g in db_groups if g.canvas_group_id not in api_group_ids]
+        if groups_to_delete:
+            db.session.query(CourseGroup).filter(CourseGroup.id.in_([g.id for g in groups_to_delete])).delete(synchronize_session=False)
             std_commit()
-            logger.debug(f'Deleted {len(ids_to_delete)} groups: {_format_course(db_course)}')
+            CanvasSyncCursor.delete(course_id=db_course.id, resources=[f'group_memberships/{g.canvas_group_id}' for g in groups_to_delete])
+            logger.debug(f'Deleted {len(groups_to_delete)} groups: {_format_course(db_course)}')
 
-    def poll_users(self, db_course, api_course):  # noqa C901
+    def poll_users(self, db_course, api_course, cursors):  # noqa C901
+        sync_started_at = utc_now()
         db_users_by_canvas_id = {u.canvas_user_id: u for u in db_course.users}
 
-        api_sections = list(api_course.get_sections(include=['students']))
+        def _get_sections(etags=None):
+            return get_paginated_if_changed(
+                api_course._requester,
+                Section,
+                f'courses/{api_course.id}/sections',
+                etags=etags,
+                include=['students'],
+            )
+
+        def _get_users(etags=None):
+            return get_paginated_if_changed(
+                api_course._requester,
+                CanvasUser,
+                f'courses/{api_course.id}/users',
+                etags=etags,
+                include=['enrollments', 'avatar_url', 'email'],
+            )
+
+        api_sections, section_etags = _get_sections(etags=_get_etags(cursors, 'sections'))
+        api_users, user_etags = _get_users(etags=_get_etags(cursors, 'users'))
+        if api_sections is None and api_users is None:
+            # Users created by LTI launch since the last sync still need their sections and roles.
+            synced_at = cursors['users'].last_synced_at
+            if not any(u.created_at > synced_at for u in db_users_by_canvas_id.values()):
+                logger.debug(f'Sections and users unchanged since last sync: {_format_course(db_course)}')
+                return db_users_by_canvas_id
+        if api_sections is None:
+            api_sections, section_etags = _get_sections()
+        if api_users is None:
+            api_users, user_etags = _get_users()
+
         logger.debug(f'Retrieved {len(api_sections)} sections from Canvas: {_format_course(db_course)}')
         api_sections_by_user_id = {}
         for s in api_sections:
@@ -205,9 +295,10 @@ class CanvasPoller(BackgroundJob):
                 else:
                     api_sections_by_user_id[user_id] = [s.name]
 
-        api_users = list(api_course.get_users(include=['enrollments', 'avatar_url', 'email']))
         logger.debug(f'Retrieved {len(api_users)} users from Canvas: {_format_course(db_course)}')
         api_user_ids = set()
+        users_to_create = []
+        users_to_update = []
         for u in api_users:
             api_user_ids.add(u.id)
             enrollment_state = 'active'
@@ -240,30 +331,44 @@ class CanvasPoller(BackgroundJob):
             db_user = db_users_by_canvas_id.get(u.id)
             if not db_user:
                 logger.debug(f'Adding new user {u.id}: {_format_course(db_course)}')
-                db_users_by_canvas_id[u.id] = User.create(**user_attributes)
-            else:
-                updated = False
-                for key, value in user_attributes.items():
-                    if getattr(db_user, key, None) != value:
-                        setattr(db_user, key, value)
-                        updated = True
-                if updated:
-                    logger.debug(f'Updating info for user {db_user.canvas_user_id}: {_format_course(db_course)}')
-                    db.session.add(db_user)
-                    std_commit()
+                users_to_create.append(user_attributes)
+            elif any(getattr(db_user, key, None) != value for key, value in user_attributes.items()):
+                logger.debug(f'Updating info for user {db_user.canvas_user_id}: {_format_course(db_course)}')
+                users_to_update.append({'id': db_user.id, **user_attributes})
 
+        user_ids_to_inactivate = []
         for db_user in db_users_by_canvas_id.values():
             if db_user.canvas_user_id not in api_user_ids and db_user.canvas_enrollment_state != 'inactive':
                 logger.debug(f'Marking user {db_user.canvas_user_id} as inactive: {_format_course(db_course)}')
-                db_user.canvas_enrollment_state = 'inactive'
-                db.session.add(db_user)
-        std_commit()
+                user_ids_to_inactivate.append(db_user.id)
+
+        db_users = User.sync_roster(
+            course_id=db_course.id,
+            users_to_create=users_to_create,
+            users_to_update=users_to_update,
+            user_ids_to_inactivate=user_ids_to_inactivate,
+        )
+        logger.debug(
+            f'Roster sync added {len(users_to_create)}, updated {len(users_to_update)} and inactivated {len(user_ids_to_inactivate)} '
+            f'users: {_format_course(db_course)}')
+        db_users_by_canvas_id = {u.canvas_user_id: u for u in db_users}
+        CanvasSyncCursor.update(course_id=db_course.id, resource='sections', etags=section_etags, last_synced_at=sync_started_at)
+        CanvasSyncCursor.update(course_id=db_course.id, resource='users', etags=user_etags, last_synced_at=sync_started_at)
         return db_users_by_canvas_id
 
-    def poll_assignments(self, db_course, api_course, users_by_canvas_id):
+    def poll_assignments(self, db_course, api_course, users_by_canvas_id, cursors, sync_started_at):  # noqa C901
         course_categories = Category.query.filter_by(course_id=db_course.id).all()
         assignments = list(api_course.get_assignments())
         logger.debug(f'Retrieved {len(assignments)} assignments from Canvas: {_format_course(db_course)}')
+
+        submitted_since = _get_since(cursors, 'submissions')
+        recent_submissions_by_assignment_id = submitted_since and self.get_submissions_since(db_course, api_course, submitted_since)
+        categories_by_assignment_id = {c.canvas_assignment_id: c for c in course_categories}
+        submissions_by_assignment_id = self.get_submissions_per_assignment(
+            db_course,
+            [a for a in assignments if _needs_submission_scan(a, categories_by_assignment_id.get(a.id), submitted_since)],
+        )
+        next_cursor = sync_started_at
         assignment_ids = set()
         for assignment in assignments:
             # Ignore unpublished assignments.
@@ -305,7 +410,22 @@ class CanvasPoller(BackgroundJob):
                     db.session.add(assignment_category)
                     std_commit()
 
-            self.poll_assignment_submissions(assignment, assignment_category, db_course, api_course, users_by_canvas_id)
+            # A category created or modified since the last sync (e.g., a change in visibility) calls for a full re-scan.
+            if not submitted_since or assignment_category.updated_at > submitted_since:
+                submissions = submissions_by_assignment_id.get(assignment.id)
+            else:
+                submissions = recent_submissions_by_assignment_id.get(assignment.id, [])
+            pending_since = self.poll_assignment_submissions(
+                assignment,
+                assignment_category,
+                db_course,
+                api_course,
+                users_by_canvas_id,
+                submissions=submissions,
+            )
+            # Submissions still pending upload must be seen again once complete.
+            if pending_since and pending_since < next_cursor:
+                next_cursor = pending_since
 
         # Remove any empty categories no longer corresponding to an active assignment.
         for course_category in Category.query.filter_by(course_id=db_course.id).all():
@@ -316,11 +436,38 @@ class CanvasPoller(BackgroundJob):
             ):
                 db.session.delete(course_category)
                 std_commit()
+        CanvasSyncCursor.update(course_id=db_course.id, resource='submissions', last_synced_at=next_cursor)
+        return get_next_due_at(assignments)
+
+    def get_submissions_since(self, db_course, api_course, submitted_since):
+        # One course-wide request gets us every submission made since the last sync.
+        submissions_by_assignment_id = {}
+        for submission in api_course.get_multiple_submissions(student_ids=['all'], submitted_since=submitted_since):
+            submissions_by_assignment_id.setdefault(submission.assignment_id, []).append(submission)
+        logger.debug(
+            f'Retrieved {sum(len(v) for v in submissions_by_assignment_id.values())} submissions since {submitted_since}: '
+            f'{_format_course(db_course)}')
+        return submissions_by_assignment_id
+
+    def get_submissions_per_assignment(self, db_course, assignments):
+        # Fetch concurrently; assignments that fail here are fetched again, one at a time, when processed.
+        def _get_submissions(assignment):
+            try:
+                return list(assignment.get_submissions())
+            except Exception as e:
+                logger.error(f'Failed to fetch submissions: assignment {assignment.id}, {_format_course(db_course)}')
+                logger.exception(e)
+                return None
+
+        submissions_per_assignment = fan_out(_get_submissions, assignments)
+        return {a.id: submissions for a, submissions in zip(assignments, submissions_per_assignment) if submissions is not None}
 
-    def poll_assignment_submissions(self, assignment, category, db_course, api_course, users_by_canvas_id):
+    def poll_assignment_submissions(self, assignment, category, db_course, api_course, users_by_canvas_id, submissions=None):
         if not getattr(assignment, 'has_submitted_submissions', False):
             logger.debug(f'Ignoring assignment (id {assignment.id}) without submissions: {_format_course(db_course)}')
             return
+        if submissions is not None and not submissions:
+            return
 
         def _is_submission_active(s):
             pending_states = ['unsubmitted', 'pending_upload']
@@ -334,13 +481,17 @@ class CanvasPoller(BackgroundJob):
                         return False
             return True
 
-        submissions = list(assignment.get_submissions())
+        if submissions is None:
+            submissions = list(assignment.get_submissions())
         active_submissions = [s for s in submissions if _is_submission_active(s)]
         logger.debug(
             f'Got {len(submissions)} submissions, will process {len(active_submissions)} active submissions: '
             f'assignment {assignment.id}, {_format_course(db_course)}')
         if len(active_submissions) > 0:
-            self.sync_submissions(db_course, category, assignment, active_submissions, users_by_canvas_id)
+            with Activity.batch():
+                self.sync_submissions(db_course, category, assignment, active_submissions, users_by_canvas_id)
+        pending_submitted_at = [getattr(s, 'submitted_at_date', None) for s in submissions if not _is_submission_active(s)]
+        return min((t for t in pending_submitted_at if t), default=None)
 
     def sync_submissions(self, course, category, assignment, submissions, users_by_canvas_id):
         activity_index = self.index_activities(
@@ -353,7 +504,6 @@ class CanvasPoller(BackgroundJob):
                 joinedload(Activity.user),
             ),
         )
-        file_submission_tracker = {}
         link_submission_tracker = {}
 
         for submission in submissions:
@@ -372,6 +522,8 @@ class CanvasPoller(BackgroundJob):
                 for s in previous_submissions:
                     s.deleted_at = utc_now()
                     db.session.add(s)
+                # Attachment workers run in their own sessions and must see the deletions.
+                std_commit()
                 logger.debug(
                     f'Deleted {len(previous_submissions)} assets for older submissions: '
                     f'user {canvas_user_id}, assignment {assignment.id}, {_format_course(course)}')
@@ -384,7 +536,7 @@ class CanvasPoller(BackgroundJob):
             if submission_type == 'online_url':
                 self.create_link_submission_asset(course, submission_user, category, assignment, submission, link_submission_tracker)
             elif submission_type == 'online_upload':
-                self.create_file_submission_assets(course, submission_user, category, assignment, submission, file_submission_tracker)
+                self.create_file_submission_assets(course, submission_user, category, assignment, submission)
 
     def handle_submission_activities(self, course, user, category, assignment, submission, activity_index):
         submission_metadata = {
@@ -451,48 +603,31 @@ class CanvasPoller(BackgroundJob):
                 f'user {user.canvas_user_id}, submission {submission.id}, assignment {assignment.id}, {_format_course(course)}')
             logger.exception(e)
 
-    def create_file_submission_assets(self, course, user, category, assignment, submission, file_submission_tracker):
+    def create_file_submission_assets(self, course, user, category, assignment, submission):
         logger.debug(
-            f'Will create file assets for submission attachments: '
+            f'Will queue file assets for submission attachments: '
             f'user {user.canvas_user_id}, submission {submission.id}, assignment {assignment.id}, {_format_course(course)}')
+        pipeline = self.get_attachment_pipeline(course)
         for attachment in getattr(submission, 'attachments', []):
-            try:
-                if attachment.size > 10485760:
-                    logger.debug('Attachment too large, will not process.')
-                    continue
-                existing_submission_asset = file_submission_tracker.get(attachment.id, None)
-                if existing_submission_asset:
-                    logger.debug(f'Adding new user to existing file asset: user {user.canvas_user_id}, asset {existing_submission_asset.id}.')
-                    existing_submission_asset.users.append(user)
-                    db.session.add(existing_submission_asset)
-                    std_commit()
-                else:
-                    s3_attrs = upload_to_s3(
-                        filename=attachment.display_name,
-                        byte_stream=urlopen(attachment.url).read(),
-                        s3_key_prefix=get_s3_key_prefix(course.id, 'asset'),
-                    )
-                    file_submission_tracker[attachment.id] = Asset.create(
-                        asset_type='file',
-                        canvas_assignment_id=assignment.id,
-                        categories=[category],
-                        course_id=course.id,
-                        created_by=user.id,
-                        download_url=s3_attrs.get('download_url', None),
-                        mime=s3_attrs.get('content_type', None),
-                        title=attachment.display_name,
-                        users=[user],
-                        create_activity=False,
-                    )
-            except Exception as e:
-                logger.error(
-                    f'Failed to create file asset for an attachment: '
-                    f'user {user.canvas_user_id}, submission {submission.id}, assignment {assignment.id}, {_format_course(course)}')
-                logger.exception(e)
+            if attachment.size > app.config['CANVAS_POLLER_ATTACHMENT_MAX_BYTES']:
+                logger.debug('Attachment too large, will not process.')
+                continue
+            # Group submissions share attachments; the pipeline adds each submitter to a single asset per attachment.
+            pipeline.submit(
+                attachment=attachment,
+                assignment_id=assignment.id,
+                category_id=category.id,
+                course_id=course.id,
+                user_id=user.id,
+            )
 
-    def poll_discussions(self, db_course, api_course, users_by_canvas_id):
-        discussion_topics = list(api_course.get_discussion_topics())
+    def get_attachment_pipeline(self, course):
+        return get_attachment_pipeline(course.canvas_api_domain, thread_name_prefix=f'poller-{self.poller_id}')
+
+    def poll_discussions(self, db_course, api_course, users_by_canvas_id, cursors, sync_started_at):
+        discussion_topics = self.get_discussion_topics_active_since(api_course, _get_since(cursors, 'discussions'))
         if not discussion_topics:
+            CanvasSyncCursor.update(course_id=db_course.id, resource='discussions', last_synced_at=sync_started_at)
             return
 
         logger.debug(f'Retrieved {len(discussion_topics)} discussion topics from Canvas: {_format_course(db_course)}')
@@ -504,32 +639,64 @@ class CanvasPoller(BackgroundJob):
                 joinedload(Activity.user),
             ),
         )
-        for topic in discussion_topics:
-            try:
-                if not getattr(topic, 'published', False):
+        entries_by_topic_id = self.get_entries_per_topic(db_course, discussion_topics)
+        # Activities are written in bulk before the cursor moves on.
+        with Activity.batch():
+            for topic in discussion_topics:
+                try:
+                    if not getattr(topic, 'published', False):
+                        continue
+                    # Don't create a discussion_topic for an assigned discussion as these are set up by instructors.
+                    if not getattr(topic, 'assignment', None):
+                        author_id = topic.author.get('id', None) if topic.author else None
+                        if not discussion_activity_index.get(author_id, {}).get('discussion_topic', {}).get(topic.id):
+                            user = users_by_canvas_id.get(author_id, None)
+                            if user:
+                                Activity.create(
+                                    activity_type='discussion_topic',
+                                    course_id=db_course.id,
+                                    user_id=user.id,
+                                    object_type='canvas_discussion',
+                                    object_id=topic.id,
+                                )
+                    if not getattr(topic, 'discussion_subentry_count', 0):
+                        continue
+                    entries = entries_by_topic_id.get(topic.id)
+                    if entries is None:
+                        entries = list(topic.get_topic_entries())
+                    logger.debug(f'Retrieved {len(entries)} discussion entries from Canvas: topic {topic.id}, {_format_course(db_course)}')
+                    for entry in entries:
+                        self.create_discussion_entry_activities(entry, topic, db_course, users_by_canvas_id, discussion_activity_index)
+                except Exception as e:
+                    logger.error(f'Failed to poll a discussion topic: topic {topic.id}, {_format_course(db_course)}')
+                    logger.exception(e)
+        CanvasSyncCursor.update(course_id=db_course.id, resource='discussions', last_synced_at=sync_started_at)
+
+    def get_discussion_topics_active_since(self, api_course, active_since):
+        # Topics come back most recently active first, so we can stop at the first topic untouched since the last sync.
+        discussion_topics = []
+        for topic in api_course.get_discussion_topics(order_by='recent_activity'):
+            last_activity_at = getattr(topic, 'last_reply_at_date', None) or getattr(topic, 'posted_at_date', None)
+            if active_since and last_activity_at and last_activity_at < active_since:
+                if getattr(topic, 'pinned', False):
                     continue
-                # Don't create a discussion_topic for an assigned discussion as these are set up by instructors.
-                if not getattr(topic, 'assignment', None):
-                    author_id = topic.author.get('id', None) if topic.author else None
-                    if not discussion_activity_index.get(author_id, {}).get('discussion_topic', {}).get(topic.id):
-                        user = users_by_canvas_id.get(author_id, None)
-                        if user:
-                            Activity.create(
-                                activity_type='discussion_topic',
-                                course_id=db_course.id,
-                                user_id=user.id,
-                                object_type='canvas_discussion',
-                                object_id=topic.id,
-                            )
-                if not getattr(topic, 'discussion_subentry_count', 0):
-                    continue
-                entries = list(topic.get_topic_entries())
-                logger.debug(f'Retrieved {len(entries)} discussion entries from Canvas: topic {topic.id}, {_format_course(db_course)}')
-                for entry in entries:
-                    self.create_discussion_entry_activities(entry, topic, db_course, users_by_canvas_id, discussion_activity_index)
+                break
+            discussion_topics.append(topic)
+        return discussion_topics
+
+    def get_entries_per_topic(self, db_course, discussion_topics):
+        topics = [t for t in discussion_topics if getattr(t, 'published', False) and getattr(t, 'discussion_subentry_count', 0)]
+
+        def _get_entries(topic):
+            try:
+                return list(topic.get_topic_entries())
             except Exception as e:
-                logger.error(f'Failed to poll a discussion topic: topic {topic.id}, {_format_course(db_course)}')
+                logger.error(f'Failed to fetch discussion entries: topic {topic.id}, {_format_course(db_course)}')
                 logger.exception(e)
+                return None
+
+        entries_per_topic = fan_out(_get_entries, topics)
+        return {t.id: entries for t, entries in zip(topics, entries_per_topic) if entries is not None}
 
     def create_discussion_entry_activities(self, entry, topic, course, users_by_canvas_id, discussion_activity_index):
         # Users creating an entry on their own topic get no activity credit.
@@ -604,5 +771,33 @@ class CanvasPoller(BackgroundJob):
         return index
 
 
+def _needs_submission_scan(assignment, category, submitted_since):
+    # Mirrors the checks in poll_assignments for assignments whose full submission list will be read.
+    submission_types = getattr(assignment, 'submission_types', [])
+    if not getattr(assignment, 'published', None) or not getattr(assignment, 'has_submitted_submissions', False):
+        return False
+    if 'discussion_topic' in submission_types:
+        return False
+    if not category:
+        return 'online_url' in submission_types or 'online_upload' in submission_types
+    return not submitted_since or category.updated_at > submitted_since
+
+
 def _format_course(course):
     return f'course {course.canvas_course_id}, {course.canvas_api_domain}'
+
+
+def _get_membership_hash(canvas_user_ids):
+    return hashlib.sha256(','.join(str(i) for i in sorted(canvas_user_ids)).encode()).hexdigest()
+
+
+def _get_etags(cursors, resource):
+    cursor = cursors.get(resource)
+    return cursor and cursor.etags
+
+
+def _get_since(cursors, resource):
+    # Overlap with the previous sync window to allow for clock skew and for changes committed mid-poll.
+    cursor = cursors.get(resource)
+    if cursor and cursor.last_synced_at:
+        return cursor.last_synced_at - timedelta(seconds=app.config['CANVAS_POLLER_SYNC_OVERLAP_SECONDS'])
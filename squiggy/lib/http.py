@@ -23,8 +23,8 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from contextlib import contextmanager
 import csv
-import tempfile
 import urllib
 
 from flask import Response
@@ -91,11 +91,14 @@ def response_with_csv_download(rows, filename_prefix, fieldnames=None):
     return response
 
 
-@mock_open_file(path_to_file='mock_file_upload/the_gift.txt')
-def retrieve_to_file(url):
-    file = tempfile.NamedTemporaryFile()
-    urllib.request.urlretrieve(url, file.name)
-    return file
+@mock_open_file(path_to_file='mock_file_upload/the_gift.txt', mode='rb')
+@contextmanager
+def open_url_stream(url):
+    """Open a file-like stream of the response body, which is read as it downloads rather than held in memory."""
+    with requests.get(url, stream=True, timeout=(10, 60)) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        yield response.raw
 
 
 def sanitize_headers(headers):
@@ -0,0 +1,164 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import importlib.util
+import io
+import multiprocessing
+import tempfile
+from threading import Lock
+
+from flask import current_app as app
+from squiggy.lib.aws import download_from_s3, get_s3_https_url, upload_preview_to_s3
+from squiggy.lib.previews import get_s3_key_prefix
+from squiggy.lib.util import utc_now
+from squiggy.logger import logger
+from squiggy.models.asset import Asset
+from squiggy.models.stored_file import StoredFile
+
+
+"""In-process preview engine for common image types and PDFs. Rendering happens in a pool of worker processes; the
+results go to S3 and on to the asset by way of update_preview, as they would from the preview service callback."""
+
+
+IMAGE_MIME_TYPES = ['image/bmp', 'image/gif', 'image/jpeg', 'image/png', 'image/tiff']
+PDF_MIME_TYPE = 'application/pdf'
+
+_pool = None
+_pool_lock = Lock()
+
+
+def generate_local_previews(asset_id, object_url):
+    # Returns False, and the preview service gets the job, unless previews were made here.
+    asset = Asset.find_by_id(asset_id)
+    if not asset or asset.asset_type != 'file' or not _is_supported(asset.mime):
+        return False
+    stored_file = asset.content_hash and StoredFile.find(asset.course_id, asset.content_hash)
+    if not stored_file or not stored_file.size or stored_file.size > app.config['PREVIEWS_LOCAL_MAX_BYTES']:
+        return False
+    try:
+        with tempfile.NamedTemporaryFile() as source:
+            download_from_s3(object_url, source)
+            source.flush()
+            previews = _get_pool().submit(
+                render_previews,
+                path=source.name,
+                mime=asset.mime,
+                image_width=app.config['PREVIEWS_LOCAL_IMAGE_WIDTH'],
+                thumbnail_size=app.config['PREVIEWS_LOCAL_THUMBNAIL_SIZE'],
+            ).result(timeout=app.config['PREVIEWS_LOCAL_TIMEOUT_SECONDS'])
+        key_prefix = f"{get_s3_key_prefix(asset.course_id, 'asset')}/previews/{asset.id}/{utc_now().strftime('%Y-%m-%d_%H%M%S')}"
+        image_url = upload_preview_to_s3(previews['image'], previews['content_type'], f"{key_prefix}-image.{previews['extension']}")
+        thumbnail_url = upload_preview_to_s3(previews['thumbnail'], previews['content_type'], f"{key_prefix}-thumbnail.{previews['extension']}")
+    except Exception as e:
+        logger.warning(f'Local preview generation failed for asset {asset_id}, will fall back to the preview service: {e}')
+        if isinstance(e, BrokenProcessPool):
+            _reset_pool()
+        return False
+
+    metadata = {
+        'image_height': previews['image_height'],
+        'image_width': previews['image_width'],
+        'updatedAt': utc_now().isoformat(),
+    }
+    asset.update_preview(
+        preview_status='done',
+        thumbnail_url=thumbnail_url,
+        image_url=image_url,
+        pdf_url=get_s3_https_url(object_url) if asset.mime == PDF_MIME_TYPE else None,
+        metadata=metadata,
+    )
+    logger.info(f'Generated previews locally for asset {asset_id}')
+    return True
+
+
+def render_previews(path, mime, image_width, thumbnail_size):
+    # Runs in a worker process, without app context.
+    from PIL import Image, ImageOps
+    if mime == PDF_MIME_TYPE:
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            page = pdf[0]
+            image = page.render(scale=image_width / page.get_width()).to_pil()
+        finally:
+            pdf.close()
+    else:
+        with Image.open(path) as opened:
+            # Only the first frame of an animated GIF.
+            image = ImageOps.exif_transpose(opened)
+            image.load()
+    if image.width > image_width:
+        image = image.resize((image_width, max(1, round(image.height * image_width / image.width))), Image.LANCZOS)
+    thumbnail = image.copy()
+    thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+    # Keep transparency where there is any; photos and documents are smaller as JPEG.
+    image_format = 'PNG' if image.mode in ('LA', 'P', 'RGBA') else 'JPEG'
+    return {
+        'content_type': f'image/{image_format.lower()}',
+        'extension': image_format.lower(),
+        'image': _to_bytes(image, image_format),
+        'image_height': image.height,
+        'image_width': image.width,
+        'thumbnail': _to_bytes(thumbnail, image_format),
+    }
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if not _pool:
+            # Spawned rather than forked: this process runs threads, and a forked child could inherit a held lock.
+            _pool = ProcessPoolExecutor(
+                max_workers=app.config['PREVIEWS_LOCAL_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    return _pool
+
+
+def _is_supported(mime):
+    if importlib.util.find_spec('PIL') is None:
+        return False
+    if mime == PDF_MIME_TYPE:
+        return importlib.util.find_spec('pypdfium2') is not None
+    return mime in IMAGE_MIME_TYPES
+
+
+def _reset_pool():
+    # A worker died, say of a file too big for its memory. The pool takes no more work, so start another.
+    global _pool
+    with _pool_lock:
+        if _pool:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def _to_bytes(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format=image_format)
+    return output.getvalue()
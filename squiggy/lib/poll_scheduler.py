@@ -0,0 +1,103 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from datetime import timedelta
+import random
+
+from flask import current_app as app
+from squiggy.lib.util import utc_now
+from squiggy.models.course import Course
+
+
+"""Schedule each course's next poll according to how much is going on in it.
+
+Each signal is scored from 0 (cold) to 1 (hot), and their weighted sum is the course's priority. The poll interval
+slides, on a log scale, from CANVAS_POLLER_MAX_INTERVAL_MINUTES at priority 0 down to CANVAS_POLLER_MIN_INTERVAL_MINUTES
+at priority 1.
+"""
+
+
+def get_next_due_at(assignments, now=None):
+    # The due date nearest to now, whether just past (late submissions trickle in) or coming up.
+    now = now or utc_now()
+    due_dates = [getattr(a, 'due_at_date', None) for a in assignments if getattr(a, 'published', None)]
+    return min((d for d in due_dates if d), key=lambda d: abs(d - now), default=None)
+
+
+def get_poll_priority(signals):
+    weights = app.config['CANVAS_POLLER_PRIORITY_WEIGHTS']
+    return min(1.0, sum(weights.get(key, 0) * value for key, value in signals.items()))
+
+
+def get_poll_interval(priority):
+    min_minutes = app.config['CANVAS_POLLER_MIN_INTERVAL_MINUTES']
+    max_minutes = app.config['CANVAS_POLLER_MAX_INTERVAL_MINUTES']
+    return timedelta(minutes=max_minutes * (min_minutes / max_minutes) ** priority)
+
+
+def schedule_next_poll(course, next_due_at, polled_since):
+    now = utc_now()
+    poll_signals = Course.get_poll_signals(course.id, polled_since)
+    # Exponentially weighted average of how often polls find changes.
+    decay = app.config['CANVAS_POLLER_CHANGE_RATE_DECAY']
+    poll_change_rate = decay * (course.poll_change_rate or 0) + (1 - decay) * (1 if poll_signals['has_changes'] else 0)
+    signals = {
+        'activity': _recency_score(poll_signals['last_user_activity'], now),
+        'changeRate': poll_change_rate,
+        'dueDate': _recency_score(next_due_at, now),
+        'launch': _recency_score(course.last_launched_at, now),
+    }
+    poll_priority = get_poll_priority(signals)
+    return Course.update_poll_schedule(
+        course_id=course.id,
+        next_due_at=next_due_at,
+        next_poll_at=now + get_poll_interval(poll_priority),
+        poll_change_rate=poll_change_rate,
+        poll_priority=poll_priority,
+    )
+
+
+def schedule_poll_retry(course):
+    # After consecutive failures, wait twice as long each time, up to the interval of the coldest course. Jitter keeps
+    # courses that failed together, say during a Canvas outage, from all coming due again at once.
+    poll_failures = (course.poll_failures or 0) + 1
+    retry_minutes = app.config['CANVAS_POLLER_RETRY_MINUTES'] * (2 ** (poll_failures - 1)) * random.uniform(1, 1.5)
+    retry_minutes = min(retry_minutes, app.config['CANVAS_POLLER_MAX_INTERVAL_MINUTES'])
+    return Course.update_poll_schedule(
+        course_id=course.id,
+        next_due_at=course.next_due_at,
+        next_poll_at=utc_now() + timedelta(minutes=retry_minutes),
+        poll_change_rate=course.poll_change_rate,
+        poll_failures=poll_failures,
+        poll_priority=course.poll_priority,
+    )
+
+
+def _recency_score(timestamp, now):
+    # Halves with every CANVAS_POLLER_PRIORITY_HALF_LIFE_HOURS between the timestamp and now, in either direction.
+    if not timestamp:
+        return 0
+    hours = abs((now - timestamp).total_seconds()) / 3600
+    return 0.5 ** (hours / app.config['CANVAS_POLLER_PRIORITY_HALF_LIFE_HOURS'])
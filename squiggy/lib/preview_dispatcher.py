@@ -0,0 +1,147 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import current_thread, Lock
+from time import sleep
+
+from flask import current_app as app
+from squiggy.lib.background_job import BackgroundJob
+from squiggy.lib.previews import generate_previews
+from squiggy.logger import logger
+from squiggy.models.asset import Asset
+from squiggy.models.preview_request import PreviewRequest
+
+
+"""Sends queued preview-service requests. Creating an asset only adds a row to preview_requests; a background thread
+claims due rows in batches, posts them to the preview service a few at a time, and retries failures with backoff."""
+
+
+_lock = Lock()
+_metrics = {
+    'abandoned': 0,
+    'failed': 0,
+    'sent': 0,
+}
+
+
+def dispatch_preview_requests():
+    preview_requests = PreviewRequest.claim(
+        limit=app.config['PREVIEWS_DISPATCH_BATCH_SIZE'],
+        lease_seconds=app.config['PREVIEWS_DISPATCH_LEASE_SECONDS'],
+    )
+    if not preview_requests:
+        return 0
+    flask_app = app._get_current_object()
+    timeout = app.config['PREVIEWS_REQUEST_TIMEOUT_SECONDS']
+
+    def _send(preview_request):
+        with flask_app.app_context():
+            response = generate_previews(
+                object_id=preview_request['object_id'],
+                object_type=preview_request['object_type'],
+                object_url=preview_request['object_url'],
+                timeout=timeout,
+            )
+            return None if response else str(getattr(response, 'exception', 'No response from preview service'))
+
+    max_workers = min(app.config['PREVIEWS_DISPATCH_CONCURRENCY'], len(preview_requests))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'{current_thread().name}.send') as executor:
+        errors = list(executor.map(_send, preview_requests))
+
+    sent_ids = [preview_request['id'] for preview_request, error in zip(preview_requests, errors) if not error]
+    PreviewRequest.delete(sent_ids)
+    _increment('sent', len(sent_ids))
+    for preview_request, error in zip(preview_requests, errors):
+        if error:
+            _increment('failed')
+            if preview_request['attempts'] < app.config['PREVIEWS_DISPATCH_MAX_ATTEMPTS']:
+                PreviewRequest.retry_later(preview_request['id'], delay_seconds=_get_retry_delay(preview_request['attempts']), error=error)
+            else:
+                _abandon(preview_request, error)
+    return len(preview_requests)
+
+
+def get_preview_dispatcher_metrics():
+    queue_stats = PreviewRequest.get_queue_stats()
+    oldest_age_seconds = queue_stats['oldest_age_seconds']
+    with _lock:
+        return {
+            **_metrics,
+            'oldestAgeSeconds': max(0, round(oldest_age_seconds)) if oldest_age_seconds is not None else None,
+            'queueDepth': queue_stats['depth'],
+        }
+
+
+def launch_preview_dispatcher():
+    PreviewDispatcher().launch()
+
+
+class PreviewDispatcher(BackgroundJob):
+
+    preview_dispatcher = None
+
+    def __init__(self, **kwargs):
+        super().__init__(thread_name='preview_dispatcher', **kwargs)
+
+    def launch(self):
+        if not self.preview_dispatcher and app.config['PREVIEWS_ENABLED']:
+            logger.info('Launching preview dispatcher')
+            PreviewDispatcher.start()
+
+    def run(self):
+        # Claims skip rows locked by other processes, so every process runs a dispatcher and no advisory lock is needed.
+        while True:
+            # A full batch suggests more are due, so go again without waiting.
+            if dispatch_preview_requests() < app.config['PREVIEWS_DISPATCH_BATCH_SIZE']:
+                sleep(app.config['PREVIEWS_DISPATCH_INTERVAL_SECONDS'])
+
+    @classmethod
+    def start(cls):
+        cls.preview_dispatcher = PreviewDispatcher()
+        cls.preview_dispatcher.run_async()
+
+
+def _abandon(preview_request, error):
+    logger.error(f"""Giving up on preview request after {preview_request['attempts']} attempts:
+        object_type = {preview_request['object_type']}
+        object_id = {preview_request['object_id']}
+        object_url = {preview_request['object_url']}
+        error = {error}
+    """)
+    PreviewRequest.delete([preview_request['id']])
+    _increment('abandoned')
+    asset = preview_request['object_type'] == 'asset' and Asset.find_by_id(preview_request['object_id'])
+    if asset:
+        asset.update_preview(preview_status='error')
+
+
+def _get_retry_delay(attempts):
+    return min(app.config['PREVIEWS_DISPATCH_RETRY_SECONDS'] * 2 ** (attempts - 1), app.config['PREVIEWS_DISPATCH_MAX_RETRY_SECONDS'])
+
+
+def _increment(key, value=1):
+    with _lock:
+        _metrics[key] += value
@@ -37,9 +37,14 @@ from squiggy.lib.whiteboard_util import to_png_file
 from squiggy.logger import logger
 
 
-def generate_previews(object_id, object_url, object_type='asset'):
+def generate_previews(object_id, object_url, object_type='asset', timeout=None):
     if not app.config['PREVIEWS_ENABLED']:
         return True
+    if object_type == 'asset' and app.config['PREVIEWS_LOCAL_ENABLED']:
+        # Imported here because local_previews needs models which, in turn, need this module.
+        from squiggy.lib.local_previews import generate_local_previews
+        if generate_local_previews(asset_id=object_id, object_url=object_url):
+            return True
     api_prefix = app.config['PREVIEWS_CALLBACK_API_PREFIX'] or app.config['API_PREFIX']
     post_back_urls = {
         'asset': f'{api_prefix}/previews/callback',
@@ -54,6 +59,7 @@ def generate_previews(object_id, object_url, object_type='asset'):
             'url': object_url,
             'postBackUrl': post_back_urls[object_type],
         },
+        timeout=timeout,
     )
     if not response:
         logger.error(f"""Failed to generate preview:
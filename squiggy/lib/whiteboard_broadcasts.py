@@ -0,0 +1,182 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from threading import Lock
+from time import sleep
+
+from flask import current_app as app
+from flask_socketio import emit
+from squiggy.lib.background_job import BackgroundJob
+from squiggy.logger import logger
+
+
+"""Outbound batching of whiteboard element updates. Rather than one emit per update, updates to a whiteboard are held
+per socket.io room for WHITEBOARD_BROADCAST_FRAME_MILLISECONDS and go out as one upsert_whiteboard_elements emit, in
+which only the latest update to each element survives. Every update names the socket it came from, so that senders can
+skip their own. A client with more than WHITEBOARD_BROADCAST_MAX_QUEUED_PACKETS packets waiting is skipped until it
+catches up, then sent the latest of what it missed in one emit."""
+
+
+_lock = Lock()
+_metrics = {
+    'deferred': 0,
+    'emits': 0,
+    'superseded': 0,
+    'updates': 0,
+}
+# Latest update per element uuid, per (namespace, room), awaiting the next frame.
+_pending_frames = {}
+# Latest update per element uuid, per (namespace, socket id) of a slow client, awaiting its catch-up.
+_slow_clients = {}
+
+
+def queue_whiteboard_element_broadcast(whiteboard_elements, namespace, room, socket_id):
+    if not app.config['WHITEBOARD_BROADCAST_FRAME_MILLISECONDS']:
+        emit(
+            'upsert_whiteboard_elements',
+            whiteboard_elements,
+            include_self=False,
+            namespace=namespace,
+            skip_sid=socket_id,
+            to=room,
+        )
+        return
+    with _lock:
+        frame = _pending_frames.setdefault((namespace, room), {})
+        for index, whiteboard_element in enumerate(whiteboard_elements):
+            update = {**whiteboard_element, 'socketId': socket_id}
+            # Updates with no uuid, which clients ignore anyway, are passed along as they are.
+            uuid = _get_uuid(update) or f'{socket_id}-{_metrics["updates"]}-{index}'
+            _merge(frame, uuid, update)
+        _metrics['updates'] += len(whiteboard_elements)
+
+
+def discard_whiteboard_element_broadcasts(namespace, room, uuids):
+    # Deleted elements must not come back to life when the frame goes out. Slow clients will get the deletion anyway.
+    with _lock:
+        for updates in [_pending_frames.get((namespace, room), {})] + list(_slow_clients.values()):
+            for uuid in uuids:
+                updates.pop(uuid, None)
+
+
+def flush_whiteboard_broadcasts(server):
+    # The server is the python-socketio Server. Emits one frame per room, to each client in the room on this process but
+    # the slow ones, then catches up slow clients that have drained.
+    with _lock:
+        frames = dict(_pending_frames)
+        _pending_frames.clear()
+    emits = 0
+    for (namespace, room), frame in frames.items():
+        slow_socket_ids = []
+        for socket_id, eio_socket_id in list(server.manager.get_participants(namespace, room)):
+            with _lock:
+                is_slow = (namespace, socket_id) in _slow_clients
+            if is_slow or _get_queued_packet_count(server, eio_socket_id) > app.config['WHITEBOARD_BROADCAST_MAX_QUEUED_PACKETS']:
+                slow_socket_ids.append(socket_id)
+                with _lock:
+                    missed = _slow_clients.setdefault((namespace, socket_id), {})
+                    for uuid, update in frame.items():
+                        _merge(missed, uuid, update)
+                    _metrics['deferred'] += 1
+        server.emit('upsert_whiteboard_elements', list(frame.values()), namespace=namespace, skip_sid=slow_socket_ids or None, to=room)
+        emits += 1
+    with _lock:
+        slow_clients = list(_slow_clients.keys())
+    for namespace, socket_id in slow_clients:
+        eio_socket_id = server.manager.eio_sid_from_sid(socket_id, namespace)
+        if eio_socket_id is None:
+            # Disconnected
+            with _lock:
+                _slow_clients.pop((namespace, socket_id), None)
+        elif _get_queued_packet_count(server, eio_socket_id) <= app.config['WHITEBOARD_BROADCAST_MAX_QUEUED_PACKETS']:
+            with _lock:
+                missed = _slow_clients.pop((namespace, socket_id), {})
+            server.emit('upsert_whiteboard_elements', list(missed.values()), namespace=namespace, to=socket_id)
+            emits += 1
+    with _lock:
+        _metrics['emits'] += emits
+    return emits
+
+
+def get_whiteboard_broadcast_metrics():
+    with _lock:
+        return {
+            **_metrics,
+            'slowClients': len(_slow_clients),
+        }
+
+
+def launch_whiteboard_broadcaster():
+    WhiteboardBroadcaster().launch()
+
+
+class WhiteboardBroadcaster(BackgroundJob):
+
+    whiteboard_broadcaster = None
+
+    def __init__(self, **kwargs):
+        super().__init__(thread_name='whiteboard_broadcaster', **kwargs)
+
+    def launch(self):
+        if not self.whiteboard_broadcaster and app.config['WHITEBOARD_BROADCAST_FRAME_MILLISECONDS']:
+            logger.info('Launching whiteboard broadcaster')
+            WhiteboardBroadcaster.start()
+
+    def run(self):
+        # Every process batches the updates it receives; the emits reach other processes through the message queue.
+        server = app.extensions['socketio'].server
+        while True:
+            sleep(app.config['WHITEBOARD_BROADCAST_FRAME_MILLISECONDS'] / 1000)
+            flush_whiteboard_broadcasts(server)
+
+    @classmethod
+    def start(cls):
+        cls.whiteboard_broadcaster = WhiteboardBroadcaster()
+        cls.whiteboard_broadcaster.run_async()
+
+
+def _get_queued_packet_count(server, eio_socket_id):
+    # Packets are queued per Engine.IO socket until the transport takes them, so a long queue means a slow client.
+    eio_socket = server.eio.sockets.get(eio_socket_id)
+    return eio_socket.queue.qsize() if eio_socket else 0
+
+
+def _get_uuid(update):
+    return update.get('uuid') or (update.get('element') or {}).get('uuid')
+
+
+def _merge(updates, uuid, update):
+    # A full element supersedes any earlier update; a patch is merged into it. Either way, the element keeps its place.
+    pending_update = updates.get(uuid)
+    if pending_update:
+        _metrics['superseded'] += 1
+        if 'patch' in update:
+            key = 'patch' if 'patch' in pending_update else 'element'
+            merged = {**pending_update, key: {**pending_update[key], **update['patch']}, 'version': update.get('version')}
+            if pending_update['socketId'] != update['socketId']:
+                # Senders skip their own updates, so one carrying another sender's changes must go to everyone.
+                merged['socketId'] = None
+            update = merged
+    updates[uuid] = update
@@ -0,0 +1,495 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import fcntl
+from glob import glob
+import json
+import os
+import socket
+import tempfile
+from threading import Lock
+from time import sleep, time
+from uuid import uuid4
+
+from dateutil.parser import isoparse
+from flask import current_app as app
+import redis
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.sql import text
+from squiggy import db
+from squiggy.lib.background_job import BackgroundJob
+from squiggy.lib.socket_io_util import get_queue_url
+from squiggy.lib.util import isoformat, utc_now
+from squiggy.lib.whiteboard_housekeeping import WhiteboardHousekeeping
+from squiggy.logger import logger
+from squiggy.models.activity import Activity
+from squiggy.models.asset import Asset
+from squiggy.models.whiteboard_element import WhiteboardElement
+from squiggy.models.whiteboard_session import WhiteboardSession
+
+
+"""Write-behind buffer of whiteboard edits. Dragging or resizing an object sends an upsert on every mouse move; each is
+broadcast to the room at once, but only the latest state of each element is kept in memory, and a background thread
+saves the lot every WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS. An edit is either a full element or a patch of the
+properties changed since the version the client holds; patches are merged into the saved element with jsonb ||.
+Buffered edits are appended to a journal first, so that edits of a process that dies before saving them are replayed
+by another. The journal is kept in Redis when the app has one (see REDIS_HOST), where it outlives the host; otherwise in
+files under WHITEBOARD_EDITS_JOURNAL_DIR, which only a process on the same host will replay.
+
+The buffer is per process. flush_whiteboard_edits() saves this process's buffer only, so a request served by another
+worker may read elements up to one flush interval behind edits buffered here."""
+
+
+# A Redis journal whose owner has not checked in for this long is taken for abandoned. Journals are looked for at
+# the same interval.
+JOURNAL_HEARTBEAT_SECONDS = 30
+
+_flush_lock = Lock()
+_journal = None
+_lock = Lock()
+# Latest edit per element uuid, per whiteboard.
+_pending_edits = {}
+# User per socket, per whiteboard, for whiteboard session updates.
+_pending_sockets = {}
+
+
+def buffer_whiteboard_elements(whiteboard_elements, whiteboard_id, socket_id, user_id):
+    # Each of whiteboard_elements has course_id, user_id, uuid and either asset_id and the full element or, from a client
+    # holding the element at version from_version, a patch of changed properties. Returns, per element, its version after
+    # the edit and, should the client have patched an outdated version, a snapshot of the element; None for a patch to
+    # an element not on the whiteboard.
+    edited_at = isoformat(utc_now())
+    uuids = [whiteboard_element['uuid'] for whiteboard_element in whiteboard_elements]
+    saved_versions = {}
+    while True:
+        with _lock:
+            pending = _pending_edits.setdefault(whiteboard_id, {})
+            unknown_uuids = [uuid for uuid in uuids if uuid not in pending and uuid not in saved_versions]
+            if not unknown_uuids:
+                results = []
+                edits = []
+                for whiteboard_element in whiteboard_elements:
+                    uuid = whiteboard_element['uuid']
+                    version = pending[uuid]['version'] if uuid in pending else saved_versions[uuid]
+                    if 'patch' in whiteboard_element and version is None:
+                        results.append(None)
+                        continue
+                    edit = {k: v for k, v in whiteboard_element.items() if k != 'from_version'}
+                    edit.update({'edited_at': edited_at, 'version': (version or 0) + 1, 'whiteboard_id': whiteboard_id})
+                    # An element keeps its place in line, and so its z-index if new, however often it is edited.
+                    pending[uuid] = _fold(pending.get(uuid), edit)
+                    edits.append(edit)
+                    is_outdated = 'patch' in edit and whiteboard_element.get('from_version') != version
+                    results.append({'is_outdated': is_outdated, 'uuid': uuid, 'version': edit['version']})
+                if app.config['WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS']:
+                    _get_journal().append(edits)
+                _pending_sockets.setdefault(whiteboard_id, {})[socket_id] = user_id
+                break
+        # Look up the saved versions of elements with no pending edit, outside the lock. Elements not on the whiteboard
+        # have no version.
+        saved_versions.update({uuid: None for uuid in unknown_uuids})
+        saved_versions.update(WhiteboardElement.find_versions(uuids=unknown_uuids, whiteboard_id=whiteboard_id))
+    if not app.config['WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS']:
+        flush_whiteboard_edits()
+    outdated_uuids = [r['uuid'] for r in results if r and r.pop('is_outdated')]
+    if outdated_uuids:
+        snapshots = _get_snapshots(uuids=outdated_uuids, whiteboard_id=whiteboard_id)
+        for result in results:
+            if result and result['uuid'] in snapshots:
+                result.update(snapshots[result['uuid']])
+    return results
+
+
+def flush_whiteboard_edits():
+    # Saves the edits buffered by this process, not those of other workers. Flushes are serialized; otherwise an older
+    # snapshot could be saved over a newer one. Each whiteboard is saved on its own, so that trouble on one does not
+    # hold up the rest.
+    with _flush_lock:
+        with _lock:
+            edits_per_whiteboard = {whiteboard_id: list(edits.values()) for whiteboard_id, edits in _pending_edits.items() if edits}
+            sockets_per_whiteboard = {whiteboard_id: dict(sockets) for whiteboard_id, sockets in _pending_sockets.items()}
+            _pending_edits.clear()
+            _pending_sockets.clear()
+            # With nothing buffered, the open segment is empty and there is nothing to seal.
+            segments = _journal.seal() if _journal and edits_per_whiteboard else []
+        if not edits_per_whiteboard:
+            return 0
+        error = None
+        saved_count = 0
+        for whiteboard_id, edits in edits_per_whiteboard.items():
+            sockets = sockets_per_whiteboard.get(whiteboard_id, {})
+            try:
+                saved_count += _save_edits(edits=edits, whiteboard_id=whiteboard_id)
+                for socket_id, user_id in sockets.items():
+                    WhiteboardSession.update_updated_at(socket_id=socket_id, user_id=user_id, whiteboard_id=whiteboard_id)
+            except Exception as e:
+                # The database is likely unavailable. Put the edits back, under any made meanwhile, for the next attempt.
+                db.session.rollback()
+                _requeue(edits=edits, sockets=sockets, whiteboard_id=whiteboard_id)
+                error = e
+        if error:
+            # The journal segments are kept until a flush succeeds.
+            raise error
+        if _journal:
+            _journal.discard(segments)
+        return saved_count
+
+
+def get_pending_edit_count(whiteboard_id):
+    with _lock:
+        return len(_pending_edits.get(whiteboard_id, {}))
+
+
+def recover_whiteboard_edits():
+    # Replays the journals of processes that died with edits unsaved. Journals of live processes are left alone. An edit
+    # is skipped if its element has been saved since.
+    recovered = 0
+    try:
+        for edits in _find_abandoned_journals():
+            edits_per_whiteboard = {}
+            for edit in edits:
+                pending = edits_per_whiteboard.setdefault(edit['whiteboard_id'], {})
+                pending[edit['uuid']] = _fold(pending.get(edit['uuid']), edit)
+            for whiteboard_id, edits in edits_per_whiteboard.items():
+                edits = _skip_superseded_edits(list(edits.values()), whiteboard_id)
+                if edits:
+                    recovered += _save_edits(edits=edits, whiteboard_id=whiteboard_id)
+    except redis.RedisError as e:
+        # Left for the next attempt.
+        logger.warning(f'Failed to recover whiteboard edit journals from Redis: {e}')
+    if recovered:
+        logger.warning(f'Recovered {recovered} unsaved whiteboard edits from journals of dead processes')
+    return recovered
+
+
+def save_whiteboard_elements(whiteboard_elements, whiteboard_id):
+    # Each of whiteboard_elements has asset_id, course_id, user_id, uuid and either element or patch; and, optionally, the
+    # version it brings the element to. Returns API JSON of the full elements saved.
+    upserts = [w for w in whiteboard_elements if 'patch' not in w]
+    results, created_uuids = WhiteboardElement.upsert_all(whiteboard_elements=upserts, whiteboard_id=whiteboard_id)
+    patched_uuids = WhiteboardElement.patch_all(patches=[w for w in whiteboard_elements if 'patch' in w], whiteboard_id=whiteboard_id)
+    if results or patched_uuids:
+        created = {w['uuid']: w for w in upserts if w['asset_id'] and w['uuid'] in created_uuids}
+        _create_whiteboard_add_asset_activities(whiteboard_elements=list(created.values()), whiteboard_id=whiteboard_id)
+        WhiteboardHousekeeping.queue_for_preview_image(whiteboard_id)
+    return results
+
+
+def launch_whiteboard_edit_flusher():
+    WhiteboardEditFlusher().launch()
+
+
+class WhiteboardEditFlusher(BackgroundJob):
+
+    whiteboard_edit_flusher = None
+
+    def __init__(self, **kwargs):
+        super().__init__(thread_name='whiteboard_edit_flusher', **kwargs)
+
+    def launch(self):
+        if not self.whiteboard_edit_flusher and app.config['WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS']:
+            logger.info('Launching whiteboard edit flusher')
+            WhiteboardEditFlusher.start()
+
+    def run(self):
+        # Every process flushes its own buffer, so there is no advisory lock here. Another process may die, or its host
+        # be replaced, while this one runs; so its journal is looked for again now and then.
+        recover_whiteboard_edits()
+        recovered_at = time()
+        while True:
+            sleep(app.config['WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS'] / 1000)
+            if _journal:
+                _journal.keep_alive()
+            flush_whiteboard_edits()
+            if time() - recovered_at > JOURNAL_HEARTBEAT_SECONDS:
+                recover_whiteboard_edits()
+                recovered_at = time()
+
+    @classmethod
+    def start(cls):
+        cls.whiteboard_edit_flusher = WhiteboardEditFlusher()
+        cls.whiteboard_edit_flusher.run_async()
+
+
+class WhiteboardEditJournal:
+    # Append-only log of buffered edits, one JSON line per edit, in numbered segments. A flush seals the open segment;
+    # sealed segments are deleted once their edits are saved. The owning process holds an exclusive lock on the
+    # journal's lock file for as long as it runs.
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.prefix = os.path.join(directory, f'{socket.gethostname()}-{os.getpid()}')
+        self.lock_path = f'{self.prefix}.lock'
+        self.lock_file = open(self.lock_path, 'a')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.sealed = []
+        self.sequence = 0
+        self.segment = self._open_segment()
+
+    def append(self, edits):
+        # Written through to the OS, which is enough to survive the process; we do not fsync on every mouse move.
+        self.segment.write(''.join(json.dumps(edit) + '\n' for edit in edits))
+        self.segment.flush()
+
+    def discard(self, segments):
+        for segment in segments:
+            os.remove(segment)
+            self.sealed.remove(segment)
+
+    def keep_alive(self):
+        # The lock on the lock file is held until the process dies.
+        pass
+
+    def seal(self):
+        self.segment.close()
+        self.sealed.append(self.segment.name)
+        self.segment = self._open_segment()
+        return list(self.sealed)
+
+    def _open_segment(self):
+        self.sequence += 1
+        return open(f'{self.prefix}.{self.sequence:010d}.log', 'a')
+
+    @classmethod
+    def find_abandoned(cls, directory):
+        # Yields the edits of each journal whose lock file is not locked, and deletes the journal once the caller is done
+        # with them. A live process holds the lock on its own.
+        for lock_path in sorted(glob(os.path.join(directory, '*.lock'))):
+            with open(lock_path, 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+                segments = sorted(glob(f'{lock_path[:-len(".lock")]}.*.log'))
+                yield [edit for segment in segments for edit in _read_segment(segment)]
+                for segment in segments:
+                    os.remove(segment)
+                os.remove(lock_path)
+
+
+class RedisWhiteboardEditJournal:
+    # As WhiteboardEditJournal, but each segment is a Redis list and the journal is kept alive by a heartbeat key that
+    # expires JOURNAL_HEARTBEAT_SECONDS after the owner last checked in. Journals are listed in a Redis set. Should Redis
+    # be unavailable, edits are still buffered and saved; they just go unjournaled meanwhile.
+
+    journals_key = 'whiteboard_edits:journals'
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        # Not host and pid alone, which a replacement container may well reuse.
+        self.prefix = f'whiteboard_edits:{socket.gethostname()}-{os.getpid()}-{uuid4().hex}'
+        self.sealed = []
+        self.sequence = 1
+        self.keep_alive()
+        try:
+            self.redis.sadd(self.journals_key, self.prefix)
+        except redis.RedisError as e:
+            logger.warning(f'Failed to register whiteboard edit journal {self.prefix}: {e}')
+
+    def append(self, edits):
+        try:
+            self.redis.rpush(self._segment_key(), *[json.dumps(edit) for edit in edits])
+        except redis.RedisError as e:
+            logger.warning(f'Failed to journal {len(edits)} whiteboard edits in Redis: {e}')
+
+    def discard(self, segments):
+        try:
+            self.redis.delete(*segments)
+        except redis.RedisError as e:
+            # Should the process die, recovery skips whatever has been saved since.
+            logger.warning(f'Failed to discard whiteboard edit journal segments in Redis: {e}')
+        for segment in segments:
+            self.sealed.remove(segment)
+
+    def keep_alive(self):
+        try:
+            self.redis.set(f'{self.prefix}:heartbeat', 'alive', ex=JOURNAL_HEARTBEAT_SECONDS)
+        except redis.RedisError as e:
+            logger.warning(f'Failed to refresh heartbeat of whiteboard edit journal {self.prefix}: {e}')
+
+    def seal(self):
+        self.sealed.append(self._segment_key())
+        self.sequence += 1
+        return list(self.sealed)
+
+    def _segment_key(self):
+        return f'{self.prefix}:{self.sequence:010d}'
+
+    @classmethod
+    def find_abandoned(cls, redis_client):
+        # Yields the edits of each journal whose heartbeat has expired, and deletes the journal once the caller is done
+        # with them. Setting the expired heartbeat claims the journal, so that no other process replays it meanwhile.
+        for prefix in sorted(redis_client.smembers(cls.journals_key)):
+            if not redis_client.set(f'{prefix}:heartbeat', 'recovering', nx=True, ex=JOURNAL_HEARTBEAT_SECONDS):
+                continue
+            segments = sorted(redis_client.scan_iter(match=f'{prefix}:[0-9]*'))
+            edits = []
+            for segment in segments:
+                edits += _read_lines(redis_client.lrange(segment, 0, -1), segment)
+            yield edits
+            if segments:
+                redis_client.delete(*segments)
+            redis_client.delete(f'{prefix}:heartbeat')
+            redis_client.srem(cls.journals_key, prefix)
+
+
+def _create_whiteboard_add_asset_activities(whiteboard_elements, whiteboard_id):
+    asset_ids = list({whiteboard_element['asset_id'] for whiteboard_element in whiteboard_elements})
+    if not asset_ids:
+        return
+    assets_by_id = {asset.id: asset for asset in Asset.query.filter(Asset.id.in_(asset_ids), Asset.deleted_at.is_(None)).all()}
+    with Activity.batch():
+        for whiteboard_element in whiteboard_elements:
+            asset = assets_by_id.get(whiteboard_element['asset_id'])
+            course_id = whiteboard_element['course_id']
+            user_id = whiteboard_element['user_id']
+            if asset and user_id not in [user.id for user in asset.users]:
+                whiteboard_activity = Activity.create(
+                    activity_type='whiteboard_add_asset',
+                    course_id=course_id,
+                    user_id=user_id,
+                    object_type='whiteboard',
+                    object_id=whiteboard_id,
+                    asset_id=asset.id,
+                )
+                for asset_user in asset.users:
+                    Activity.create(
+                        activity_type='get_whiteboard_add_asset',
+                        course_id=course_id,
+                        user_id=asset_user.id,
+                        object_type='whiteboard',
+                        object_id=whiteboard_id,
+                        asset_id=asset.id,
+                        actor_id=user_id,
+                        reciprocal_id=whiteboard_activity.id,
+                    )
+
+
+def _fold(pending_edit, edit):
+    # A full element replaces whatever edit is pending; a patch is merged into it, as jsonb || would.
+    if not pending_edit or 'patch' not in edit:
+        return dict(edit)
+    key = 'patch' if 'patch' in pending_edit else 'element'
+    return {
+        **pending_edit,
+        key: {**pending_edit[key], **edit['patch']},
+        'course_id': edit['course_id'],
+        'edited_at': edit['edited_at'],
+        'user_id': edit['user_id'],
+        'version': edit.get('version'),
+    }
+
+
+def _find_abandoned_journals():
+    if get_queue_url(app):
+        return RedisWhiteboardEditJournal.find_abandoned(_get_redis_client())
+    return WhiteboardEditJournal.find_abandoned(_get_journal_directory())
+
+
+def _get_journal():
+    global _journal
+    if not _journal:
+        if get_queue_url(app):
+            _journal = RedisWhiteboardEditJournal(_get_redis_client())
+        else:
+            _journal = WhiteboardEditJournal(_get_journal_directory())
+    return _journal
+
+
+def _get_journal_directory():
+    return app.config['WHITEBOARD_EDITS_JOURNAL_DIR'] or os.path.join(tempfile.gettempdir(), 'squiggy_whiteboard_edits')
+
+
+def _get_redis_client():
+    # Journaling happens under the buffer lock, so a Redis that does not answer must not hold it for long.
+    return redis.from_url(get_queue_url(app), decode_responses=True, socket_connect_timeout=1, socket_timeout=1)
+
+
+def _get_snapshots(uuids, whiteboard_id):
+    # Full elements, pending edits included, for clients to catch up from.
+    with _lock:
+        pending = {uuid: dict(edit) for uuid, edit in _pending_edits.get(whiteboard_id, {}).items() if uuid in uuids}
+    snapshots = {}
+    saved_uuids = [uuid for uuid in uuids if 'element' not in pending.get(uuid, {})]
+    saved = {w.uuid: w for w in WhiteboardElement.find_all(uuids=saved_uuids, whiteboard_id=whiteboard_id)} if saved_uuids else {}
+    for uuid in uuids:
+        edit = pending.get(uuid)
+        if edit and 'element' in edit:
+            snapshots[uuid] = {'asset_id': edit['asset_id'], 'element': edit['element'], 'version': edit['version']}
+        elif uuid in saved:
+            element = {**saved[uuid].element, **(edit['patch'] if edit else {}), 'uuid': uuid}
+            snapshots[uuid] = {'asset_id': saved[uuid].asset_id, 'element': element, 'version': edit['version'] if edit else saved[uuid].version}
+    return snapshots
+
+
+def _read_lines(lines, segment):
+    for line in lines:
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # The process may have died mid-write.
+            logger.warning(f'Skipping unreadable line in whiteboard edit journal {segment}')
+
+
+def _read_segment(path):
+    with open(path) as f:
+        yield from _read_lines(f, path)
+
+
+def _requeue(edits, sockets, whiteboard_id):
+    with _lock:
+        pending = _pending_edits.setdefault(whiteboard_id, {})
+        for edit in edits:
+            newer = pending.pop(edit['uuid'], None)
+            pending[edit['uuid']] = _fold(edit, newer) if newer else edit
+        pending_sockets = _pending_sockets.setdefault(whiteboard_id, {})
+        for socket_id, user_id in sockets.items():
+            pending_sockets.setdefault(socket_id, user_id)
+
+
+def _save_edits(edits, whiteboard_id):
+    # Edits the database rejects, e.g., those of an asset deleted meanwhile, are found one by one and dropped rather than
+    # retried forever. Returns the number saved.
+    try:
+        save_whiteboard_elements(whiteboard_elements=edits, whiteboard_id=whiteboard_id)
+        return len(edits)
+    except (DataError, IntegrityError):
+        db.session.rollback()
+    saved_count = 0
+    for edit in edits:
+        try:
+            save_whiteboard_elements(whiteboard_elements=[edit], whiteboard_id=whiteboard_id)
+            saved_count += 1
+        except (DataError, IntegrityError) as e:
+            db.session.rollback()
+            logger.error(f'Dropping whiteboard edit rejected by the database (whiteboard_id={whiteboard_id}, uuid={edit["uuid"]}): {e}')
+    return saved_count
+
+
+def _skip_superseded_edits(edits, whiteboard_id):
+    sql = 'SELECT uuid, updated_at FROM whiteboard_elements WHERE whiteboard_id = :whiteboard_id AND uuid = ANY(:uuids)'
+    params = {'uuids': [edit['uuid'] for edit in edits], 'whiteboard_id': whiteboard_id}
+    updated_at_per_uuid = {row['uuid']: row['updated_at'] for row in db.session.execute(text(sql), params)}
+    return [e for e in edits if e['uuid'] not in updated_at_per_uuid or updated_at_per_uuid[e['uuid']] < isoparse(e['edited_at'])]
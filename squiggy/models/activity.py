@@ -23,11 +23,16 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from contextlib import contextmanager
+import json
+from threading import local
+
 from flask import current_app as app
 import pytz
 from sqlalchemy import and_, func
 from sqlalchemy.dialects.postgresql import ENUM, JSON
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy.sql import text
 from squiggy import db, std_commit
 from squiggy.lib.util import isoformat, utc_now
@@ -47,6 +52,11 @@ activities_object_type = ENUM(
     create_type=False,
 )
 
+# Sequence ids are reserved in blocks that double in size, up to this limit, while a batch is open.
+ACTIVITY_ID_BLOCK_SIZE = 64
+
+_activity_batch = local()
+
 
 class Activity(Base):
     __tablename__ = 'activities'
@@ -118,6 +128,7 @@ class Activity(Base):
         actor_id=None,
         reciprocal_id=None,
         activity_metadata=None,
+        created_at=None,
     ):
         activity = cls(
             activity_type=activity_type,
@@ -130,15 +141,36 @@ class Activity(Base):
             reciprocal_id=reciprocal_id,
             activity_metadata=activity_metadata,
         )
-        db.session.add(activity)
-        user = User.find_by_id(user_id)
-        if user:
-            user.last_activity = utc_now()
-            db.session.add(user)
-        cls.recalculate_points(course_id=course_id, user_ids=[user_id])
-        std_commit()
+        activity.created_at = created_at
+        if cls.is_batch_open():
+            return cls._add_to_batch(activity)
+        with cls.batch():
+            cls._add_to_batch(activity)
         return activity
 
+    @classmethod
+    @contextmanager
+    def batch(cls):
+        # Activities created within the block are written in a single INSERT when it exits, after which last_activity
+        # and points are updated once per affected user. Each activity gets its id up front, so that reciprocal
+        # activities can refer to it. Nested batches join the outermost; an exception discards the whole batch.
+        if cls.is_batch_open():
+            yield
+            return
+        _activity_batch.activities = []
+        _activity_batch.ids = []
+        try:
+            yield
+            activities = _activity_batch.activities
+        finally:
+            _activity_batch.activities = None
+            _activity_batch.ids = None
+        cls._insert_all(activities)
+
+    @classmethod
+    def is_batch_open(cls):
+        return getattr(_activity_batch, 'activities', None) is not None
+
     @classmethod
     def create_unless_exists(cls, **kwargs):
         if cls.query.filter_by(**kwargs).count() == 0:
@@ -277,34 +309,110 @@ class Activity(Base):
     def recalculate_points(cls, course_id=None, user_ids=None):
         if not course_id and not user_ids:
             return
-        user_query = User.query
-        if course_id:
-            user_query = user_query.filter_by(course_id=course_id)
-        if user_ids:
-            user_query = user_query.filter(User.id.in_(user_ids))
-        users = user_query.all()
-        if not users:
-            return
         if not course_id:
-            course_id = users[0].course_id
-
+            user = User.query.filter(User.id.in_(user_ids)).first()
+            if not user:
+                return
+            course_id = user.course_id
         configuration = ActivityType.get_activity_type_configuration(course_id=course_id)
-        configuration_by_type = {c['type']: c for c in configuration}
-        total_scores = {}
+        weights = [c for c in configuration if c['enabled']]
+        # Points are the per-user activity counts, maintained by trigger, weighted by the course configuration.
+        user_ids_clause = 'AND u.id = ANY(:user_ids)' if user_ids else ''
+        sql = f"""
+            WITH totals AS (
+                SELECT u.id AS user_id, COALESCE(SUM(c.count * w.points), 0) AS points
+                FROM users u
+                LEFT JOIN activity_counts c ON c.user_id = u.id
+                LEFT JOIN unnest(CAST(:activity_types AS varchar[]), CAST(:points AS integer[])) AS w(activity_type, points)
+                    ON w.activity_type = CAST(c.activity_type AS varchar)
+                WHERE u.course_id = :course_id {user_ids_clause}
+                GROUP BY u.id
+            )
+            UPDATE users u SET points = t.points, updated_at = now()
+            FROM totals t
+            WHERE u.id = t.user_id AND u.points IS DISTINCT FROM t.points
+            RETURNING u.id
+        """
+        results = db.session.execute(
+            text(sql),
+            {
+                'activity_types': [w['type'] for w in weights],
+                'course_id': course_id,
+                'points': [w['points'] or 0 for w in weights],
+                'user_ids': user_ids,
+            },
+        )
+        _expire_users([row['id'] for row in results], ['points', 'updated_at'])
+        std_commit()
 
-        activity_query = cls.query.filter_by(course_id=course_id)
-        if user_ids:
-            activity_query = activity_query.filter(cls.user_id.in_(user_ids))
-        for activity in activity_query.all():
-            if configuration_by_type.get(activity.activity_type, {}).get('enabled', None):
-                score = configuration_by_type[activity.activity_type]['points']
-                total_scores[activity.user_id] = total_scores.get(activity.user_id, 0) + score
-        for user in users:
-            if user.id in total_scores:
-                user.points = total_scores[user.id]
-            else:
-                user.points = 0
-            db.session.add(user)
+    @classmethod
+    def _add_to_batch(cls, activity):
+        if not _activity_batch.ids:
+            block_size = min(len(_activity_batch.activities) + 1, ACTIVITY_ID_BLOCK_SIZE)
+            sql = "SELECT nextval('activities_id_seq') AS id FROM generate_series(1, :block_size)"
+            _activity_batch.ids = [row['id'] for row in db.session.execute(text(sql), {'block_size': block_size})]
+        activity.id = _activity_batch.ids.pop(0)
+        activity.created_at = activity.updated_at = activity.created_at or utc_now()
+        _activity_batch.activities.append(activity)
+        return activity
+
+    @classmethod
+    def _increment_points(cls, activities):
+        points_by_user_id = {}
+        configuration_by_course_id = {}
+        for activity in activities:
+            if activity.course_id not in configuration_by_course_id:
+                configuration = ActivityType.get_activity_type_configuration(course_id=activity.course_id)
+                configuration_by_course_id[activity.course_id] = {c['type']: c for c in configuration}
+            activity_config = configuration_by_course_id[activity.course_id].get(activity.activity_type, {})
+            points = activity_config['points'] if activity_config.get('enabled') else 0
+            points_by_user_id[activity.user_id] = points_by_user_id.get(activity.user_id, 0) + (points or 0)
+        user_ids = list(points_by_user_id.keys())
+        sql = """
+            UPDATE users u SET last_activity = now(), points = COALESCE(u.points, 0) + p.points, updated_at = now()
+            FROM unnest(CAST(:user_ids AS integer[]), CAST(:points AS integer[])) AS p(user_id, points)
+            WHERE u.id = p.user_id
+        """
+        db.session.execute(text(sql), {'user_ids': user_ids, 'points': [points_by_user_id[user_id] for user_id in user_ids]})
+        _expire_users(user_ids, ['last_activity', 'points', 'updated_at'])
+
+    @classmethod
+    def _insert_all(cls, activities):
+        if not activities:
+            return
+        db.session.flush()
+        rows = [
+            {
+                'activity_type': a.activity_type,
+                'actor_id': a.actor_id,
+                'asset_id': a.asset_id,
+                'course_id': a.course_id,
+                'created_at': a.created_at.isoformat(),
+                'id': a.id,
+                'metadata': a.activity_metadata,
+                'object_id': a.object_id,
+                'object_type': a.object_type,
+                'reciprocal_id': a.reciprocal_id,
+                'user_id': a.user_id,
+            } for a in activities
+        ]
+        sql = """
+            INSERT INTO activities
+                (id, type, object_id, object_type, metadata, asset_id, course_id, user_id, actor_id, reciprocal_id, created_at, updated_at)
+            SELECT
+                r.id, CAST(r.activity_type AS enum_activities_type), r.object_id, CAST(r.object_type AS enum_activities_object_type),
+                r.metadata, r.asset_id, r.course_id, r.user_id, r.actor_id, r.reciprocal_id, r.created_at, r.created_at
+            FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS r(
+                id integer, activity_type varchar, object_id integer, object_type varchar, metadata json, asset_id integer,
+                course_id integer, user_id integer, actor_id integer, reciprocal_id integer, created_at timestamptz
+            )
+        """
+        db.session.execute(text(sql), {'rows': json.dumps(rows)})
+        cls._increment_points(activities)
+        # The rows now exist, so the session can track later changes to these instances as updates.
+        for activity in activities:
+            make_transient_to_detached(activity)
+            db.session.add(activity)
         std_commit()
 
     def to_api_json(self):
@@ -324,6 +432,14 @@ class Activity(Base):
         }
 
 
+def _expire_users(user_ids, attribute_names):
+    # User instances already in the session must not hang on to stale values.
+    for user_id in user_ids:
+        user = db.session.identity_map.get(identity_key(User, user_id))
+        if user:
+            db.session.expire(user, attribute_names)
+
+
 def _to_api_json_by_type(activities):
     activities_by_type = {
         'actions': {
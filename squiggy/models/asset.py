@@ -23,21 +23,29 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+import base64
+from datetime import datetime
+import hashlib
 from itertools import groupby
+import json
 import re
+from threading import Lock
+import time
 from urllib.parse import urlparse
 
+from flask import current_app as app
 from sqlalchemy.dialects.postgresql import ENUM, JSON
 from sqlalchemy.sql import text
 from squiggy import db, std_commit
+from squiggy.lib.asset_views import buffer_asset_view, get_pending_view_count
 from squiggy.lib.aws import get_s3_signed_url
+from squiggy.lib.errors import BadRequestError
 from squiggy.lib.http import request
-from squiggy.lib.previews import generate_previews
-from squiggy.lib.util import db_row_to_dict, isoformat, utc_now
+from squiggy.lib.util import camelize, db_row_to_dict, is_admin, is_observer, is_student, is_teaching, isoformat, utc_now
 from squiggy.models.activity import Activity
 from squiggy.models.asset_category import asset_category_table
-from squiggy.models.asset_whiteboard_element import AssetWhiteboardElement
 from squiggy.models.base import Base
+from squiggy.models.preview_request import PreviewRequest
 
 assets_sort_by_options = {
     'recent': 'Most recent',
@@ -46,6 +54,19 @@ assets_sort_by_options = {
     'comments': 'Most comments',
 }
 
+# Keyset pagination sorts on one of these expressions, with asset id as the tie-breaker. ts_rank is a real (float4), which
+# would not compare equal to the same value bound back from a cursor as a double; hence the cast.
+_sort_expressions = {
+    'comments': 'a.comment_count',
+    'likes': 'a.likes',
+    'relevance': "CAST(ts_rank(a.search_vector, to_tsquery('simple', :search_query)) AS float8)",
+    'views': 'a.views',
+}
+
+# Asset Library totals, per course and search, with the time they were counted.
+_asset_totals = {}
+_asset_totals_lock = Lock()
+
 assets_type = ENUM(
     'file',
     'link',
@@ -63,6 +84,7 @@ class Asset(Base):
     body = db.Column(db.Text)
     canvas_assignment_id = db.Column(db.Integer)
     comment_count = db.Column(db.Integer, nullable=False, default=0)
+    content_hash = db.Column(db.String(64))
     course_id = db.Column(db.Integer, nullable=False)
     created_by = db.Column(db.Integer, nullable=False)
     deleted_at = db.Column(db.DateTime)
@@ -96,6 +118,7 @@ class Asset(Base):
         created_by,
         canvas_assignment_id=None,
         categories=None,
+        content_hash=None,
         description=None,
         download_url=None,
         mime=None,
@@ -108,6 +131,7 @@ class Asset(Base):
         self.asset_type = asset_type
         self.canvas_assignment_id = canvas_assignment_id
         self.categories = categories or []
+        self.content_hash = content_hash
         self.course_id = course_id
         self.created_by = created_by
         self.description = description
@@ -151,6 +175,7 @@ class Asset(Base):
         users,
         canvas_assignment_id=None,
         categories=None,
+        content_hash=None,
         description=None,
         download_url=None,
         mime=None,
@@ -163,6 +188,7 @@ class Asset(Base):
             asset_type=asset_type,
             canvas_assignment_id=canvas_assignment_id,
             categories=categories,
+            content_hash=content_hash,
             course_id=course_id,
             created_by=created_by,
             description=description,
@@ -175,23 +201,40 @@ class Asset(Base):
             visible=visible,
         )
         db.session.add(asset)
+        db.session.flush()
+
+        # If the same file was uploaded before and its previews are done, share them. An asset whose previews are still
+        # pending may yet fail or be deleted, so a copy of it gets a preview request of its own.
+        preview_source = content_hash and cls.query.filter(
+            cls.content_hash == content_hash,
+            cls.course_id == course_id,
+            cls.deleted_at.is_(None),
+            cls.id != asset.id,
+            cls.preview_status == 'done',
+        ).order_by(cls.id).first()
+        if preview_source:
+            for attribute in ('image_url', 'pdf_url', 'preview_metadata', 'preview_status', 'thumbnail_url'):
+                setattr(asset, attribute, getattr(preview_source, attribute))
+        else:
+            preview_url = download_url if asset_type in ['file', 'whiteboard'] else url
+            _queue_previews(asset, preview_url)
+        # The preview request commits with the asset, and is sent once the preview dispatcher gets to it.
         std_commit()
-
-        preview_url = download_url if asset_type in ['file', 'whiteboard'] else url
-        _generate_previews(asset, preview_url)
+        _clear_asset_totals(course_id)
 
         # Invisible assets generate no activities.
         if visible and create_activity is not False:
-            for user in users:
-                activity_type = 'whiteboard_export' if asset_type == 'whiteboard' else 'asset_add'
-                Activity.create(
-                    activity_type=activity_type,
-                    course_id=course_id,
-                    user_id=user.id,
-                    object_type='asset',
-                    object_id=asset.id,
-                    asset_id=asset.id,
-                )
+            with Activity.batch():
+                for user in users:
+                    activity_type = 'whiteboard_export' if asset_type == 'whiteboard' else 'asset_add'
+                    Activity.create(
+                        activity_type=activity_type,
+                        course_id=course_id,
+                        user_id=user.id,
+                        object_type='asset',
+                        object_id=asset.id,
+                        asset_id=asset.id,
+                    )
 
         return asset
 
@@ -201,6 +244,7 @@ class Asset(Base):
         if asset:
             asset.deleted_at = utc_now()
             std_commit()
+            _clear_asset_totals(asset.course_id)
 
     @classmethod
     def update(
@@ -216,19 +260,18 @@ class Asset(Base):
         asset.categories = categories or []
         db.session.add(asset)
         std_commit()
+        _clear_asset_totals(asset.course_id)
         return asset
 
     @classmethod
-    def get_assets(cls, current_user, filters, offset, order_by, limit, include_hidden=False):
+    def get_assets(cls, current_user, filters, offset, order_by, limit, include_hidden=False, cursor=None):
         params = {
             'asset_ids': filters.get('asset_ids'),
             'asset_types': filters.get('asset_type'),
             'category_id': filters.get('category_id'),
             'course_id': current_user.course_id,
             'group_id': filters.get('group_id'),
-            'limit': limit,
             'my_asset_ids': current_user.asset_ids,
-            'offset': offset,
             'owner_id': filters.get('owner_id'),
             'section': filters.get('section'),
             'user_id': current_user.id,
@@ -241,16 +284,27 @@ class Asset(Base):
             params=params,
             current_user=current_user,
         )
+        if order_by == 'relevance' and 'search_query' not in params:
+            order_by = 'recent'
         order_clause = _build_order_clause(order_by)
 
-        assets_query = text(f"""SELECT DISTINCT ON (a.id, a.likes, a.views, a.comment_count) a.*, act.type AS activity_type
+        count_sql = f'SELECT COUNT(DISTINCT(a.id))::int AS count {from_clause} {where_clause}'
+        total = _get_total(course_id=current_user.course_id, sql=count_sql, params=params)
+
+        page_params = {**params, 'limit': limit, 'offset': offset or 0}
+        if cursor:
+            # Pick up after the last asset of the previous page rather than counting off rows to skip.
+            where_clause += _build_keyset_clause(cursor=cursor, order_by=order_by, params=page_params)
+            page_params['offset'] = 0
+        distinct_on = 'a.id, a.likes, a.views, a.comment_count'
+        sort_expression = _sort_expressions.get(order_by)
+        if order_by == 'relevance':
+            distinct_on += f', {sort_expression}'
+        sort_value_column = f', {sort_expression} AS sort_value' if sort_expression else ''
+        assets_query = text(f"""SELECT DISTINCT ON ({distinct_on}) a.*, act.type AS activity_type{sort_value_column}
             {from_clause} {where_clause} {order_clause}
             LIMIT :limit OFFSET :offset""")
-        assets_result = list(db.session.execute(assets_query, params))
-
-        count_query = text(f'SELECT COUNT(DISTINCT(a.id))::int AS count {from_clause} {where_clause}')
-        count_result = db.session.execute(count_query, params).fetchone()
-        total = (count_result and count_result[0]) or 0
+        assets_result = list(db.session.execute(assets_query, page_params))
 
         asset_ids = [r['id'] for r in assets_result]
 
@@ -269,6 +323,8 @@ class Asset(Base):
 
         def _row_to_json_asset(row):
             json_asset = db_row_to_dict(row)
+            for key in ('searchVector', 'sortValue'):
+                json_asset.pop(key, None)
 
             # Has the user liked the asset?
             json_asset['liked'] = (json_asset['activityType'] == 'asset_like')
@@ -279,7 +335,11 @@ class Asset(Base):
 
             return json_asset
 
+        next_cursor = None
+        if limit and len(assets_result) == limit:
+            next_cursor = _encode_cursor(order_by=order_by, row=assets_result[-1])
         results = {
+            'nextCursor': next_cursor,
             'offset': offset,
             'total': total,
             'results': [_row_to_json_asset(r) for r in assets_result],
@@ -287,6 +347,13 @@ class Asset(Base):
 
         return results
 
+    def is_visible_to_sections(self, sections):
+        sql = text("""SELECT 1 FROM asset_section_visibility
+            WHERE asset_id = :asset_id AND (canvas_course_section IS NULL OR canvas_course_section = ANY(:sections))
+            LIMIT 1
+        """)
+        return db.session.execute(sql, {'asset_id': self.id, 'sections': sections or []}).first() is not None
+
     def get_used_in_assets(self):
         def _to_api_json(row):
             return {
@@ -358,29 +425,8 @@ class Asset(Base):
         return True
 
     def increment_views(self, user_id):
-        view_activity = Activity.create(
-            activity_type='asset_view',
-            course_id=self.course_id,
-            user_id=user_id,
-            object_type='asset',
-            object_id=self.id,
-            asset_id=self.id,
-        )
-        if view_activity:
-            for asset_owner in self.users:
-                Activity.create(
-                    activity_type='get_asset_view',
-                    course_id=self.course_id,
-                    user_id=asset_owner.id,
-                    object_type='asset',
-                    object_id=self.id,
-                    asset_id=self.id,
-                    actor_id=user_id,
-                    reciprocal_id=view_activity.id,
-                )
-        self.views = Activity.query.filter_by(asset_id=self.id, activity_type='asset_view').count()
-        db.session.add(self)
-        std_commit()
+        # The view, its activities and the new count are written later, in a batch. See squiggy.lib.asset_views.
+        buffer_asset_view(asset_id=self.id, course_id=self.course_id, user_id=user_id)
         return True
 
     def refresh_comments_count(self):
@@ -390,12 +436,14 @@ class Asset(Base):
         return self.comment_count
 
     def refresh_asset_preview_image(self):
-        self.update_preview(preview_status='pending')
+        self.preview_status = 'pending'
         preview_url = self.download_url if self.asset_type in ['file', 'whiteboard'] else self.url
-        _generate_previews(
+        _queue_previews(
             asset=self,
             preview_url=preview_url,
         )
+        db.session.add(self)
+        std_commit()
 
     def update_preview(self, **kwargs):
         if kwargs.get('preview_status'):
@@ -416,31 +464,21 @@ class Asset(Base):
         image_url = get_s3_signed_url(self.image_url)
         pdf_url = get_s3_signed_url(self.pdf_url)
         thumbnail_url = get_s3_signed_url(self.thumbnail_url)
-
-        liked = False
-        if user_id:
-            like_query = Activity.query.filter_by(
-                object_id=self.id,
-                object_type='asset',
-                activity_type='asset_like',
-                user_id=user_id,
-            )
-            if like_query.first() is not None:
-                liked = True
+        details = _get_api_json_details(asset_id=self.id, user_id=user_id)
         api_json = {
             'id': self.id,
             'assetType': self.asset_type,
             'body': self.body,
             'canvasAssignment_id': self.canvas_assignment_id,
-            'categories': [c.to_api_json() for c in self.categories],
+            'categories': [_category_to_api_json(c) for c in details['categories'] or []],
             'commentCount': self.comment_count,
             'courseId': self.course_id,
             'description': self.description,
             'dislikes': self.dislikes,
             'downloadUrl': self.download_url,
             'imageUrl': image_url,
-            'isUsedInWhiteboards': self.is_used_in_whiteboards(),
-            'liked': liked,
+            'isUsedInWhiteboards': details['is_used_in_whiteboards'],
+            'liked': details['liked'],
             'likes': self.likes,
             'mime': self.mime,
             'pdfUrl': pdf_url,
@@ -450,9 +488,9 @@ class Asset(Base):
             'thumbnailUrl': thumbnail_url,
             'title': self.title,
             'url': self.url,
-            'usedInAssets': self.get_used_in_assets(),
-            'users': [u.to_api_json() for u in self.users],
-            'views': self.views,
+            'usedInAssets': details['used_in_assets'] or [],
+            'users': [_user_to_api_json(u) for u in details['users'] or []],
+            'views': self.views + get_pending_view_count(self.id),
             'visible': self.visible,
             'createdAt': isoformat(self.created_at),
             'createdBy': self.created_by,
@@ -462,20 +500,20 @@ class Asset(Base):
         if self.asset_type == 'whiteboard':
             api_json['isReadOnly'] = True
             whiteboard_elements = []
-            for w in AssetWhiteboardElement.find_by_asset_id(self.id):
+            for w in details['whiteboard_elements'] or []:
                 element = {
-                    **w.element,
+                    **w['element'],
                     **{
-                        'uuid': w.uuid,
+                        'uuid': w['uuid'],
                     },
                 }
                 whiteboard_elements.append({
-                    'assetId': w.element_asset_id,
-                    'createdAt': isoformat(w.created_at),
+                    'assetId': w['element_asset_id'],
+                    'createdAt': _json_isoformat(w['created_at']),
                     'element': element,
                     'updatedAt': isoformat(self.updated_at),
-                    'uuid': w.uuid,
-                    'zIndex': w.z_index,
+                    'uuid': w['uuid'],
+                    'zIndex': w['z_index'],
                 })
             api_json['whiteboardElements'] = whiteboard_elements
         return api_json
@@ -505,7 +543,7 @@ def _build_from_clause(filters, current_user):
                 AND act.object_type = 'asset'
                 AND act.type = 'asset_like'
     """
-    if current_user.is_student and current_user.protect_assets_per_section or filters.get('group_id'):
+    if filters.get('group_id'):
         from_clause += """
             LEFT JOIN users asset_owner
                 ON a.created_by = asset_owner.id
@@ -519,6 +557,17 @@ def _build_from_clause(filters, current_user):
     return from_clause
 
 
+def _build_keyset_clause(cursor, order_by, params):
+    sort_value, asset_id = _decode_cursor(cursor)
+    params['cursor_asset_id'] = asset_id
+    sort_expression = _sort_expressions.get(order_by)
+    if sort_expression:
+        params['cursor_sort_value'] = sort_value or 0
+        return f' AND ({sort_expression}, a.id) < (:cursor_sort_value, :cursor_asset_id)'
+    else:
+        return ' AND a.id < :cursor_asset_id'
+
+
 def _build_order_clause(order_by):
     if (order_by == 'recent'):
         return ' ORDER BY a.id DESC'
@@ -528,6 +577,8 @@ def _build_order_clause(order_by):
         return ' ORDER BY a.views DESC, a.id DESC'
     elif (order_by == 'comments'):
         return ' ORDER BY a.comment_count DESC, a.id DESC'
+    elif (order_by == 'relevance'):
+        return f" ORDER BY {_sort_expressions['relevance']} DESC, a.id DESC"
     else:
         return ' ORDER BY a.id DESC'
 
@@ -544,14 +595,22 @@ def _build_where_clause(filters, include_hidden, params, current_user):
         where_clause += ' AND (a.visible = TRUE OR a.id = ANY(:my_asset_ids))'
     if current_user.is_student and current_user.protect_assets_per_section:
         where_clause += """ AND (
-            asset_owner.id = :user_id
-            OR to_jsonb(asset_owner.canvas_course_sections) ?| :user_course_sections
-            OR NOT lower(asset_owner.canvas_course_role) SIMILAR TO '%(student|learner)%'
+            a.created_by = :user_id
+            OR EXISTS (
+                SELECT 1 FROM asset_section_visibility v
+                WHERE v.asset_id = a.id AND (v.canvas_course_section IS NULL OR v.canvas_course_section = ANY(:user_course_sections))
+            )
         )"""
         params['user_course_sections'] = current_user.canvas_course_sections
     if filters.get('keywords'):
-        where_clause += ' AND (a.title ILIKE :keywords OR a.description ILIKE :keywords)'
-        params['keywords'] = '%' + re.sub(r'\s+', '%', filters['keywords'].strip()) + '%'
+        search_terms = re.findall(r'\w+', filters['keywords'])
+        if search_terms:
+            # Every term must match, as a prefix, some word in the asset's search document.
+            where_clause += " AND a.search_vector @@ to_tsquery('simple', :search_query)"
+            params['search_query'] = ' & '.join(f'{term}:*' for term in search_terms)
+        else:
+            where_clause += ' AND (a.title ILIKE :keywords OR a.description ILIKE :keywords)'
+            params['keywords'] = '%' + re.sub(r'\s+', '%', filters['keywords'].strip()) + '%'
 
     if filters.get('asset_type'):
         where_clause += ' AND a.type IN(:asset_types)'
@@ -568,6 +627,122 @@ def _build_where_clause(filters, include_hidden, params, current_user):
     return where_clause
 
 
-def _generate_previews(asset, preview_url):
-    if not generate_previews(asset.id, preview_url):
-        asset.update_preview(preview_status='error')
+def _clear_asset_totals(course_id):
+    with _asset_totals_lock:
+        for key in [k for k in _asset_totals if k[0] == course_id]:
+            del _asset_totals[key]
+
+
+def _decode_cursor(cursor):
+    try:
+        sort_value, asset_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort_value is not None and not isinstance(sort_value, (int, float)):
+            raise ValueError
+        return sort_value, int(asset_id)
+    except (AttributeError, TypeError, ValueError):
+        raise BadRequestError('Invalid cursor.')
+
+
+def _encode_cursor(order_by, row):
+    sort_value = row['sort_value'] if order_by in _sort_expressions else None
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row['id']]).encode()).decode()
+
+
+def _get_total(course_id, sql, params):
+    # The count runs over the same joins as the page query and does not change from page to page, so hold on to it briefly.
+    ttl = app.config['ASSET_TOTAL_CACHE_TTL_SECONDS']
+    key = (course_id, hashlib.sha256((sql + json.dumps(params, default=str, sort_keys=True)).encode()).hexdigest())
+    now = time.monotonic()
+    with _asset_totals_lock:
+        cached = _asset_totals.get(key)
+    if cached and now - cached[1] < ttl:
+        return cached[0]
+    result = db.session.execute(text(sql), params).fetchone()
+    total = (result and result[0]) or 0
+    if ttl:
+        with _asset_totals_lock:
+            for expired_key in [k for k, v in _asset_totals.items() if now - v[1] >= ttl]:
+                del _asset_totals[expired_key]
+            _asset_totals[key] = (total, now)
+    return total
+
+
+def _get_api_json_details(asset_id, user_id):
+    # Everything the asset page needs beyond the asset row itself, in a single round trip. Owners get the same slim
+    # projection as the Asset Library rather than the full User.to_api_json, which costs several queries per owner.
+    sql = text("""
+        SELECT
+            EXISTS (
+                SELECT 1 FROM activities
+                WHERE object_id = :asset_id AND object_type = 'asset' AND type = 'asset_like' AND user_id = :user_id
+            ) AS liked,
+            EXISTS (
+                SELECT 1 FROM whiteboards w
+                JOIN whiteboard_elements we ON w.id = we.whiteboard_id
+                WHERE we.asset_id = :asset_id AND w.deleted_at IS NULL
+            ) AS is_used_in_whiteboards,
+            (
+                SELECT json_agg(json_build_object('id', a.id, 'description', a.description, 'title', a.title, 'visible', a.visible))
+                FROM assets a
+                WHERE a.deleted_at IS NULL AND a.id IN (
+                    SELECT e.asset_id FROM asset_whiteboard_elements e WHERE e.element_asset_id = :asset_id
+                )
+            ) AS used_in_assets,
+            (
+                SELECT json_agg(c.* ORDER BY c.id)
+                FROM categories c JOIN asset_categories ac ON ac.category_id = c.id AND ac.asset_id = :asset_id
+            ) AS categories,
+            (
+                SELECT json_agg(json_build_object(
+                    'id', u.id,
+                    'canvas_course_role', u.canvas_course_role,
+                    'canvas_course_sections', u.canvas_course_sections,
+                    'canvas_enrollment_state', u.canvas_enrollment_state,
+                    'canvas_full_name', u.canvas_full_name,
+                    'canvas_image', u.canvas_image,
+                    'canvas_user_id', u.canvas_user_id,
+                    'course_id', u.course_id,
+                    'looking_for_collaborators', u.looking_for_collaborators
+                ) ORDER BY u.id)
+                FROM users u JOIN asset_users au ON au.user_id = u.id AND au.asset_id = :asset_id
+            ) AS users,
+            (
+                SELECT json_agg(e.*) FROM asset_whiteboard_elements e WHERE e.asset_id = :asset_id
+            ) AS whiteboard_elements
+    """)
+    return db.session.execute(sql, {'asset_id': asset_id, 'user_id': user_id}).first()
+
+
+def _category_to_api_json(row):
+    return {
+        'id': row['id'],
+        'canvasAssignmentId': row['canvas_assignment_id'],
+        'canvasAssignmentName': row['canvas_assignment_name'],
+        'courseId': row['course_id'],
+        'deletedAt': _json_isoformat(row['deleted_at']),
+        'title': row['title'],
+        'visible': row['visible'],
+        'createdAt': _json_isoformat(row['created_at']),
+        'updatedAt': _json_isoformat(row['updated_at']),
+    }
+
+
+def _json_isoformat(value):
+    # Timestamps aggregated with json_agg arrive as ISO strings; normalize them as isoformat does datetimes.
+    return value and isoformat(datetime.fromisoformat(value))
+
+
+def _queue_previews(asset, preview_url):
+    if app.config['PREVIEWS_ENABLED']:
+        PreviewRequest.enqueue(object_id=asset.id, object_url=preview_url)
+
+
+def _user_to_api_json(row):
+    api_json = {camelize(key): value for key, value in row.items()}
+    return {
+        **api_json,
+        'isAdmin': is_admin(api_json),
+        'isObserver': is_observer(api_json),
+        'isStudent': is_student(api_json),
+        'isTeaching': is_teaching(api_json),
+    }
@@ -0,0 +1,86 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from sqlalchemy.sql import text
+from squiggy import db, std_commit
+from squiggy.models.base import Base
+
+
+class CanvasAttachment(Base):
+    __tablename__ = 'canvas_attachments'
+
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False, primary_key=True)
+    canvas_attachment_id = db.Column(db.Integer, nullable=False, primary_key=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'))
+    content_hash = db.Column(db.String(64))
+    content_type = db.Column(db.String(255))
+    download_url = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger)
+
+    def __init__(self, course_id, canvas_attachment_id, download_url, asset_id=None, content_hash=None, content_type=None, size=None):
+        self.course_id = course_id
+        self.canvas_attachment_id = canvas_attachment_id
+        self.asset_id = asset_id
+        self.content_hash = content_hash
+        self.content_type = content_type
+        self.download_url = download_url
+        self.size = size
+
+    def __repr__(self):
+        return f"""<CanvasAttachment
+                    course_id={self.course_id},
+                    canvas_attachment_id={self.canvas_attachment_id},
+                    asset_id={self.asset_id},
+                    content_hash={self.content_hash},
+                    content_type={self.content_type},
+                    download_url={self.download_url},
+                    size={self.size}>
+                """
+
+    @classmethod
+    def find(cls, course_id, canvas_attachment_id):
+        return cls.query.filter_by(course_id=course_id, canvas_attachment_id=canvas_attachment_id).first()
+
+    @classmethod
+    def upsert(cls, course_id, canvas_attachment_id, asset_id, download_url, content_hash=None, content_type=None, size=None):
+        sql = """
+            INSERT INTO canvas_attachments
+                (course_id, canvas_attachment_id, asset_id, content_hash, content_type, download_url, size, created_at, updated_at)
+            VALUES (:course_id, :canvas_attachment_id, :asset_id, :content_hash, :content_type, :download_url, :size, now(), now())
+            ON CONFLICT (course_id, canvas_attachment_id) DO UPDATE
+            SET asset_id = EXCLUDED.asset_id, content_hash = EXCLUDED.content_hash, content_type = EXCLUDED.content_type,
+                download_url = EXCLUDED.download_url, size = EXCLUDED.size, updated_at = now()
+        """
+        args = {
+            'asset_id': asset_id,
+            'canvas_attachment_id': canvas_attachment_id,
+            'content_hash': content_hash,
+            'content_type': content_type,
+            'course_id': course_id,
+            'download_url': download_url,
+            'size': size,
+        }
+        db.session.execute(text(sql), args)
+        std_commit()
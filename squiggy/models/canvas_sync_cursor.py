@@ -0,0 +1,79 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import text
+from squiggy import db, std_commit
+from squiggy.models.base import Base
+
+
+class CanvasSyncCursor(Base):
+    __tablename__ = 'canvas_sync_cursors'
+
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False, primary_key=True)
+    resource = db.Column(db.String(255), nullable=False, primary_key=True)
+    etags = db.Column(ARRAY(db.String(255)))
+    last_synced_at = db.Column(db.DateTime)
+
+    def __init__(self, course_id, resource, etags=None, last_synced_at=None):
+        self.course_id = course_id
+        self.resource = resource
+        self.etags = etags
+        self.last_synced_at = last_synced_at
+
+    def __repr__(self):
+        return f"""<CanvasSyncCursor
+                    course_id={self.course_id},
+                    resource={self.resource},
+                    etags={self.etags},
+                    last_synced_at={self.last_synced_at}>
+                """
+
+    @classmethod
+    def delete(cls, course_id, resources):
+        if resources:
+            cls.query.filter(cls.course_id == course_id, cls.resource.in_(resources)).delete(synchronize_session=False)
+            std_commit()
+
+    @classmethod
+    def get_cursors_per_resource(cls, course_id):
+        return {c.resource: c for c in cls.query.filter_by(course_id=course_id).all()}
+
+    @classmethod
+    def update(cls, course_id, resource, etags=None, last_synced_at=None):
+        sql = """
+            INSERT INTO canvas_sync_cursors (course_id, resource, etags, last_synced_at, created_at, updated_at)
+            VALUES (:course_id, :resource, :etags, :last_synced_at, now(), now())
+            ON CONFLICT (course_id, resource) DO UPDATE
+            SET etags = EXCLUDED.etags, last_synced_at = EXCLUDED.last_synced_at, updated_at = now()
+        """
+        args = {
+            'course_id': course_id,
+            'etags': etags,
+            'last_synced_at': last_synced_at,
+            'resource': resource,
+        }
+        db.session.execute(text(sql), args)
+        std_commit()
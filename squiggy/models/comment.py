@@ -92,7 +92,9 @@ class Comment(Base):
         )
         db.session.add(comment)
         std_commit(allow_test_environment=True)
-        _create_activities_per_new_comment(asset=asset, comment=comment)
+        # A comment means an activity for each asset owner, and maybe the parent comment's author: write them together.
+        with Activity.batch():
+            _create_activities_per_new_comment(asset=asset, comment=comment)
         asset.refresh_comments_count()
         return comment
 
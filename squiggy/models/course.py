@@ -43,8 +43,14 @@ class Course(Base):
     enable_weekly_notifications = db.Column(db.Boolean, default=True, nullable=False)
     engagement_index_url = db.Column(db.String(255))
     impact_studio_url = db.Column(db.String(255))
+    last_launched_at = db.Column(db.DateTime)
     last_polled = db.Column(db.DateTime)
     name = db.Column(db.String(255))
+    next_due_at = db.Column(db.DateTime)
+    next_poll_at = db.Column(db.DateTime)
+    poll_change_rate = db.Column(db.Float, default=0, nullable=False)
+    poll_failures = db.Column(db.Integer, default=0, nullable=False)
+    poll_priority = db.Column(db.Float, default=0, nullable=False)
     whiteboards_url = db.Column(db.String(255))
     protects_assets_per_section = db.Column(db.Boolean, default=False, nullable=False)
 
@@ -91,7 +97,12 @@ class Course(Base):
                     engagement_index_url={self.engagement_index_url},
                     id={self.id},
                     impact_studio_url={self.impact_studio_url},
+                    last_launched_at={self.last_launched_at},
+                    last_polled={self.last_polled},
                     name={self.name},
+                    next_poll_at={self.next_poll_at},
+                    poll_failures={self.poll_failures},
+                    poll_priority={self.poll_priority},
                     whiteboards_url={self.whiteboards_url},
                     protects_assets_per_section={self.protects_assets_per_section},
                     created_at={self.created_at},
@@ -106,6 +117,84 @@ class Course(Base):
     def find_by_canvas_course_id(cls, canvas_api_domain, canvas_course_id):
         return cls.query.filter_by(canvas_api_domain=canvas_api_domain, canvas_course_id=canvas_course_id).first()
 
+    @classmethod
+    def claim_for_polling(cls, canvas_api_domain, limit=1, lease_seconds=0):
+        # Rows locked by a concurrent claim are skipped rather than waited on, so any number of poller workers (in
+        # any number of processes) can pull from the same queue. The claim is stamped in last_polled, which keeps
+        # the course away from other workers until the lease expires. Courses come due per the schedule in next_poll_at
+        # (see poll_scheduler); never-scheduled courses go first.
+        sql = """
+            UPDATE courses SET last_polled = now(), updated_at = now()
+            WHERE id IN (
+                SELECT id FROM courses
+                WHERE
+                    canvas_api_domain = :canvas_api_domain
+                    AND active IS TRUE
+                    AND (next_poll_at IS NULL OR next_poll_at <= now())
+                    AND (last_polled IS NULL OR last_polled < now() - make_interval(secs => :lease_seconds))
+                ORDER BY next_poll_at ASC NULLS FIRST, poll_priority DESC
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """
+        args = {
+            'canvas_api_domain': canvas_api_domain,
+            'lease_seconds': lease_seconds,
+            'limit': limit,
+        }
+        course_ids = [row['id'] for row in db.session.execute(text(sql), args).all()]
+        std_commit()
+        if not course_ids:
+            return []
+        return cls.query.filter(cls.id.in_(course_ids)).order_by(cls.id).all()
+
+    @classmethod
+    def get_poll_queue(cls, canvas_api_domain=None, limit=100):
+        query = cls.query.filter_by(active=True)
+        if canvas_api_domain:
+            query = query.filter_by(canvas_api_domain=canvas_api_domain)
+        courses = query.order_by(cls.next_poll_at.asc().nullsfirst(), cls.poll_priority.desc()).limit(limit).all()
+        return [c.to_poll_queue_json() for c in courses]
+
+    @classmethod
+    def get_poll_signals(cls, course_id, since):
+        sql = """
+            SELECT
+                (SELECT max(last_activity) FROM users WHERE course_id = :course_id) AS last_user_activity,
+                (
+                    EXISTS (SELECT 1 FROM activities WHERE course_id = :course_id AND created_at >= :since)
+                    OR EXISTS (SELECT 1 FROM assets WHERE course_id = :course_id AND created_at >= :since)
+                    OR EXISTS (SELECT 1 FROM users WHERE course_id = :course_id AND updated_at >= :since)
+                ) AS has_changes
+        """
+        return db.session.execute(text(sql), {'course_id': course_id, 'since': since}).first()
+
+    @classmethod
+    def record_launch(cls, course_id, poll_within_seconds):
+        # A course in use should be polled soon, whatever its schedule.
+        sql = """
+            UPDATE courses
+            SET
+                last_launched_at = now(),
+                next_poll_at = LEAST(COALESCE(next_poll_at, now()), now() + make_interval(secs => :poll_within_seconds))
+            WHERE id = :course_id
+        """
+        db.session.execute(text(sql), {'course_id': course_id, 'poll_within_seconds': poll_within_seconds})
+        std_commit()
+
+    @classmethod
+    def update_poll_schedule(cls, course_id, next_due_at, next_poll_at, poll_change_rate, poll_priority, poll_failures=0):
+        course = cls.find_by_id(course_id=course_id)
+        course.next_due_at = next_due_at
+        course.next_poll_at = next_poll_at
+        course.poll_change_rate = poll_change_rate
+        course.poll_failures = poll_failures
+        course.poll_priority = poll_priority
+        db.session.add(course)
+        std_commit()
+        return course
+
     @classmethod
     def get_advanced_asset_search_options(
             cls,
@@ -279,6 +368,21 @@ class Course(Base):
             api_json['users'] = [user.to_api_json() for user in users]
         return api_json
 
+    def to_poll_queue_json(self):
+        return {
+            'canvasApiDomain': self.canvas_api_domain,
+            'canvasCourseId': self.canvas_course_id,
+            'id': self.id,
+            'lastLaunchedAt': _isoformat(self.last_launched_at),
+            'lastPolled': _isoformat(self.last_polled),
+            'name': self.name,
+            'nextDueAt': _isoformat(self.next_due_at),
+            'nextPollAt': _isoformat(self.next_poll_at),
+            'pollChangeRate': self.poll_change_rate,
+            'pollFailures': self.poll_failures,
+            'pollPriority': self.poll_priority,
+        }
+
     def activate(self):
         self.active = True
         db.session.add(self)
@@ -23,6 +23,7 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from sqlalchemy.sql import text
 from squiggy import db, std_commit
 from squiggy.models.base import Base
 
@@ -35,6 +36,7 @@ class CourseGroup(Base):
     canvas_group_id = db.Column(db.Integer, nullable=False)
     name = db.Column(db.String(255))
     category_name = db.Column(db.String(255))
+    membership_hash = db.Column(db.String(64))
 
     course = db.relationship('Course', back_populates='groups')
     memberships = db.relationship('CourseGroupMembership', back_populates='course_group')
@@ -57,7 +59,8 @@ class CourseGroup(Base):
                     course_id={self.course_id},
                     canvas_group_id={self.canvas_group_id},
                     name={self.name}
-                    category_name={self.category_name}>
+                    category_name={self.category_name},
+                    membership_hash={self.membership_hash}>
                 """
 
     @classmethod
@@ -72,6 +75,22 @@ class CourseGroup(Base):
         std_commit()
         return course_group
 
+    @classmethod
+    def update_membership_hashes(cls, membership_hash_per_group_id):
+        if not membership_hash_per_group_id:
+            return
+        sql = """
+            UPDATE course_groups g SET membership_hash = h.membership_hash, updated_at = now()
+            FROM unnest(CAST(:group_ids AS INTEGER[]), CAST(:membership_hashes AS VARCHAR[])) AS h(id, membership_hash)
+            WHERE g.id = h.id
+        """
+        args = {
+            'group_ids': list(membership_hash_per_group_id.keys()),
+            'membership_hashes': list(membership_hash_per_group_id.values()),
+        }
+        db.session.execute(text(sql), args)
+        std_commit()
+
     def to_api_json(self):
         return {
             'id': self.id,
@@ -23,6 +23,7 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from sqlalchemy.sql import text
 from squiggy import db, std_commit
 from squiggy.models.base import Base
 
@@ -59,10 +60,54 @@ class CourseGroupMembership(Base):
         std_commit()
         return membership
 
+    @classmethod
+    def add_all(cls, course_id, memberships):
+        # Memberships are (course_group_id, canvas_user_id) tuples.
+        if not memberships:
+            return
+        sql = """
+            INSERT INTO course_group_memberships (course_id, course_group_id, canvas_user_id, created_at, updated_at)
+            SELECT :course_id, m.course_group_id, m.canvas_user_id, now(), now()
+            FROM unnest(CAST(:course_group_ids AS INTEGER[]), CAST(:canvas_user_ids AS INTEGER[])) AS m(course_group_id, canvas_user_id)
+            ON CONFLICT (course_group_id, canvas_user_id) DO NOTHING
+        """
+        args = {
+            'canvas_user_ids': [m[1] for m in memberships],
+            'course_group_ids': [m[0] for m in memberships],
+            'course_id': course_id,
+        }
+        db.session.execute(text(sql), args)
+        std_commit()
+
+    @classmethod
+    def delete_all(cls, memberships):
+        # Memberships are (course_group_id, canvas_user_id) tuples.
+        if not memberships:
+            return
+        sql = """
+            DELETE FROM course_group_memberships cgm
+            USING unnest(CAST(:course_group_ids AS INTEGER[]), CAST(:canvas_user_ids AS INTEGER[])) AS m(course_group_id, canvas_user_id)
+            WHERE cgm.course_group_id = m.course_group_id AND cgm.canvas_user_id = m.canvas_user_id
+        """
+        args = {
+            'canvas_user_ids': [m[1] for m in memberships],
+            'course_group_ids': [m[0] for m in memberships],
+        }
+        db.session.execute(text(sql), args)
+        std_commit()
+
     @classmethod
     def find_by_course_and_user(cls, course_id, canvas_user_id):
         return cls.query.filter_by(course_id=course_id, canvas_user_id=canvas_user_id).all()
 
+    @classmethod
+    def get_canvas_user_ids_per_group(cls, course_id):
+        sql = 'SELECT course_group_id, canvas_user_id FROM course_group_memberships WHERE course_id = :course_id'
+        canvas_user_ids_per_group = {}
+        for row in db.session.execute(text(sql), {'course_id': course_id}).all():
+            canvas_user_ids_per_group.setdefault(row['course_group_id'], set()).add(row['canvas_user_id'])
+        return canvas_user_ids_per_group
+
     def to_api_json(self):
         return {
             'canvasGroupId': self.course_group_id,
@@ -0,0 +1,110 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from sqlalchemy.sql import text
+from squiggy import db, std_commit
+from squiggy.models.base import Base
+
+
+class PreviewRequest(Base):
+    __tablename__ = 'preview_requests'
+
+    # Outbox of preview-service requests. Rows are added in the same transaction as the asset they serve and deleted
+    # once the preview service has accepted them; see squiggy.lib.preview_dispatcher.
+    id = db.Column(db.Integer, nullable=False, primary_key=True)  # noqa: A003
+    object_type = db.Column(db.String(255), nullable=False)
+    object_id = db.Column(db.Integer, nullable=False)
+    object_url = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, server_default=text('now()'))
+
+    def __init__(self, object_id, object_type, object_url):
+        self.object_id = object_id
+        self.object_type = object_type
+        self.object_url = object_url
+
+    def __repr__(self):
+        return f"""<PreviewRequest
+                    id={self.id},
+                    object_type={self.object_type},
+                    object_id={self.object_id},
+                    object_url={self.object_url},
+                    attempts={self.attempts},
+                    last_error={self.last_error},
+                    next_attempt_at={self.next_attempt_at}>
+                """
+
+    @classmethod
+    def claim(cls, limit, lease_seconds):
+        # As with Course.claim_for_polling, rows locked by a concurrent claim are skipped, so dispatchers in any number of
+        # processes share the queue. Pushing next_attempt_at out by the lease keeps claimed rows away from other
+        # dispatchers until they are settled, or until the lease runs out.
+        sql = """
+            UPDATE preview_requests
+            SET attempts = attempts + 1, next_attempt_at = now() + make_interval(secs => :lease_seconds), updated_at = now()
+            WHERE id IN (
+                SELECT id FROM preview_requests
+                WHERE next_attempt_at <= now()
+                ORDER BY next_attempt_at, id
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, object_type, object_id, object_url, attempts
+        """
+        rows = db.session.execute(text(sql), {'lease_seconds': lease_seconds, 'limit': limit}).all()
+        std_commit()
+        return sorted([dict(row) for row in rows], key=lambda row: row['id'])
+
+    @classmethod
+    def delete(cls, ids):
+        if ids:
+            db.session.execute(text('DELETE FROM preview_requests WHERE id = ANY(:ids)'), {'ids': ids})
+            std_commit()
+
+    @classmethod
+    def enqueue(cls, object_id, object_url, object_type='asset'):
+        # No commit here: the request is committed, or rolled back, along with the caller's transaction.
+        preview_request = cls(object_id=object_id, object_type=object_type, object_url=object_url)
+        db.session.add(preview_request)
+        return preview_request
+
+    @classmethod
+    def get_queue_stats(cls):
+        sql = """
+            SELECT count(*) AS depth, extract(epoch FROM now() - min(created_at)) AS oldest_age_seconds
+            FROM preview_requests
+        """
+        return dict(db.session.execute(text(sql)).first())
+
+    @classmethod
+    def retry_later(cls, preview_request_id, delay_seconds, error=None):
+        sql = """
+            UPDATE preview_requests
+            SET next_attempt_at = now() + make_interval(secs => :delay_seconds), last_error = :error, updated_at = now()
+            WHERE id = :id
+        """
+        db.session.execute(text(sql), {'delay_seconds': delay_seconds, 'error': error, 'id': preview_request_id})
+        std_commit()
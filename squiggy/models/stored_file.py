@@ -0,0 +1,87 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from sqlalchemy.sql import text
+from squiggy import db, std_commit
+from squiggy.lib.aws import spool_stream, upload_file_to_s3
+from squiggy.lib.previews import get_s3_key_prefix
+from squiggy.models.base import Base
+
+
+class StoredFile(Base):
+    __tablename__ = 'stored_files'
+
+    # One S3 object per distinct file content per course. The ref_count of live assets is kept by a trigger on assets.
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, primary_key=True)
+    content_type = db.Column(db.String(255))
+    download_url = db.Column(db.String(255), nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    size = db.Column(db.BigInteger)
+
+    def __repr__(self):
+        return f"""<StoredFile
+                    course_id={self.course_id},
+                    content_hash={self.content_hash},
+                    content_type={self.content_type},
+                    download_url={self.download_url},
+                    ref_count={self.ref_count},
+                    size={self.size}>
+                """
+
+    @classmethod
+    def find(cls, course_id, content_hash):
+        return cls.query.filter_by(course_id=course_id, content_hash=content_hash).first()
+
+    @classmethod
+    def store(cls, course_id, filename, stream, max_bytes=None):
+        # Returns the stored file and whether it was uploaded just now, rather than found by its hash.
+        with spool_stream(stream, max_bytes=max_bytes) as spooled:
+            stored_file = cls.find(course_id, spooled['content_hash'])
+            if stored_file:
+                return stored_file, False
+            download_url = upload_file_to_s3(
+                file=spooled['file'],
+                filename=filename,
+                content_hash=spooled['content_hash'],
+                content_type=spooled['content_type'],
+                s3_key_prefix=get_s3_key_prefix(course_id, 'asset'),
+            )
+        # Should the same bytes have raced us here, both uploads went to the same key and the first row stands.
+        sql = """
+            INSERT INTO stored_files (course_id, content_hash, content_type, download_url, size, created_at, updated_at)
+            VALUES (:course_id, :content_hash, :content_type, :download_url, :size, now(), now())
+            ON CONFLICT (course_id, content_hash) DO NOTHING
+        """
+        args = {
+            'content_hash': spooled['content_hash'],
+            'content_type': spooled['content_type'],
+            'course_id': course_id,
+            'download_url': download_url,
+            'size': spooled['size'],
+        }
+        db.session.execute(text(sql), args)
+        std_commit()
+        return cls.find(course_id, spooled['content_hash']), True
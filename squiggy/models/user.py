@@ -23,6 +23,7 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+import json
 import random
 
 from cryptography.fernet import Fernet
@@ -157,6 +158,57 @@ class User(Base):
         std_commit()
         return user
 
+    @classmethod
+    def sync_roster(cls, course_id, users_to_create, users_to_update, user_ids_to_inactivate):
+        # Whatever the size of the roster, the diff is applied with (at most) three statements and a single commit.
+        columns = """
+            canvas_course_role character varying(255),
+            canvas_course_sections character varying(255)[],
+            canvas_email character varying(255),
+            canvas_enrollment_state enum_users_canvas_enrollment_state,
+            canvas_full_name character varying(255),
+            canvas_image character varying(255),
+            canvas_user_id integer
+        """
+        if users_to_create:
+            sql = f"""
+                INSERT INTO users (
+                    bookmarklet_token, canvas_course_role, canvas_course_sections, canvas_email, canvas_enrollment_state,
+                    canvas_full_name, canvas_image, canvas_user_id, course_id, created_at, updated_at
+                )
+                SELECT
+                    r.bookmarklet_token, r.canvas_course_role, r.canvas_course_sections, r.canvas_email, r.canvas_enrollment_state,
+                    r.canvas_full_name, r.canvas_image, r.canvas_user_id, :course_id, now(), now()
+                FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS r(bookmarklet_token character varying(32), {columns})
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM users u WHERE u.course_id = :course_id AND u.canvas_user_id = r.canvas_user_id
+                )
+            """
+            rows = [{**user, 'bookmarklet_token': '%032x' % random.getrandbits(128)} for user in users_to_create]
+            db.session.execute(text(sql), {'course_id': course_id, 'rows': json.dumps(rows)})
+        if users_to_update:
+            sql = f"""
+                UPDATE users u SET
+                    canvas_course_role = r.canvas_course_role,
+                    canvas_course_sections = r.canvas_course_sections,
+                    canvas_email = r.canvas_email,
+                    canvas_enrollment_state = r.canvas_enrollment_state,
+                    canvas_full_name = r.canvas_full_name,
+                    canvas_image = r.canvas_image,
+                    updated_at = now()
+                FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS r(id integer, {columns})
+                WHERE u.id = r.id AND u.course_id = :course_id
+            """
+            db.session.execute(text(sql), {'course_id': course_id, 'rows': json.dumps(users_to_update)})
+        if user_ids_to_inactivate:
+            sql = """
+                UPDATE users SET canvas_enrollment_state = 'inactive', updated_at = now()
+                WHERE course_id = :course_id AND id = ANY(:user_ids)
+            """
+            db.session.execute(text(sql), {'course_id': course_id, 'user_ids': user_ids_to_inactivate})
+        std_commit()
+        return cls.query.filter_by(course_id=course_id).populate_existing().all()
+
     @classmethod
     def find_by_course_id(cls, canvas_user_id, course_id):
         where_clause = and_(cls.course_id == course_id, cls.canvas_user_id == canvas_user_id)
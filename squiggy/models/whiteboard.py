@@ -47,6 +47,7 @@ class Whiteboard(Base):
     created_by = db.Column(db.Integer, nullable=False)
     deleted_at = db.Column(db.DateTime)
     image_url = db.Column(db.Text)
+    next_z_index = db.Column(db.Integer, nullable=False, default=0)
     thumbnail_url = db.Column(db.Text)
     title = db.Column(db.String(255), nullable=False)
     users = db.relationship(
@@ -326,25 +327,26 @@ class Whiteboard(Base):
         user_id = created_by.id
         course_id = created_by.course.id
         if user_id not in [user.id for user in whiteboard_users]:
-            remix_activity = Activity.create(
-                activity_type='whiteboard_remix',
-                course_id=course_id,
-                user_id=user_id,
-                object_type='asset',
-                object_id=asset_id,
-                asset_id=asset_id,
-            )
-            for asset_user in whiteboard_users:
-                Activity.create(
-                    activity_type='get_whiteboard_remix',
+            with Activity.batch():
+                remix_activity = Activity.create(
+                    activity_type='whiteboard_remix',
                     course_id=course_id,
-                    user_id=asset_user.id,
+                    user_id=user_id,
                     object_type='asset',
                     object_id=asset_id,
                     asset_id=asset_id,
-                    actor_id=user_id,
-                    reciprocal_id=remix_activity.id,
                 )
+                for asset_user in whiteboard_users:
+                    Activity.create(
+                        activity_type='get_whiteboard_remix',
+                        course_id=course_id,
+                        user_id=asset_user.id,
+                        object_type='asset',
+                        object_id=asset_id,
+                        asset_id=asset_id,
+                        actor_id=user_id,
+                        reciprocal_id=remix_activity.id,
+                    )
         return whiteboard
 
     @classmethod
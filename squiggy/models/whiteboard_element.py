@@ -23,6 +23,8 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+import json
+
 from sqlalchemy import and_, ForeignKey, Integer
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm.attributes import flag_modified
@@ -43,12 +45,12 @@ class WhiteboardElement(Base):
     uuid = db.Column('uuid', db.String(255), nullable=False)
     whiteboard_id = db.Column('whiteboard_id', Integer, ForeignKey('whiteboards.id'), nullable=False)
     z_index = db.Column('z_index', Integer, nullable=False)
+    version = db.Column('version', Integer, nullable=False, default=1)
 
     __table_args__ = (db.UniqueConstraint(
-        'created_at',
-        'uuid',
         'whiteboard_id',
-        name='whiteboard_elements_created_at_uuid_whiteboard_id_idx',
+        'uuid',
+        name='whiteboard_elements_whiteboard_id_uuid_idx',
     ),)
 
     def __init__(
@@ -80,13 +82,6 @@ class WhiteboardElement(Base):
                 results = [r for r in results if not r.asset_id or r.asset_id not in deleted_asset_ids]
         return results
 
-    @classmethod
-    def get_id_per_uuid(cls, uuid):
-        query = text('SELECT id FROM whiteboard_elements WHERE uuid = :uuid')
-        result = db.session.execute(query, {'uuid': uuid}).first()
-        std_commit()
-        return result and result['id']
-
     @classmethod
     def get_asset_usages(cls, asset_id, live_usages_only=False):
         if live_usages_only:
@@ -126,11 +121,91 @@ class WhiteboardElement(Base):
             # Ensure consistent uuid.
             element['uuid'] = uuid
             whiteboard_element.element = element
+            whiteboard_element.version += 1
 
             db.session.add(whiteboard_element)
             std_commit()
             return whiteboard_element
 
+    @classmethod
+    def find_versions(cls, uuids, whiteboard_id):
+        sql = 'SELECT uuid, version FROM whiteboard_elements WHERE whiteboard_id = :whiteboard_id AND uuid = ANY(:uuids)'
+        return {row['uuid']: row['version'] for row in db.session.execute(text(sql), {'uuids': uuids, 'whiteboard_id': whiteboard_id})}
+
+    @classmethod
+    def patch_all(cls, patches, whiteboard_id):
+        # Merges changed properties into elements, by uuid, in one UPDATE. Each of patches has patch, uuid and, optionally,
+        # the version it brings the element to. Returns the uuids of the elements found.
+        if not patches:
+            return set()
+        sql = """
+            UPDATE whiteboard_elements w
+            SET element = CAST(CAST(w.element AS jsonb) || CAST(p.patch AS jsonb) AS json),
+                version = GREATEST(w.version + 1, p.version),
+                updated_at = now()
+            FROM unnest(CAST(:patches AS json[]), CAST(:uuids AS varchar[]), CAST(:versions AS integer[])) AS p(patch, uuid, version)
+            WHERE w.whiteboard_id = :whiteboard_id AND w.uuid = p.uuid
+            RETURNING w.uuid
+        """
+        args = {
+            'patches': [json.dumps({k: v for k, v in p['patch'].items() if k != 'uuid'}) for p in patches],
+            'uuids': [p['uuid'] for p in patches],
+            'versions': [p.get('version') for p in patches],
+            'whiteboard_id': whiteboard_id,
+        }
+        uuids = {row['uuid'] for row in db.session.execute(text(sql), args)}
+        std_commit()
+        return uuids
+
+    @classmethod
+    def upsert_all(cls, whiteboard_elements, whiteboard_id):
+        # Creates or updates, by uuid, a batch of elements on one whiteboard. One query finds which uuids are already on the
+        # board, new elements take z-indexes in order from the whiteboard's counter, and one INSERT ... ON CONFLICT writes
+        # the lot. An element may bring the version it is saved at; otherwise its version goes up by one. Returns API JSON of
+        # the elements in the order given, and the uuids of those created.
+        elements_by_uuid = {}
+        for whiteboard_element in whiteboard_elements:
+            # Ensure consistent uuid.
+            whiteboard_element['element']['uuid'] = whiteboard_element['uuid']
+            # Should a uuid appear twice in one batch, the last one wins.
+            elements_by_uuid.pop(whiteboard_element['uuid'], None)
+            elements_by_uuid[whiteboard_element['uuid']] = whiteboard_element
+        if not elements_by_uuid:
+            return [], set()
+        uuids = list(elements_by_uuid.keys())
+
+        sql = 'SELECT uuid FROM whiteboard_elements WHERE whiteboard_id = :whiteboard_id AND uuid = ANY(:uuids)'
+        existing_uuids = {row['uuid'] for row in db.session.execute(text(sql), {'uuids': uuids, 'whiteboard_id': whiteboard_id})}
+        new_uuids = [uuid for uuid in uuids if uuid not in existing_uuids]
+        z_index = _take_z_indexes(count=len(new_uuids), whiteboard_id=whiteboard_id) if new_uuids else 0
+        # Existing elements keep their z-index; theirs here is a placeholder.
+        z_indexes = {uuid: z_index + i for i, uuid in enumerate(new_uuids)}
+
+        sql = """
+            INSERT INTO whiteboard_elements (asset_id, element, uuid, version, whiteboard_id, z_index, created_at, updated_at)
+            SELECT e.asset_id, e.element, e.uuid, COALESCE(e.version, 1), :whiteboard_id, e.z_index, now(), now()
+            FROM unnest(
+                CAST(:asset_ids AS integer[]), CAST(:elements AS json[]), CAST(:uuids AS varchar[]),
+                CAST(:versions AS integer[]), CAST(:z_indexes AS integer[])
+            ) AS e(asset_id, element, uuid, version, z_index)
+            ON CONFLICT (whiteboard_id, uuid) DO UPDATE
+            SET asset_id = EXCLUDED.asset_id, element = EXCLUDED.element,
+                version = GREATEST(whiteboard_elements.version + 1, EXCLUDED.version), updated_at = now()
+            RETURNING id, asset_id, created_at, element, updated_at, uuid, version, whiteboard_id, z_index
+        """
+        args = {
+            'asset_ids': [elements_by_uuid[uuid].get('asset_id') for uuid in uuids],
+            'elements': [json.dumps(elements_by_uuid[uuid]['element']) for uuid in uuids],
+            'uuids': uuids,
+            'versions': [elements_by_uuid[uuid].get('version') for uuid in uuids],
+            'whiteboard_id': whiteboard_id,
+            'z_indexes': [z_indexes.get(uuid, 0) for uuid in uuids],
+        }
+        rows_by_uuid = {row['uuid']: row for row in db.session.execute(text(sql), args)}
+        std_commit()
+        results = [_row_to_api_json(rows_by_uuid[uuid]) for uuid in uuids]
+        return results, set(new_uuids)
+
     @classmethod
     def update_z_indexes(cls, direction, uuids, whiteboard_id):
         whiteboard_elements = cls.query.filter(cls.whiteboard_id == whiteboard_id).order_by(asc(cls.z_index)).all()
@@ -177,6 +252,32 @@ class WhiteboardElement(Base):
             'element': self.element,
             'updatedAt': isoformat(self.updated_at),
             'uuid': self.uuid,
+            'version': self.version,
             'whiteboardId': self.whiteboard_id,
             'zIndex': self.z_index,
         }
+
+
+def _row_to_api_json(row):
+    return {
+        'id': row['id'],
+        'assetId': row['asset_id'],
+        'createdAt': isoformat(row['created_at']),
+        'element': row['element'],
+        'updatedAt': isoformat(row['updated_at']),
+        'uuid': row['uuid'],
+        'version': row['version'],
+        'whiteboardId': row['whiteboard_id'],
+        'zIndex': row['z_index'],
+    }
+
+
+def _take_z_indexes(count, whiteboard_id):
+    # The row lock held until commit means concurrent batches on one whiteboard get consecutive, distinct ranges.
+    sql = """
+        UPDATE whiteboards SET next_z_index = next_z_index + :count
+        WHERE id = :whiteboard_id
+        RETURNING next_z_index - :count AS z_index
+    """
+    row = db.session.execute(text(sql), {'count': count, 'whiteboard_id': whiteboard_id}).first()
+    return row['z_index'] if row else 0
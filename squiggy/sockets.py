@@ -28,6 +28,7 @@ from flask_login import current_user, login_required
 from flask_socketio import emit, join_room, leave_room
 from squiggy.api.api_util import get_socket_io_room, SOCKET_IO_NAMESPACE, upsert_whiteboard_elements
 from squiggy.lib.util import isoformat, utc_now
+from squiggy.lib.whiteboard_edits import flush_whiteboard_edits
 from squiggy.logger import initialize_background_logger
 from squiggy.models.whiteboard_session import WhiteboardSession
 
@@ -68,6 +69,7 @@ def register_sockets(socketio):
         whiteboard_id = data.get('whiteboardId')
         logger.debug(f'socketio_leave: user_id = {current_user}, whiteboard_id = {whiteboard_id}')
         socket_id = request.sid
+        flush_whiteboard_edits()
         WhiteboardSession.delete_all([socket_id], older_than_minutes=1440)
         room = get_socket_io_room(whiteboard_id)
         leave_room(room, sid=socket_id)
@@ -103,6 +105,7 @@ def register_sockets(socketio):
     @socketio.on('disconnect')
     def socketio_disconnect():
         logger.debug('socketio_disconnect')
+        flush_whiteboard_edits()
 
     @socketio.on('upsert_whiteboard_element')
     @login_required
@@ -110,11 +113,14 @@ def register_sockets(socketio):
         socket_id = request.sid
         whiteboard_elements = data.get('whiteboardElements')
         whiteboard_id = data.get('whiteboardId')
-        upsert_whiteboard_elements(
+        # The sender gets the new version of each element, and the full element where its patch was out of date.
+        results = upsert_whiteboard_elements(
             socket_id=socket_id,
             whiteboard_elements=whiteboard_elements,
             whiteboard_id=whiteboard_id,
+            buffered=True,
         )
+        return {'status': 200, 'whiteboardElements': results}
 
     @socketio.on_error()
     def socketio_error(e):
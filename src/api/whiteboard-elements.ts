@@ -24,10 +24,3 @@ export function updateWhiteboardElementsOrder(
     {direction, socketId, uuids, whiteboardId}
   )
 }
-
-export function upsertWhiteboardElements(socketId: string, whiteboardElements: any[], whiteboardId: number) {
-  return axios.post(
-    `${utils.apiBaseUrl()}/api/whiteboard_elements/upsert`,
-    {socketId, whiteboardElements, whiteboardId}
-  )
-}
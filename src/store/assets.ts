@@ -10,16 +10,18 @@ function $_search(commit, state, addToExisting?: boolean) {
     getAssets({
       assetType: state.assetType,
       categoryId: state.categoryId,
+      cursor: addToExisting ? state.cursor : undefined,
       groupId: state.groupId,
       keywords: state.keywords,
       limit: state.limit,
-      offset: state.offset,
-      orderBy: state.orderBy,
+      // Keyword searches under the default sort are ranked by relevance.
+      orderBy: state.keywords && state.orderBy === orderByDefault ? 'relevance' : state.orderBy,
       section: state.section,
       userId: state.userId
     }).then(data => {
       const assets = _.get(data, 'results')
       commit(addToExisting ? 'addAssets' : 'setAssets', assets)
+      commit('setCursor', _.get(data, 'nextCursor'))
       commit('setTotalAssetCount', _.get(data, 'total'))
       commit('setDirty', false)
       resolve(data)
@@ -33,11 +35,11 @@ const state = {
   canvasGroups: [],
   categories: [],
   categoryId: undefined,
+  cursor: undefined,
   groupId: undefined,
   isDirty: false,
   keywords: undefined,
   limit: 20,
-  offset: 0,
   orderBy: orderByDefault,
   section: undefined,
   sections: [],
@@ -77,6 +79,7 @@ const mutations = {
     state.isDirty = true
   },
   setCanvasGroups: (state: any, canvasGroups: any[]) => state.canvasGroups = canvasGroups,
+  setCursor: (state: any, cursor: string) => state.cursor = cursor,
   setDirty: (state: any, dirty: boolean) => state.isDirty = dirty,
   setGroupId: (state: any, groupId: number) => {
     state.groupId = groupId
@@ -86,7 +89,6 @@ const mutations = {
     state.keywords = keywords
     state.isDirty = true
   },
-  setOffset: (state: any, offset: number) => state.offset = offset,
   setOrderBy: (state: any, orderBy: string) => {
     state.orderBy = orderBy
     state.isDirty = true
@@ -136,10 +138,10 @@ const actions = {
     })
   },
   nextPage: ({commit, state}) => {
-    commit('setOffset', state.offset + state.limit)
-    return $_search(commit, state, true)
+    // No cursor means the previous page was the last.
+    return state.cursor ? $_search(commit, state, true) : Promise.resolve({results: [], total: state.totalAssetCount})
   },
-  resetSearch: ({commit}) => commit('setOffset', 0),
+  resetSearch: ({commit}) => commit('setCursor', undefined),
   search: ({commit, state}) => $_search(commit, state),
   setAssetType: ({commit}, assetType) => commit('setAssetType', assetType),
   setCategoryId: ({commit}, categoryId) => commit('setCategoryId', categoryId),
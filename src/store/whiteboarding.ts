@@ -102,6 +102,7 @@ const mutations = {
       if (existing) {
         existing.assetId = whiteboardElement.assetId
         existing.element = _.cloneDeep(whiteboardElement.element)
+        existing.version = whiteboardElement.version
       } else {
         state.whiteboard.whiteboardElements.push(whiteboardElement)
       }
@@ -6,7 +6,7 @@ import Vue from 'vue'
 import {io} from 'socket.io-client'
 import {fabric} from 'fabric'
 import {v4 as uuidv4} from 'uuid'
-import {deleteWhiteboardElement, updateWhiteboardElementsOrder, upsertWhiteboardElements} from '@/api/whiteboard-elements'
+import {deleteWhiteboardElement, updateWhiteboardElementsOrder} from '@/api/whiteboard-elements'
 
 const p = Vue.prototype
 
@@ -593,12 +593,17 @@ const $_addSocketListeners = (state: any) => {
   p.$socket.on('upsert_whiteboard_elements', (data: any) => {
     const promises: any[] = []
     const whiteboardElements: any[] = []
-    _.each(data, (whiteboardElement: any) => {
+    // Updates are broadcast to the whole room in batches; skip our own.
+    _.each(_.reject(data, ['socketId', p.$socket.id]), (whiteboardElement: any) => {
       promises.push(new Promise<void>((resolve: any) => {
-        const element = whiteboardElement.element
         const uuid = whiteboardElement.uuid
+        const version = whiteboardElement.version
         const existing: any = $_getCanvasElement(uuid)
         if (existing) {
+          // A patch carries only the properties changed, so merge it into the element we already have.
+          const saved: any = _.find(state.whiteboard.whiteboardElements, ['uuid', uuid])
+          const assetId = whiteboardElement.patch ? _.get(saved, 'assetId') : whiteboardElement.assetId
+          const element = whiteboardElement.patch ? _.assignIn(existing.toObject(), whiteboardElement.patch) : whiteboardElement.element
           // Deactivate the current group if any of the updated elements are in the current group
           $_deactivateGroupIfOverlap(uuid)
           updatePreviewImage(element, state, uuid).then((modified: boolean) => {
@@ -606,19 +611,20 @@ const $_addSocketListeners = (state: any) => {
             if (modified) {
               $_assignIn(existing, element)
               $_ensureWithinCanvas(existing)
-              whiteboardElements.push({
-                assetId: whiteboardElement.assetId,
-                element,
-                uuid
-              })
             }
+            whiteboardElements.push({assetId, element, uuid, version})
             resolve()
           })
+        } else if (whiteboardElement.patch) {
+          // There is nothing here to patch. The next full snapshot of the element will bring it.
+          $_log(`socket.on upsert_whiteboard_elements: No element to patch where uuid = ${uuid}`, true)
+          resolve()
         } else {
-          $_deserializeElement(state, element).then((e: any) => {
+          $_deserializeElement(state, whiteboardElement.element).then((e: any) => {
             // Add the element to the whiteboard canvas and move it to its appropriate index
             store.commit('whiteboarding/pushRemoteUUID', e.uuid)
             p.$canvas.add(e)
+            whiteboardElements.push({assetId: whiteboardElement.assetId, element: whiteboardElement.element, uuid, version})
             resolve()
           })
         }
@@ -714,10 +720,17 @@ const $_broadcastUpsert = (whiteboardElements: any[], state: any) => {
   $_log('Upsert whiteboard elements')
   return new Promise<void>(resolve => {
     const whiteboardId = state.whiteboard.id
-    const apiCall = () => upsertWhiteboardElements(p.$socket.id, whiteboardElements, whiteboardId).then((data: any) => {
-      store.dispatch('whiteboarding/onWhiteboardElementsUpsert', data).then(resolve)
-    })
-    $_invokeWithSocketConnectRetry('whiteboard elements upsert', apiCall, state)
+    const upserts = _.compact(_.map(whiteboardElements, (whiteboardElement: any) => $_toWhiteboardElementPatch(whiteboardElement, state)))
+    if (upserts.length) {
+      const apiCall = () => {
+        p.$socket.emit('upsert_whiteboard_element', {whiteboardElements: upserts, whiteboardId}, (data: any) => {
+          $_onWhiteboardElementsUpserted(whiteboardElements, _.get(data, 'whiteboardElements'), state).then(resolve)
+        })
+      }
+      $_invokeWithSocketConnectRetry('whiteboard elements upsert', apiCall, state)
+    } else {
+      resolve()
+    }
   })
 }
 
@@ -977,13 +990,37 @@ const $_log = (statement: string, force?: boolean) => {
   }
 }
 
+const $_onWhiteboardElementsUpserted = (whiteboardElements: any[], results: any[], state: any) => {
+  // The server acknowledges each element with its new version. Where our version was out of date, it sends the full
+  // element instead, and that snapshot replaces what we have on the canvas.
+  const promises = _.map(results, (result: any) => new Promise<any>(resolve => {
+    const whiteboardElement = _.find(whiteboardElements, ['uuid', result.uuid])
+    if (result.element) {
+      updatePreviewImage(result.element, state, result.uuid).then(() => {
+        const existing: any = $_getCanvasElement(result.uuid)
+        if (existing) {
+          $_assignIn(existing, result.element)
+          $_ensureWithinCanvas(existing)
+        }
+        resolve({...whiteboardElement, assetId: result.assetId, element: result.element, version: result.version})
+      })
+    } else {
+      resolve({...whiteboardElement, version: result.version})
+    }
+  }))
+  return Promise.all(promises).then((upserted: any[]) => {
+    p.$canvas.requestRenderAll()
+    return store.dispatch('whiteboarding/onWhiteboardElementsUpsert', upserted)
+  })
+}
+
 const $_paste = (state: any): void => {
   $_log('Paste')
   if (state.clipboard.length) {
     p.$canvas.discardActiveObject()
     const promises: any[] = []
+    // Pasted elements go on top, both on our canvas and in the z-index the server gives new elements as it saves them.
     const whiteboardElements: any[] = []
-    let zIndex = Math.max(_.map(state.whiteboard.whiteboardElements, 'zIndex')) + 1
     _.each(state.clipboard, element => {
       if (element.type !== constants.FABRIC_MULTIPLE_SELECT_TYPE) {
         promises.push(new Promise<void>((resolve: any) => {
@@ -998,10 +1035,8 @@ const $_paste = (state: any): void => {
             whiteboardElements.push({
               assetId: clone.assetId,
               element: clone,
-              uuid,
-              zIndex
+              uuid
             })
-            zIndex++
             resolve()
           })
         }))
@@ -1069,6 +1104,22 @@ const $_scaleImageObject = (element: any, state: any) => {
 
 const $_setModifyingElement = (value: boolean) => store.commit('whiteboarding/setIsModifyingElement', value)
 
+const $_toWhiteboardElementPatch = (whiteboardElement: any, state: any) => {
+  // An element of which we hold a version goes out as a patch: the properties changed since that version.
+  const saved: any = _.find(state.whiteboard.whiteboardElements, ['uuid', whiteboardElement.uuid])
+  if (saved && saved.version && saved.element) {
+    const patch = _.omitBy(whiteboardElement.element, (value: any, key: string) => {
+      return key === 'uuid' || _.isEqual(value, saved.element[key])
+    })
+    if (_.isEmpty(patch)) {
+      return null
+    } else if (!_.has(patch, 'type')) {
+      return {patch, uuid: whiteboardElement.uuid, version: saved.version}
+    }
+  }
+  return whiteboardElement
+}
+
 const $_translateIntoWhiteboardElement = (fabricObject: any) => {
   const element = fabricObject.toObject()
   // Force serialization to include properties that fabric.js assumes by default aren't worth its while.
@@ -23,23 +23,48 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+import hashlib
 import json
 import os
 from random import randrange
 
 from moto import mock_s3
 import responses
-from squiggy import std_commit
+from sqlalchemy.sql import text
+from squiggy import db, std_commit
+from squiggy.lib.aws import get_s3_metrics
 from squiggy.lib.util import is_student, is_teaching
 from squiggy.models.activity import Activity
 from squiggy.models.asset import Asset
+from squiggy.models.comment import Comment
 from squiggy.models.course import Course
+from squiggy.models.stored_file import StoredFile
 from squiggy.models.user import User
-from tests.util import mock_s3_bucket
+from tests.util import mock_s3_bucket, override_config
 
 unauthorized_user_id = '666'
 
 
+def _hash_fixture_file():
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+    with open(f'{base_dir}/fixtures/mock_file_upload/the_gift.txt', 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _create_file_asset(app, s3, mock_asset, body):
+    key = f'asset/{mock_asset.course_id}/group_report.pdf'
+    s3.Object(app.config['S3_BUCKET'], key).put(Body=body, ContentType='application/pdf')
+    return Asset.create(
+        asset_type='file',
+        course_id=mock_asset.course_id,
+        created_by=mock_asset.created_by,
+        download_url=f"s3://{app.config['S3_BUCKET']}/{key}",
+        mime='application/pdf',
+        title='Group report',
+        users=mock_asset.users,
+    )
+
+
 def _api_get_asset(asset_id, client, expected_status_code=200):
     response = client.get(f'/api/asset/{asset_id}')
     assert response.status_code == expected_status_code
@@ -159,6 +184,40 @@ class TestDownloadAsset:
         # TODO: Mock S3 so authorized user actually gets download. For now, 404 oddly indicates success.
         self._api_download_asset(app, asset_id=mock_asset.id, client=client, expected_status_code=404)
 
+    def test_proxied_download(self, app, client, fake_auth, mock_asset):
+        """Proxied download streams the file, and honors Range and If-None-Match."""
+        with mock_s3_bucket(app) as s3:
+            asset = _create_file_asset(app, s3, mock_asset, body=b'%PDF-1.4 a group report')
+            fake_auth.login(mock_asset.created_by)
+            bytes_streamed = get_s3_metrics()['downloadBytesStreamed']
+            response = client.get(f'/api/asset/{asset.id}/download')
+            assert response.status_code == 200
+            assert response.data == b'%PDF-1.4 a group report'
+            assert response.headers['Accept-Ranges'] == 'bytes'
+            assert response.headers['Content-disposition'].startswith('attachment; filename="Group_report_')
+            etag = response.headers['ETag']
+
+            response = client.get(f'/api/asset/{asset.id}/download', headers={'Range': 'bytes=9-'})
+            assert response.status_code == 206
+            assert response.data == b'a group report'
+            assert response.headers['Content-Range'] == 'bytes 9-22/23'
+
+            response = client.get(f'/api/asset/{asset.id}/download', headers={'If-None-Match': etag})
+            assert response.status_code == 304
+            assert response.data == b''
+            assert get_s3_metrics()['downloadBytesStreamed'] == bytes_streamed + 23 + 14
+
+    def test_redirected_download(self, app, client, fake_auth, mock_asset):
+        """Redirected download sends the browser to a presigned S3 URL that names the file."""
+        with mock_s3_bucket(app) as s3, override_config(app, 'ASSET_DOWNLOAD_MODE', 'redirect'):
+            asset = _create_file_asset(app, s3, mock_asset, body=b'%PDF-1.4 a group report')
+            fake_auth.login(mock_asset.created_by)
+            response = client.get(f'/api/asset/{asset.id}/download')
+            assert response.status_code == 302
+            location = response.headers['Location']
+            assert f"{app.config['S3_BUCKET']}" in location
+            assert 'response-content-disposition=attachment' in location
+
 
 class TestGetAssets:
 
@@ -168,6 +227,7 @@ class TestGetAssets:
             client,
             asset_type=None,
             category_id=None,
+            cursor=None,
             expected_status_code=200,
             group_id=None,
             keywords=None,
@@ -180,6 +240,7 @@ class TestGetAssets:
         params = {
             'assetType': asset_type,
             'categoryId': category_id,
+            'cursor': cursor,
             'groupId': group_id,
             'keywords': keywords,
             'limit': limit,
@@ -340,6 +401,101 @@ class TestGetAssets:
         )
         assert api_json['total'] == 0
 
+    def test_keyword_search(self, authorized_user_id, client, fake_auth, mock_asset):
+        """Keywords match word prefixes in titles, category titles, link URLs and comments."""
+        fake_auth.login(authorized_user_id)
+        for keywords in ('Mock ass', 'visible=TRUE', 'wikiped', 'poor girl'):
+            api_json = self._api_get_assets(client, keywords=keywords)
+            assert mock_asset.id in [a['id'] for a in api_json['results']]
+            assert 'searchVector' not in api_json['results'][0]
+        assert self._api_get_assets(client, keywords='xylophone')['total'] == 0
+        Comment.create(asset=mock_asset, body='A xylophone solo', user_id=mock_asset.users[0].id)
+        api_json = self._api_get_assets(client, keywords='xylo')
+        assert [a['id'] for a in api_json['results']] == [mock_asset.id]
+
+    def test_keyword_search_by_relevance(self, authorized_user_id, client, fake_auth):
+        """A title match outranks a description match."""
+        user = User.find_by_id(authorized_user_id)
+        fake_auth.login(user.id)
+        title_match = Asset.create(
+            asset_type='link',
+            course_id=user.course_id,
+            created_by=user.id,
+            title='Quokka',
+            url='https://www.example.com/1',
+            users=[user],
+        )
+        description_match = Asset.create(
+            asset_type='link',
+            course_id=user.course_id,
+            created_by=user.id,
+            description='Quokka',
+            title='Marsupial',
+            url='https://www.example.com/2',
+            users=[user],
+        )
+        asset_ids = [a['id'] for a in self._api_get_assets(client, keywords='quok', order_by='relevance')['results']]
+        assert asset_ids == [title_match.id, description_match.id]
+        asset_ids = [a['id'] for a in self._api_get_assets(client, keywords='quok', order_by='recent')['results']]
+        assert asset_ids == [description_match.id, title_match.id]
+
+    def test_cursor_pagination(self, authorized_user_id, client, fake_auth, mock_asset):
+        """Paging by cursor returns the same assets, in the same order, as one big page."""
+        fake_auth.login(authorized_user_id)
+        for order_by in ('recent', 'likes', 'comments'):
+            expected_ids = [a['id'] for a in self._api_get_assets(client, limit=100, order_by=order_by)['results']]
+            assert len(expected_ids) > 2
+            asset_ids = []
+            api_json = self._api_get_assets(client, limit=2, order_by=order_by)
+            while True:
+                asset_ids += [a['id'] for a in api_json['results']]
+                if not api_json['nextCursor']:
+                    break
+                api_json = self._api_get_assets(client, cursor=api_json['nextCursor'], limit=2, order_by=order_by)
+            assert asset_ids == expected_ids
+
+    def test_cursor_pagination_by_relevance(self, authorized_user_id, client, fake_auth):
+        """Paging by relevance loses no asset whose rank ties with the last one on the previous page."""
+        user = User.find_by_id(authorized_user_id)
+        fake_auth.login(user.id)
+        for i in range(5):
+            for field in ('title', 'description'):
+                Asset.create(
+                    asset_type='link',
+                    course_id=user.course_id,
+                    created_by=user.id,
+                    url=f'https://www.example.com/wombat/{field}/{i}',
+                    users=[user],
+                    **{'description': None, 'title': f'Marsupial {i}', field: f'Wombat {i}'},
+                )
+        expected_ids = [a['id'] for a in self._api_get_assets(client, keywords='wombat', limit=100, order_by='relevance')['results']]
+        assert len(expected_ids) == 10
+        for limit in (1, 2, 3):
+            asset_ids = []
+            api_json = self._api_get_assets(client, keywords='wombat', limit=limit, order_by='relevance')
+            while True:
+                asset_ids += [a['id'] for a in api_json['results']]
+                if not api_json['nextCursor'] or len(asset_ids) > len(expected_ids):
+                    break
+                api_json = self._api_get_assets(client, cursor=api_json['nextCursor'], keywords='wombat', limit=limit, order_by='relevance')
+            assert asset_ids == expected_ids
+
+    def test_invalid_cursor(self, authorized_user_id, client, fake_auth):
+        """Rejects a cursor it did not issue."""
+        fake_auth.login(authorized_user_id)
+        self._api_get_assets(client, cursor='not-a-cursor', expected_status_code=400)
+
+    def test_cached_total(self, app, authorized_user_id, client, fake_auth, mock_asset):
+        """Reuses the total while paging, until assets in the course change."""
+        fake_auth.login(authorized_user_id)
+        with override_config(app, 'ASSET_TOTAL_CACHE_TTL_SECONDS', 60):
+            api_json = self._api_get_assets(client)
+            total = api_json['total']
+            db.session.execute(text('UPDATE assets SET deleted_at = now() WHERE id = :id'), {'id': mock_asset.id})
+            assert self._api_get_assets(client)['total'] == total
+            Asset.delete(next(a['id'] for a in api_json['results'] if a['id'] != mock_asset.id))
+            assert self._api_get_assets(client)['total'] == total - 2
+
 
 class TestCreateAsset:
 
@@ -482,6 +638,14 @@ class TestCreateAsset:
             assert len(categories) == 0
         assert User.find_by_id(authorized_user_id).points == user_points + 5
 
+    def test_create_oversized_file_asset(self, client, app, fake_auth, authorized_user_id):
+        """Refuses a file larger than the upload limit, and leaves nothing behind in S3."""
+        fake_auth.login(authorized_user_id)
+        with mock_s3_bucket(app) as s3, override_config(app, 'ASSET_UPLOAD_MAX_BYTES', 4096):
+            api_json = self._api_create_file_asset(client, expected_status_code=400)
+            assert api_json['message'] == 'File exceeds the maximum upload size of 4096 bytes.'
+            assert list(s3.Bucket(app.config['S3_BUCKET']).objects.all()) == []
+
     @mock_s3
     def test_bookmarklet_create_file_asset(self, client, app, fake_auth, authorized_user_id):
         """Authorized user can create an asset with the Bookmarklet."""
@@ -495,10 +659,31 @@ class TestCreateAsset:
                 url=f'https://en.wikipedia.org/static/favicon/{filename}#anchor?ref=#?uestlove',
             )
             assert 'id' in api_json
+            # Stored under the hash of its content, with the extension of the name parsed from the URL.
             download_url = api_json['downloadUrl']
-            assert download_url and download_url.endswith(f'-{filename}')
+            assert download_url and download_url.endswith(f'/{_hash_fixture_file()}.ico')
         assert User.find_by_id(authorized_user_id).points == user_points + 5
 
+    def test_create_duplicate_file_asset(self, client, app, fake_auth, authorized_user_id):
+        """The same file uploaded twice is stored once, and shares the first upload's previews."""
+        fake_auth.login(authorized_user_id)
+        course_id = User.find_by_id(authorized_user_id).course_id
+        with mock_s3_bucket(app) as s3:
+            first = self._api_create_file_asset(client)
+            Asset.find_by_id(first['id']).update_preview(preview_status='done', thumbnail_url='https://www.example.com/thumbnail.png')
+            second = self._api_create_file_asset(client, title='The Gift')
+            assert second['downloadUrl'] == first['downloadUrl']
+            assert second['previewStatus'] == 'done'
+            assert second['thumbnailUrl'] == 'https://www.example.com/thumbnail.png'
+            assert len(list(s3.Bucket(app.config['S3_BUCKET']).objects.all())) == 1
+
+            stored_file = StoredFile.find(course_id, _hash_fixture_file())
+            assert stored_file.download_url == first['downloadUrl']
+            assert stored_file.ref_count == 2
+            Asset.delete(second['id'])
+            db.session.refresh(stored_file)
+            assert stored_file.ref_count == 1
+
     def test_asset_creation_activity(self, authorized_user_id, client, fake_auth):
         user = User.find_by_id(authorized_user_id)
         fake_auth.login(user.id)
@@ -43,6 +43,12 @@ def _api_get_course(client, course_id, expected_status_code=200):
     return response.json
 
 
+def _api_get_poll_queue(client, expected_status_code=200):
+    response = client.get('/api/courses/poll_queue?canvasApiDomain=bcourses.berkeley.edu')
+    assert response.status_code == expected_status_code
+    return response.json
+
+
 def _api_get_users(client, course_id, expected_status_code=200):
     response = client.get(f'/api/course/{course_id}/advanced_asset_search_options')
     assert response.status_code == expected_status_code
@@ -96,6 +102,27 @@ class TestGetCourse:
         assert user.id in [user['id'] for user in api_json['users']]
 
 
+class TestGetPollQueue:
+
+    def test_anonymous(self, client):
+        """Denies anonymous user."""
+        _api_get_poll_queue(client, expected_status_code=401)
+
+    def test_student(self, client, fake_auth, student_id):
+        """Denies student."""
+        fake_auth.login(student_id)
+        _api_get_poll_queue(client, expected_status_code=401)
+
+    def test_admin(self, client, fake_auth):
+        """Admin gets active courses in poll order."""
+        admin = User.query.filter_by(canvas_course_role='Administrator', canvas_enrollment_state='active').first()
+        fake_auth.login(admin.id)
+        api_json = _api_get_poll_queue(client)
+        assert len(api_json)
+        assert all(c['canvasApiDomain'] == 'bcourses.berkeley.edu' for c in api_json)
+        assert 'pollPriority' in api_json[0]
+
+
 class TestProtectsAssetsPerSection:
 
     def _api_protect_assets_per_section(
@@ -26,6 +26,9 @@ ENHANCEMENTS, OR MODIFICATIONS.
 from datetime import datetime
 
 from squiggy.lib.previews import generate_preview_service_signature
+from squiggy.models.asset import Asset
+from squiggy.models.preview_request import PreviewRequest
+from tests.util import override_config
 
 
 class TestPreviews:
@@ -88,3 +91,40 @@ class TestPreviews:
         assert mock_asset.preview_metadata['imageWidth'] == 200
         assert mock_asset.preview_metadata['imageHeight'] == 100
         assert mock_asset.preview_metadata['updatedAt'] is not None
+
+    def test_copies_of_same_file(self, app, client, mock_asset):
+        """Assets of the same file share finished previews of a live asset, and otherwise get preview requests of their own."""
+        mock_asset.content_hash = 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855'
+        mock_asset.preview_status = 'pending'
+
+        def _copy():
+            with override_config(app, 'PREVIEWS_ENABLED', True):
+                copy = Asset.create(
+                    asset_type='file',
+                    content_hash=mock_asset.content_hash,
+                    course_id=mock_asset.course_id,
+                    created_by=mock_asset.created_by,
+                    download_url=mock_asset.download_url,
+                    title='Copy',
+                    users=mock_asset.users,
+                )
+            preview_requests = PreviewRequest.query.filter_by(object_id=copy.id).all()
+            # The mock_asset fixture commits at teardown, and the queue must not keep these.
+            PreviewRequest.delete([r.id for r in preview_requests])
+            return copy, len(preview_requests)
+
+        # Previews still pending may never arrive, so the copy does not wait on them.
+        pending_copy, request_count = _copy()
+        assert (pending_copy.preview_status, request_count) == ('pending', 1)
+
+        header = generate_preview_service_signature()
+        self._api_post_preview_callback(client, header, {'id': mock_asset.id, 'status': 'done', 'thumbnail': 'https://imgur.com/gallery/QZmb5KU'})
+        assert pending_copy.preview_status == 'pending'
+        done_copy, request_count = _copy()
+        assert (done_copy.preview_status, done_copy.thumbnail_url, request_count) == ('done', 'https://imgur.com/gallery/QZmb5KU', 0)
+
+        # Nor are previews borrowed from deleted assets.
+        Asset.delete(mock_asset.id)
+        Asset.delete(done_copy.id)
+        copy_of_deleted, request_count = _copy()
+        assert (copy_of_deleted.preview_status, request_count) == ('pending', 1)
@@ -52,6 +52,7 @@ class TestStatusController:
             assert response.json['app'] is True
             assert response.json['cache'] is False
             assert response.json['db'] is True
+            assert response.json['previewQueue']['queueDepth'] == 0
             assert response.json['previewService'] is False
             assert response.json['poller'] is expected_ping_value
             assert response.json['whiteboards'] is expected_ping_value
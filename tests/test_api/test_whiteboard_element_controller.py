@@ -23,12 +23,14 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from contextlib import contextmanager
 import json
 from random import randint
 from uuid import uuid4
 
 from moto import mock_s3
-from squiggy import std_commit
+from sqlalchemy import event
+from squiggy import db, std_commit
 from squiggy.lib.util import is_admin, is_student, is_teaching
 from squiggy.models.activity import Activity
 from squiggy.models.asset import Asset
@@ -163,6 +165,48 @@ class TestUpsertWhiteboardElement:
             assert updated_whiteboard_element
             assert updated_whiteboard_element['element']['fill'] == updated_fill
 
+    def test_unknown_asset(self, client, fake_auth, mock_whiteboard):
+        """Rejects an element of an asset not in the course."""
+        fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+        whiteboard_element = {**_mock_text_element('Asset of nowhere'), 'assetId': 999999999}
+        self._api_upsert_whiteboard_element(
+            client=client,
+            expected_status_code=400,
+            whiteboard_elements=[whiteboard_element],
+            whiteboard_id=mock_whiteboard['id'],
+        )
+
+    def test_batch_upsert(self, client, fake_auth, mock_whiteboard):
+        """A large paste is written in a few statements, with new elements stacked on top in order."""
+        fake_auth.login(_get_authorized_user_id(mock_whiteboard))
+        whiteboard_id = mock_whiteboard['id']
+        existing = mock_whiteboard['whiteboardElements'][0]
+        existing['element']['fill'] = 'rgb(1,2,3)'
+        pasted = [_mock_text_element(f'Pasted {i}') for i in range(200)]
+
+        with _capture_statements() as statements:
+            results = self._api_upsert_whiteboard_element(
+                client=client,
+                whiteboard_elements=[existing] + pasted,
+                whiteboard_id=whiteboard_id,
+            )
+        assert len([s for s in statements if 'whiteboard_elements' in s]) == 2
+        assert [r['uuid'] for r in results] == [existing['uuid']] + [p['uuid'] for p in pasted]
+
+        max_z_index = max(w['zIndex'] for w in mock_whiteboard['whiteboardElements'])
+        assert results[0]['zIndex'] == existing['zIndex']
+        assert results[0]['element']['fill'] == 'rgb(1,2,3)'
+        assert [r['zIndex'] for r in results[1:]] == list(range(max_z_index + 1, max_z_index + 201))
+
+        # Pasting the same elements again updates them in place.
+        for p in pasted:
+            p['element']['text'] = p['element']['text'].upper()
+        results = self._api_upsert_whiteboard_element(client=client, whiteboard_elements=pasted, whiteboard_id=whiteboard_id)
+        assert [r['zIndex'] for r in results] == list(range(max_z_index + 1, max_z_index + 201))
+        whiteboard_elements = _api_get_whiteboard(client, whiteboard_id)['whiteboardElements']
+        assert len(whiteboard_elements) == len(mock_whiteboard['whiteboardElements']) + 200
+        assert whiteboard_elements[-1]['element']['text'] == 'PASTED 199'
+
 
 class TestDeleteWhiteboardElements:
 
@@ -399,3 +443,32 @@ def _mock_whiteboard_element():
         },
         'uuid': uuid,
     }
+
+
+def _mock_text_element(text):
+    uuid = str(uuid4())
+    return {
+        'assetId': None,
+        'element': {
+            'fill': 'rgb(0,0,0)',
+            'fontSize': 14,
+            'text': text,
+            'type': 'i-text',
+            'uuid': uuid,
+        },
+        'uuid': uuid,
+    }
+
+
+@contextmanager
+def _capture_statements():
+    statements = []
+
+    def _capture(conn, cursor, statement, *args):
+        statements.append(statement)
+    engine = db.session.get_bind().engine
+    event.listen(engine, 'before_cursor_execute', _capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', _capture)
@@ -0,0 +1,136 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from canvasapi.section import Section
+import responses
+from squiggy.externals.canvas import CanvasThrottle, fan_out, get_canvas, get_paginated_if_changed
+from tests.util import override_config
+
+base_url = 'https://canvas.example.edu/api/v1/courses/1/sections'
+
+
+def _requester():
+    return get_canvas('https://canvas.example.edu', 'token').requester
+
+
+def _add_pages(page_count, numbered=False):
+    def _callback(request):
+        page = int(request.params.get('page', 1))
+        etag = f'etag-{page}'
+        headers = {'ETag': etag}
+        links = []
+        if page < page_count:
+            links.append(f'<{base_url}?page={page + 1}&per_page=100>; rel="next"')
+        if numbered:
+            links.append(f'<{base_url}?page={page_count}&per_page=100>; rel="last"')
+        if links:
+            headers['Link'] = ', '.join(links)
+        if request.headers.get('If-None-Match') == etag:
+            return 304, headers, ''
+        return 200, headers, f'[{{"id": {page}, "name": "Section {page}"}}]'
+    responses.add_callback(responses.GET, base_url, callback=_callback)
+
+
+class TestGetPaginatedIfChanged:
+    """Conditional fetch of paginated Canvas lists."""
+
+    @responses.activate
+    def test_first_fetch(self):
+        """Without ETags, fetches every page and records their ETags."""
+        _add_pages(2)
+        sections, etags = get_paginated_if_changed(_requester(), Section, 'courses/1/sections')
+        assert [s.name for s in sections] == ['Section 1', 'Section 2']
+        assert etags == ['etag-1', 'etag-2']
+        assert 'If-None-Match' not in responses.calls[0].request.headers
+
+    @responses.activate
+    def test_unchanged(self):
+        """When Canvas reports every page unchanged, returns None."""
+        _add_pages(2)
+        sections, etags = get_paginated_if_changed(_requester(), Section, 'courses/1/sections', etags=['etag-1', 'etag-2'])
+        assert sections is None
+        assert etags == ['etag-1', 'etag-2']
+        assert responses.calls[0].request.headers['If-None-Match'] == 'etag-1'
+        assert responses.calls[1].request.headers['If-None-Match'] == 'etag-2'
+
+    @responses.activate
+    def test_partially_changed(self):
+        """When some pages changed, re-fetches all pages."""
+        _add_pages(2)
+        sections, etags = get_paginated_if_changed(_requester(), Section, 'courses/1/sections', etags=['etag-1', 'stale'])
+        assert [s.name for s in sections] == ['Section 1', 'Section 2']
+        assert etags == ['etag-1', 'etag-2']
+        assert len(responses.calls) == 4
+
+    @responses.activate
+    def test_numbered_pages(self):
+        """When Canvas reports the last page number, fetches the remaining pages concurrently and keeps them in order."""
+        _add_pages(6, numbered=True)
+        sections, etags = get_paginated_if_changed(_requester(), Section, 'courses/1/sections')
+        assert [s.name for s in sections] == [f'Section {page}' for page in range(1, 7)]
+        assert etags == [f'etag-{page}' for page in range(1, 7)]
+        assert len(responses.calls) == 6
+
+    @responses.activate
+    def test_concurrent_requests(self, app):
+        """Threads that share a requester each keep their own record of recent responses."""
+        _add_pages(1)
+        requester = _requester()
+        requester.request('GET', 'courses/1/sections')
+        with override_config(app, 'CANVAS_API_MAX_CONCURRENCY', 4):
+            caches = fan_out(lambda _: (requester.request('GET', 'courses/1/sections'), requester._cache)[1], range(8))
+        assert len(responses.calls) == 9
+        assert len(requester._cache) == 1
+        assert all(1 <= len(cache) <= 5 for cache in caches)
+
+
+class TestCanvasThrottle:
+    """Rate-limit-aware concurrency."""
+
+    def test_adapts_to_rate_limit_remaining(self):
+        """Halves concurrency when the quota runs low and recovers one step at a time."""
+        throttle = CanvasThrottle(max_concurrency=8, rate_limit_threshold=200)
+        throttle.update('150.5')
+        throttle.update('120.0')
+        assert throttle.concurrency == 2
+        throttle.update('700.0')
+        assert throttle.concurrency == 3
+        throttle.update(None)
+        assert throttle.concurrency == 3
+        for i in range(10):
+            throttle.update('700.0')
+        assert throttle.concurrency == 8
+
+    @responses.activate
+    def test_retries_when_rate_limited(self, app):
+        """Backs off and retries a request rejected for exceeding the rate limit."""
+        responses.add(responses.GET, base_url, body='403 Forbidden (Rate Limit Exceeded)', status=403)
+        responses.add(responses.GET, base_url, json=[{'id': 1, 'name': 'Section 1'}], headers={'X-Rate-Limit-Remaining': '600.0'})
+        with override_config(app, 'CANVAS_API_RATE_LIMIT_BACKOFF_SECONDS', 0):
+            requester = _requester()
+            response = requester.request('GET', 'courses/1/sections', _kwargs=[('per_page', 100)])
+        assert response.json()[0]['name'] == 'Section 1'
+        assert len(responses.calls) == 2
+        assert responses.calls[1].request.url == responses.calls[0].request.url
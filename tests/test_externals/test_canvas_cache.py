@@ -0,0 +1,111 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import json
+import os
+import time
+
+import responses
+from squiggy.externals.canvas import get_canvas
+from squiggy.externals.canvas_cache import CanvasResponseCache, DiskCacheStore, get_cache_metrics
+
+tabs_url = 'https://canvas.example.edu/api/v1/courses/1/tabs'
+tabs_json = [{'id': 'home', 'html_url': '/courses/1'}, {'id': 'context_external_tool_1', 'html_url': '/courses/1/external_tools/1'}]
+
+
+def _canvas(app, tmp_path):
+    canvas = get_canvas('https://canvas.example.edu', 'token')
+    canvas.requester.response_cache = _disk_cache(app, tmp_path)
+    return canvas
+
+
+def _disk_cache(app, tmp_path):
+    store = DiskCacheStore(str(tmp_path), app.config['CANVAS_API_CACHE_TTL_SECONDS'])
+    return CanvasResponseCache(store, app.config['CANVAS_API_CACHE_ENDPOINTS'])
+
+
+def _add_tabs(etag):
+    def _callback(request):
+        if request.headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, ''
+        return 200, {'ETag': etag}, json.dumps(tabs_json)
+    responses.add_callback(responses.GET, tabs_url, callback=_callback)
+
+
+class TestCanvasResponseCache:
+    """Canvas API response cache."""
+
+    @responses.activate
+    def test_revalidates_cached_response(self, app, tmp_path):
+        """Serves an unchanged response from cache after revalidating with If-None-Match."""
+        _add_tabs('"v1"')
+        before = get_cache_metrics('canvas.example.edu')
+        requester = _canvas(app, tmp_path).requester
+
+        first = requester.request('GET', 'courses/1/tabs')
+        second = requester.request('GET', 'courses/1/tabs')
+        assert first.json() == second.json() == tabs_json
+        assert 'If-None-Match' not in responses.calls[0].request.headers
+        assert responses.calls[1].request.headers['If-None-Match'] == '"v1"'
+
+        after = get_cache_metrics('canvas.example.edu')
+        assert after['hits'] - before['hits'] == 1
+        assert after['misses'] - before['misses'] == 1
+        assert after['bytesSaved'] - before['bytesSaved'] == len(json.dumps(tabs_json))
+
+    @responses.activate
+    def test_changed_response(self, app, tmp_path):
+        """Replaces the cached copy when Canvas reports a change."""
+        _add_tabs('"v1"')
+        requester = _canvas(app, tmp_path).requester
+        requester.request('GET', 'courses/1/tabs')
+        responses.reset()
+        _add_tabs('"v2"')
+        assert requester.request('GET', 'courses/1/tabs').headers['ETag'] == '"v2"'
+        assert requester.request('GET', 'courses/1/tabs').status_code == 200
+        assert responses.calls[-1].request.headers['If-None-Match'] == '"v2"'
+
+    def test_cacheable_endpoints(self, app, tmp_path):
+        """Caches only the configured endpoints."""
+        cache = _disk_cache(app, tmp_path)
+        assert cache.is_cacheable('https://canvas.example.edu/api/v1/courses/1/tabs')
+        assert cache.is_cacheable('https://canvas.example.edu/api/v1/courses/1/assignments?page=2&per_page=100')
+        assert not cache.is_cacheable('https://canvas.example.edu/api/v1/courses/1/assignments/2/submissions')
+        assert not cache.is_cacheable('https://canvas.example.edu/api/v1/courses/1/discussion_topics')
+
+    def test_disk_cache_expiry(self, tmp_path):
+        """Treats disk cache entries older than the TTL as misses, and prunes them."""
+        store = DiskCacheStore(str(tmp_path), 60)
+        store.put('canvas.example.edu/fresh', {'body': 'fresh'})
+        store.put('canvas.example.edu/stale', {'body': 'stale'})
+        stale_path = os.path.join(str(tmp_path), 'canvas.example.edu', 'stale.json')
+        an_hour_ago = time.time() - 3600
+        os.utime(stale_path, (an_hour_ago, an_hour_ago))
+        assert store.get('canvas.example.edu/fresh') == {'body': 'fresh'}
+        assert store.get('canvas.example.edu/stale') is None
+
+        assert store.prune(force=True) == 1
+        assert not os.path.exists(stale_path)
+        assert store.get('canvas.example.edu/fresh') == {'body': 'fresh'}
@@ -0,0 +1,110 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from unittest import mock
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from squiggy import std_commit
+from squiggy.lib import asset_views
+from squiggy.lib.asset_views import buffer_asset_view, flush_asset_views, get_pending_view_count
+from squiggy.lib.util import is_teaching
+from squiggy.models.activity import Activity
+from squiggy.models.asset import Asset
+from squiggy.models.course import Course
+from tests.util import override_config
+
+
+class TestAssetViews:
+    """Write-behind buffer of asset views."""
+
+    def test_views_written_in_batch(self, app, mock_asset):
+        instructors = [u for u in Course.find_by_id(mock_asset.course_id).users if is_teaching(u)]
+        with override_config(app, 'ASSET_VIEWS_FLUSH_INTERVAL_SECONDS', 10):
+            for user in instructors + instructors[:1]:
+                mock_asset.increment_views(user.id)
+            # Nothing is written yet, but the asset already reports the views.
+            assert _get_activities(mock_asset, 'asset_view') == []
+            assert Asset.find_by_id(mock_asset.id).views == 0
+            assert get_pending_view_count(mock_asset.id) == len(instructors) + 1
+            assert mock_asset.to_api_json()['views'] == len(instructors) + 1
+
+            assert flush_asset_views() == len(instructors) + 1
+            assert get_pending_view_count(mock_asset.id) == 0
+            assert Asset.find_by_id(mock_asset.id).views == len(instructors) + 1
+            assert mock_asset.to_api_json()['views'] == len(instructors) + 1
+            assert flush_asset_views() == 0
+
+        views = _get_activities(mock_asset, 'asset_view')
+        assert sorted(a.user_id for a in views) == sorted(u.id for u in instructors + instructors[:1])
+        # Every view credits each asset owner with a reciprocal activity.
+        owner_views = _get_activities(mock_asset, 'get_asset_view')
+        assert [a.user_id for a in owner_views] == [mock_asset.created_by] * len(views)
+        assert sorted(a.reciprocal_id for a in owner_views) == sorted(a.id for a in views)
+        assert sorted(a.actor_id for a in owner_views) == sorted(a.user_id for a in views)
+
+    def test_bad_view_does_not_block_others(self, app, mock_asset):
+        instructor = next(u for u in Course.find_by_id(mock_asset.course_id).users if is_teaching(u))
+        std_commit(allow_test_environment=True)
+        with override_config(app, 'ASSET_VIEWS_FLUSH_INTERVAL_SECONDS', 10):
+            # No such asset, so the foreign key is violated.
+            buffer_asset_view(asset_id=999999999, course_id=mock_asset.course_id, user_id=instructor.id)
+            mock_asset.increment_views(instructor.id)
+            assert flush_asset_views() == 1
+            assert get_pending_view_count(999999999) == 0
+            assert get_pending_view_count(mock_asset.id) == 0
+            assert flush_asset_views() == 0
+        assert Asset.find_by_id(mock_asset.id).views == 1
+        assert [a.user_id for a in _get_activities(mock_asset, 'asset_view')] == [instructor.id]
+
+    def test_views_requeued_when_database_fails(self, app, mock_asset):
+        instructor = next(u for u in Course.find_by_id(mock_asset.course_id).users if is_teaching(u))
+        std_commit(allow_test_environment=True)
+        write_views = asset_views._write_views
+
+        def _write_views(views):
+            # A bad view sends the batch one by one, and then the connection drops.
+            if len(views) == 1:
+                raise OperationalError('INSERT INTO activities', {}, Exception('server closed the connection unexpectedly'))
+            write_views(views)
+
+        with override_config(app, 'ASSET_VIEWS_FLUSH_INTERVAL_SECONDS', 10):
+            buffer_asset_view(asset_id=999999999, course_id=mock_asset.course_id, user_id=instructor.id)
+            mock_asset.increment_views(instructor.id)
+            with mock.patch.object(asset_views, '_write_views', side_effect=_write_views):
+                with pytest.raises(OperationalError):
+                    flush_asset_views()
+            assert get_pending_view_count(999999999) == 1
+            assert get_pending_view_count(mock_asset.id) == 1
+
+            # Once the database is back, the good view is written and the bad one dropped.
+            assert flush_asset_views() == 1
+            assert get_pending_view_count(999999999) == 0
+            assert get_pending_view_count(mock_asset.id) == 0
+        assert Asset.find_by_id(mock_asset.id).views == 1
+
+
+def _get_activities(asset, activity_type):
+    return Activity.query.filter_by(asset_id=asset.id, activity_type=activity_type).all()
@@ -0,0 +1,146 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+import responses
+from squiggy import std_commit
+from squiggy.lib.attachment_ingestion import AttachmentIngestionPipeline
+from squiggy.models.asset import Asset
+from squiggy.models.canvas_attachment import CanvasAttachment
+from squiggy.models.category import Category
+from squiggy.models.course import Course
+from squiggy.models.user import User
+from tests.util import mock_s3_bucket, override_config
+
+attachment_url = 'https://bcourses.berkeley.edu/files/8675309/download?verifier=abc'
+
+
+@pytest.fixture(scope='function')
+def submission_setup():
+    course = Course.find_by_canvas_course_id(canvas_api_domain='bcourses.berkeley.edu', canvas_course_id=1502870)
+    category = Category.create(
+        canvas_assignment_name='Submit here',
+        course_id=course.id,
+        title='Submit here',
+        canvas_assignment_id=24680,
+        visible=True,
+    )
+    users = [
+        User.create(
+            canvas_course_role='Student',
+            canvas_enrollment_state='active',
+            canvas_full_name=f'Group member {canvas_user_id}',
+            canvas_user_id=canvas_user_id,
+            course_id=course.id,
+        ) for canvas_user_id in [7654321, 7654322]
+    ]
+    std_commit()
+    return course, category, users
+
+
+class TestAttachmentIngestionPipeline:
+    """Submission attachment ingestion."""
+
+    @responses.activate
+    def test_streams_attachment_once_per_attachment_id(self, app, submission_setup):
+        """Streams an attachment to S3 once; a later submission of the same attachment joins the existing asset."""
+        course, category, users = submission_setup
+        responses.add(responses.GET, attachment_url, body=b'%PDF-1.4 a group report', status=200)
+        with mock_s3_bucket(app) as s3:
+            pipeline = AttachmentIngestionPipeline(canvas_api_domain='bcourses.berkeley.edu', thread_name_prefix='poller-test')
+            for user in users:
+                pipeline.submit(attachment=_attachment(), assignment_id=24680, category_id=category.id, course_id=course.id, user_id=user.id)
+
+            assert len(responses.calls) == 1
+            canvas_attachment = CanvasAttachment.find(course.id, 8675309)
+            asset = Asset.find_by_id(canvas_attachment.asset_id)
+            assert asset.mime == 'application/pdf'
+            assert sorted(u.id for u in asset.users) == sorted(u.id for u in users)
+            key = canvas_attachment.download_url.split('/', 3)[3]
+            assert s3.Object(app.config['S3_BUCKET'], key).get()['Body'].read() == b'%PDF-1.4 a group report'
+
+            metrics = pipeline.get_metrics()
+            assert metrics['completed'] == 2
+            assert metrics['uploaded'] == 1
+            assert metrics['deduplicated'] == 1
+            assert metrics['bytes'] == len(b'%PDF-1.4 a group report')
+
+    @responses.activate
+    def test_stores_identical_attachments_once(self, app, submission_setup):
+        """Separate attachments with the same content share one S3 object."""
+        course, category, users = submission_setup
+        other_attachment_url = 'https://bcourses.berkeley.edu/files/8675310/download?verifier=def'
+        responses.add(responses.GET, attachment_url, body=b'%PDF-1.4 a group report', status=200)
+        responses.add(responses.GET, other_attachment_url, body=b'%PDF-1.4 a group report', status=200)
+        with mock_s3_bucket(app) as s3:
+            pipeline = AttachmentIngestionPipeline(canvas_api_domain='bcourses.berkeley.edu', thread_name_prefix='poller-test')
+            pipeline.submit(attachment=_attachment(), assignment_id=24680, category_id=category.id, course_id=course.id, user_id=users[0].id)
+            other_attachment = SimpleNamespace(id=8675310, display_name='report.pdf', size=1024, url=other_attachment_url)
+            pipeline.submit(attachment=other_attachment, assignment_id=24680, category_id=category.id, course_id=course.id, user_id=users[1].id)
+
+            first = CanvasAttachment.find(course.id, 8675309)
+            second = CanvasAttachment.find(course.id, 8675310)
+            assert first.asset_id != second.asset_id
+            assert first.download_url == second.download_url
+            assert first.content_hash == second.content_hash == Asset.find_by_id(second.asset_id).content_hash
+            assert len(list(s3.Bucket(app.config['S3_BUCKET']).objects.all())) == 1
+            metrics = pipeline.get_metrics()
+            assert metrics['uploaded'] == 1
+            assert metrics['deduplicated'] == 1
+
+    @responses.activate
+    def test_retries_failed_download(self, app, submission_setup):
+        """Retries a failed download with backoff."""
+        course, category, users = submission_setup
+        responses.add(responses.GET, attachment_url, status=503)
+        responses.add(responses.GET, attachment_url, body=b'plain text', status=200)
+        with mock_s3_bucket(app), override_config(app, 'CANVAS_POLLER_ATTACHMENT_RETRY_SECONDS', 0):
+            pipeline = AttachmentIngestionPipeline(canvas_api_domain='bcourses.berkeley.edu', thread_name_prefix='poller-test')
+            pipeline.submit(attachment=_attachment(), assignment_id=24680, category_id=category.id, course_id=course.id, user_id=users[0].id)
+
+            assert len(responses.calls) == 2
+            assert CanvasAttachment.find(course.id, 8675309).content_type == 'text/plain'
+            metrics = pipeline.get_metrics()
+            assert metrics['retries'] == 1
+            assert metrics['failed'] == 0
+
+    @responses.activate
+    def test_oversized_attachment(self, app, submission_setup):
+        """Gives up, without retrying, on an attachment that turns out to exceed the size limit."""
+        course, category, users = submission_setup
+        responses.add(responses.GET, attachment_url, body=b'x' * 4096, status=200)
+        with mock_s3_bucket(app), override_config(app, 'CANVAS_POLLER_ATTACHMENT_MAX_BYTES', 1024):
+            pipeline = AttachmentIngestionPipeline(canvas_api_domain='bcourses.berkeley.edu', thread_name_prefix='poller-test')
+            pipeline.submit(attachment=_attachment(), assignment_id=24680, category_id=category.id, course_id=course.id, user_id=users[0].id)
+
+            assert len(responses.calls) == 1
+            assert CanvasAttachment.find(course.id, 8675309) is None
+            assert pipeline.get_metrics()['failed'] == 1
+
+
+def _attachment():
+    return SimpleNamespace(id=8675309, display_name='report.pdf', size=1024, url=attachment_url)
@@ -24,8 +24,11 @@ ENHANCEMENTS, OR MODIFICATIONS.
 """
 
 from datetime import datetime
+from unittest import mock
 
-from squiggy.lib.aws import get_s3_signed_url, is_s3_preview_url
+from squiggy.lib import aws
+from squiggy.lib.aws import get_s3_metrics, get_s3_signed_url, is_s3_preview_url
+from tests.util import override_config
 
 
 class TestAws:
@@ -40,3 +43,32 @@ class TestAws:
     def test_recognizes_valid_presigned_url(self):
         presigned = f'https://suitec-preview-images-dev.s3-us-west-2.amazonaws.com/deadd00d?Expires={int(datetime.utcnow().timestamp()) + 4000}'
         assert get_s3_signed_url(presigned) == presigned
+
+    def test_reuses_signed_url(self):
+        url = 'https://suitec-preview-images-dev.s3-us-west-2.amazonaws.com/cafebabe'
+        metrics = get_s3_metrics()
+        signed_url = get_s3_signed_url(url)
+        assert signed_url != url
+        for _ in range(3):
+            assert get_s3_signed_url(url) == signed_url
+        assert get_s3_metrics()['signedUrlCacheHits'] == metrics['signedUrlCacheHits'] + 3
+        assert get_s3_metrics()['signedUrlCacheMisses'] == metrics['signedUrlCacheMisses'] + 1
+        assert get_s3_metrics()['clientsCreated'] <= 1
+
+    def test_resigns_url_close_to_expiry(self):
+        url = 'https://suitec-preview-images-dev.s3-us-west-2.amazonaws.com/0ddba11'
+        get_s3_signed_url(url)
+        metrics = get_s3_metrics()
+        with mock.patch.object(aws.time, 'time', return_value=aws.time.time() + 3601):
+            get_s3_signed_url(url)
+        assert get_s3_metrics()['signedUrlCacheMisses'] == metrics['signedUrlCacheMisses'] + 1
+
+    def test_evicts_least_recently_used(self, app):
+        with override_config(app, 'AWS_S3_SIGNED_URL_CACHE_SIZE', 2):
+            urls = [f'https://suitec-preview-images-dev.s3-us-west-2.amazonaws.com/{i}' for i in range(3)]
+            for url in urls:
+                get_s3_signed_url(url)
+            assert get_s3_metrics()['signedUrlCacheSize'] == 2
+            metrics = get_s3_metrics()
+            get_s3_signed_url(urls[0])
+            assert get_s3_metrics()['signedUrlCacheMisses'] == metrics['signedUrlCacheMisses'] + 1
@@ -0,0 +1,121 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import io
+
+import pytest
+import responses
+from squiggy.lib.previews import generate_previews
+from squiggy.models.asset import Asset
+from squiggy.models.course import Course
+from squiggy.models.stored_file import StoredFile
+from tests.util import mock_s3_bucket, override_config
+
+Image = pytest.importorskip('PIL.Image')
+
+
+class TestLocalPreviews:
+    """In-process preview engine."""
+
+    @responses.activate
+    def test_image(self, app):
+        """Scales images down to web size and thumbnail, without calling the preview service."""
+        image_bytes = io.BytesIO()
+        Image.new('RGB', (2000, 1000), color=(0, 50, 100)).save(image_bytes, format='PNG')
+        with mock_s3_bucket(app) as s3:
+            asset = _create_file_asset(filename='ocean.png', data=image_bytes.getvalue())
+            with override_config(app, 'PREVIEWS_ENABLED', True), override_config(app, 'PREVIEWS_LOCAL_ENABLED', True):
+                assert generate_previews(asset.id, asset.download_url)
+            assert len(responses.calls) == 0
+
+            asset = Asset.find_by_id(asset.id)
+            assert asset.preview_status == 'done'
+            assert asset.preview_metadata['image_width'] == 1280
+            assert asset.preview_metadata['image_height'] == 640
+            assert asset.pdf_url is None
+            assert asset.image_url.startswith('https://some-bucket.s3.')
+            assert asset.to_api_json()['imageUrl'].startswith('https://')
+            assert asset.to_api_json()['imageUrl'] != asset.image_url
+            thumbnail = _get_image(s3, asset.thumbnail_url)
+            assert thumbnail.size == (320, 160)
+            assert thumbnail.format == 'JPEG'
+
+    @responses.activate
+    def test_pdf(self, app):
+        """Rasterizes the first page of a PDF."""
+        pypdfium2 = pytest.importorskip('pypdfium2')
+        pdf = pypdfium2.PdfDocument.new()
+        pdf.new_page(612, 792)
+        pdf.new_page(792, 612)
+        pdf_bytes = io.BytesIO()
+        pdf.save(pdf_bytes)
+        with mock_s3_bucket(app) as s3:
+            asset = _create_file_asset(filename='syllabus.pdf', data=pdf_bytes.getvalue())
+            with override_config(app, 'PREVIEWS_ENABLED', True), override_config(app, 'PREVIEWS_LOCAL_ENABLED', True):
+                assert generate_previews(asset.id, asset.download_url)
+            assert len(responses.calls) == 0
+
+            asset = Asset.find_by_id(asset.id)
+            assert asset.preview_status == 'done'
+            # The PDF viewer gets a signed https URL of the uploaded file.
+            key = asset.download_url.split('/', 3)[3]
+            assert asset.pdf_url == f"https://{app.config['S3_BUCKET']}.s3.{app.config['S3_REGION']}.amazonaws.com/{key}"
+            assert asset.to_api_json()['pdfUrl'] != asset.pdf_url
+            assert asset.preview_metadata['image_width'] == 1280
+            # First page only, portrait.
+            assert abs(asset.preview_metadata['image_height'] - 792 * 1280 / 612) < 2
+            assert _get_image(s3, asset.image_url).size == (1280, asset.preview_metadata['image_height'])
+
+    @responses.activate
+    def test_unsupported_file(self, app):
+        """Leaves other files to the preview service."""
+        responses.add(responses.POST, app.config['PREVIEWS_URL'], status=200)
+        with mock_s3_bucket(app):
+            asset = _create_file_asset(filename='the_gift.txt', data=b'A perfect gift for a perfect day.')
+            with override_config(app, 'PREVIEWS_ENABLED', True), override_config(app, 'PREVIEWS_LOCAL_ENABLED', True):
+                assert generate_previews(asset.id, asset.download_url)
+            assert len(responses.calls) == 1
+            assert Asset.find_by_id(asset.id).preview_status == 'pending'
+
+
+def _create_file_asset(filename, data):
+    course = Course.find_by_canvas_course_id(canvas_api_domain='bcourses.berkeley.edu', canvas_course_id=1502870)
+    user = course.users[0]
+    stored_file, _ = StoredFile.store(course_id=course.id, filename=filename, stream=io.BytesIO(data))
+    return Asset.create(
+        asset_type='file',
+        content_hash=stored_file.content_hash,
+        course_id=course.id,
+        created_by=user.id,
+        download_url=stored_file.download_url,
+        mime=stored_file.content_type,
+        title=filename,
+        users=[user],
+    )
+
+
+def _get_image(s3, url):
+    bucket, key = url.split('/', 3)[2].split('.')[0], url.split('/', 3)[3]
+    return Image.open(io.BytesIO(s3.Object(bucket, key).get()['Body'].read()))
@@ -0,0 +1,94 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from datetime import timedelta
+from types import SimpleNamespace
+
+from squiggy import std_commit
+from squiggy.lib.poll_scheduler import get_next_due_at, get_poll_interval, schedule_next_poll, schedule_poll_retry
+from squiggy.lib.util import utc_now
+from squiggy.models.course import Course
+from squiggy.models.user import User
+
+
+class TestPollScheduler:
+    """Priority-based poll scheduling."""
+
+    def test_poll_interval(self, app):
+        """Hot courses are polled every few minutes, cold ones daily."""
+        assert get_poll_interval(1) == timedelta(minutes=app.config['CANVAS_POLLER_MIN_INTERVAL_MINUTES'])
+        assert get_poll_interval(0) == timedelta(minutes=app.config['CANVAS_POLLER_MAX_INTERVAL_MINUTES'])
+        assert get_poll_interval(0.25) > get_poll_interval(0.5) > get_poll_interval(0.75)
+
+    def test_next_due_at(self):
+        """Picks the published due date nearest to now."""
+        now = utc_now()
+        assignments = [
+            SimpleNamespace(published=True, due_at_date=now + timedelta(days=3)),
+            SimpleNamespace(published=True, due_at_date=now - timedelta(hours=6)),
+            SimpleNamespace(published=False, due_at_date=now + timedelta(hours=1)),
+            SimpleNamespace(published=True),
+        ]
+        assert get_next_due_at(assignments, now=now) == now - timedelta(hours=6)
+        assert get_next_due_at([], now=now) is None
+
+    def test_active_course_polled_sooner(self):
+        """A course with recent activity, launches and deadlines is scheduled ahead of a dormant one."""
+        hot_course, cold_course = Course.query.order_by(Course.id).limit(2).all()
+        now = utc_now()
+        hot_course.last_launched_at = now
+        for user in User.query.filter_by(course_id=hot_course.id).all():
+            user.last_activity = now
+        for user in User.query.filter_by(course_id=cold_course.id).all():
+            user.last_activity = None
+        cold_course.last_launched_at = None
+        cold_course.poll_change_rate = 0
+        std_commit()
+
+        hot_course = schedule_next_poll(hot_course, next_due_at=now + timedelta(hours=2), polled_since=now)
+        cold_course = schedule_next_poll(cold_course, next_due_at=None, polled_since=now + timedelta(minutes=1))
+        assert hot_course.poll_priority > 0.5
+        assert hot_course.next_poll_at < now + timedelta(hours=1)
+        assert cold_course.poll_priority < 0.1
+        assert cold_course.next_poll_at > now + timedelta(hours=12)
+
+    def test_failed_poll_backs_off(self, app):
+        """Each consecutive failure doubles the wait before the next poll, and a successful poll resets the count."""
+        course = Course.query.order_by(Course.id).first()
+        retry_minutes = app.config['CANVAS_POLLER_RETRY_MINUTES']
+        for poll_failures in [1, 2, 3]:
+            now = utc_now()
+            course = schedule_poll_retry(course)
+            assert course.poll_failures == poll_failures
+            wait = course.next_poll_at - now
+            backoff = timedelta(minutes=retry_minutes * 2 ** (poll_failures - 1))
+            assert backoff <= wait <= backoff * 1.5 + timedelta(seconds=1)
+        # Not beyond the interval of the coldest course
+        course.poll_failures = 20
+        course = schedule_poll_retry(course)
+        assert course.next_poll_at <= utc_now() + timedelta(minutes=app.config['CANVAS_POLLER_MAX_INTERVAL_MINUTES'])
+
+        course = schedule_next_poll(course, next_due_at=None, polled_since=utc_now())
+        assert course.poll_failures == 0
@@ -0,0 +1,114 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import pytest
+import responses
+from sqlalchemy.sql import text
+from squiggy import db
+from squiggy.lib.preview_dispatcher import dispatch_preview_requests, get_preview_dispatcher_metrics
+from squiggy.models.asset import Asset
+from squiggy.models.course import Course
+from squiggy.models.preview_request import PreviewRequest
+from tests.util import override_config
+
+previews_url = 'https://example.com/previews'
+
+
+@pytest.fixture(scope='function')
+def queued_asset(app):
+    course = Course.find_by_canvas_course_id(canvas_api_domain='bcourses.berkeley.edu', canvas_course_id=1502870)
+    user = course.users[0]
+    with override_config(app, 'PREVIEWS_ENABLED', True):
+        yield Asset.create(
+            asset_type='link',
+            course_id=course.id,
+            created_by=user.id,
+            title='Wheel in the sky',
+            url='https://en.wikipedia.org/wiki/Wheel_in_the_Sky',
+            users=[user],
+        )
+
+
+class TestPreviewDispatcher:
+    """Outbox of preview-service requests."""
+
+    @responses.activate
+    def test_asset_create_queues_request(self, queued_asset):
+        """Creating an asset queues its preview request rather than sending it."""
+        assert queued_asset.preview_status == 'pending'
+        preview_requests = _get_preview_requests(queued_asset)
+        assert len(preview_requests) == 1
+        assert preview_requests[0].object_type == 'asset'
+        assert preview_requests[0].object_url == 'https://en.wikipedia.org/wiki/Wheel_in_the_Sky'
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_dispatch(self, app, queued_asset):
+        """Sends due requests and removes them from the queue."""
+        responses.add(responses.POST, previews_url, status=200)
+        sent = get_preview_dispatcher_metrics()['sent']
+        with override_config(app, 'PREVIEWS_ENABLED', True):
+            assert get_preview_dispatcher_metrics()['queueDepth'] == 1
+            assert dispatch_preview_requests() == 1
+            assert dispatch_preview_requests() == 0
+        assert len(responses.calls) == 1
+        assert responses.calls[0].request.headers['authorization'].startswith('Bearer ')
+        assert f'id={queued_asset.id}' in responses.calls[0].request.body
+        assert _get_preview_requests(queued_asset) == []
+        metrics = get_preview_dispatcher_metrics()
+        assert metrics['queueDepth'] == 0
+        assert metrics['oldestAgeSeconds'] is None
+        assert metrics['sent'] == sent + 1
+        assert queued_asset.preview_status == 'pending'
+
+    @responses.activate
+    def test_retry_and_give_up(self, app, queued_asset):
+        """Failed requests are retried later, until the last attempt marks the preview as failed."""
+        responses.add(responses.POST, previews_url, status=503)
+        with override_config(app, 'PREVIEWS_ENABLED', True), override_config(app, 'PREVIEWS_DISPATCH_MAX_ATTEMPTS', 2):
+            assert dispatch_preview_requests() == 1
+            preview_request = _get_preview_requests(queued_asset)[0]
+            assert preview_request.attempts == 1
+            assert '503' in preview_request.last_error
+            # Not due until the backoff has passed.
+            assert dispatch_preview_requests() == 0
+
+            _make_due(preview_request)
+            assert dispatch_preview_requests() == 1
+        assert len(responses.calls) == 2
+        assert _get_preview_requests(queued_asset) == []
+        assert Asset.find_by_id(queued_asset.id).preview_status == 'error'
+
+
+def _get_preview_requests(asset):
+    preview_requests = PreviewRequest.query.filter_by(object_id=asset.id, object_type='asset').all()
+    for preview_request in preview_requests:
+        db.session.refresh(preview_request)
+    return preview_requests
+
+
+def _make_due(preview_request):
+    sql = "UPDATE preview_requests SET next_attempt_at = now() - interval '1 second' WHERE id = :id"
+    db.session.execute(text(sql), {'id': preview_request.id})
@@ -0,0 +1,112 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from queue import Queue
+
+from squiggy.lib.whiteboard_broadcasts import flush_whiteboard_broadcasts, queue_whiteboard_element_broadcast
+from tests.util import override_config
+
+ROOM = 'whiteboard-1'
+
+
+class TestWhiteboardBroadcasts:
+    """Outbound batching of whiteboard element updates."""
+
+    def test_updates_batched_per_room(self, app):
+        server = _MockServer(['sid-a', 'sid-b', 'sid-c'])
+        with override_config(app, 'WHITEBOARD_BROADCAST_FRAME_MILLISECONDS', 40):
+            # A drag, then a patch to the same element from another user.
+            for left in range(10):
+                _queue([_element('uuid-1', left=left, version=left + 1)], 'sid-a')
+            _queue([{'patch': {'top': 5}, 'uuid': 'uuid-1', 'version': 11}], 'sid-b')
+            _queue([{'patch': {'fill': 'red'}, 'uuid': 'uuid-2', 'version': 3}], 'sid-b')
+            _queue([{'patch': {'fill': 'blue'}, 'uuid': 'uuid-2', 'version': 4}], 'sid-b')
+
+            assert flush_whiteboard_broadcasts(server) == 1
+            assert flush_whiteboard_broadcasts(server) == 0
+
+        assert len(server.emits) == 1
+        assert server.emits[0]['skip_sid'] is None
+        assert server.emits[0]['to'] == ROOM
+        assert server.emits[0]['data'] == [
+            {'assetId': None, 'element': {'left': 9, 'top': 5, 'uuid': 'uuid-1'}, 'socketId': None, 'uuid': 'uuid-1', 'version': 11},
+            {'patch': {'fill': 'blue'}, 'socketId': 'sid-b', 'uuid': 'uuid-2', 'version': 4},
+        ]
+
+    def test_slow_client_catches_up(self, app):
+        server = _MockServer(['sid-a', 'sid-b'])
+        for _ in range(100):
+            server.queues['eio-sid-b'].put('packet')
+        with override_config(app, 'WHITEBOARD_BROADCAST_FRAME_MILLISECONDS', 40):
+            _queue([_element('uuid-1', left=1, version=1)], 'sid-a')
+            flush_whiteboard_broadcasts(server)
+            _queue([_element('uuid-1', left=2, version=2)], 'sid-a')
+            flush_whiteboard_broadcasts(server)
+            assert [e['skip_sid'] for e in server.emits] == [['sid-b'], ['sid-b']]
+
+            # Once its queue drains, the slow client gets the latest of what it missed, once.
+            server.queues['eio-sid-b'] = Queue()
+            assert flush_whiteboard_broadcasts(server) == 1
+            assert flush_whiteboard_broadcasts(server) == 0
+        assert server.emits[-1]['to'] == 'sid-b'
+        assert server.emits[-1]['data'] == [{**_element('uuid-1', left=2, version=2), 'socketId': 'sid-a'}]
+
+
+class _MockServer:
+
+    def __init__(self, socket_ids):
+        server = self
+        self.emits = []
+        self.queues = {f'eio-{socket_id}': Queue() for socket_id in socket_ids}
+
+        class _Manager:
+            def eio_sid_from_sid(self, socket_id, namespace):
+                return f'eio-{socket_id}' if f'eio-{socket_id}' in server.queues else None
+
+            def get_participants(self, namespace, room):
+                return [(eio_socket_id[len('eio-'):], eio_socket_id) for eio_socket_id in server.queues]
+
+        class _EngineIOSocket:
+            def __init__(self, queue):
+                self.queue = queue
+
+        class _EngineIO:
+            @property
+            def sockets(self):
+                return {eio_socket_id: _EngineIOSocket(queue) for eio_socket_id, queue in server.queues.items()}
+
+        self.eio = _EngineIO()
+        self.manager = _Manager()
+
+    def emit(self, event, data, namespace=None, skip_sid=None, to=None):
+        self.emits.append({'data': data, 'event': event, 'skip_sid': skip_sid, 'to': to})
+
+
+def _element(uuid, left, version):
+    return {'assetId': None, 'element': {'left': left, 'uuid': uuid}, 'uuid': uuid, 'version': version}
+
+
+def _queue(whiteboard_elements, socket_id):
+    queue_whiteboard_element_broadcast(whiteboard_elements=whiteboard_elements, namespace='/', room=ROOM, socket_id=socket_id)
@@ -0,0 +1,203 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+import json
+import os
+from unittest.mock import MagicMock, patch
+from uuid import uuid4
+
+from squiggy import db, std_commit
+from squiggy.lib import whiteboard_edits
+from squiggy.lib.util import isoformat, utc_now
+from squiggy.lib.whiteboard_edits import buffer_whiteboard_elements, flush_whiteboard_edits, get_pending_edit_count, \
+    recover_whiteboard_edits
+from squiggy.models.user import User
+from squiggy.models.whiteboard import Whiteboard
+from squiggy.models.whiteboard_element import WhiteboardElement
+from tests.util import override_config
+
+
+class TestWhiteboardEdits:
+    """Write-behind buffer of whiteboard edits."""
+
+    def test_edits_coalesced(self, app, mock_whiteboard):
+        whiteboard_id = mock_whiteboard['id']
+        user_id = mock_whiteboard['users'][0]['id']
+        existing = mock_whiteboard['whiteboardElements'][0]
+        dragged = _mock_edit(mock_whiteboard)
+        with override_config(app, 'WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS', 250):
+            # A drag sends the element on every mouse move.
+            for left in range(100):
+                dragged['element']['left'] = left
+                buffer_whiteboard_elements(
+                    whiteboard_elements=[_copy(dragged), _mock_edit(mock_whiteboard, existing)],
+                    whiteboard_id=whiteboard_id,
+                    socket_id='socket-1',
+                    user_id=user_id,
+                )
+            assert get_pending_edit_count(whiteboard_id) == 2
+            assert WhiteboardElement.find_all(uuids=[dragged['uuid']], whiteboard_id=whiteboard_id) == []
+
+            assert flush_whiteboard_edits() == 2
+            assert get_pending_edit_count(whiteboard_id) == 0
+            assert flush_whiteboard_edits() == 0
+
+        saved = WhiteboardElement.find_all(uuids=[dragged['uuid']], whiteboard_id=whiteboard_id)
+        assert len(saved) == 1
+        assert saved[0].element['left'] == 99
+        assert saved[0].z_index > max(w['zIndex'] for w in mock_whiteboard['whiteboardElements'])
+
+    def test_patches(self, app, mock_whiteboard):
+        whiteboard_id = mock_whiteboard['id']
+        existing = mock_whiteboard['whiteboardElements'][0]
+        assert existing['version'] == 1
+
+        def _patch(patch, from_version, uuid=existing['uuid']):
+            return buffer_whiteboard_elements(
+                whiteboard_elements=[{**_mock_patch(mock_whiteboard, patch, uuid), 'from_version': from_version}],
+                whiteboard_id=whiteboard_id,
+                socket_id='socket-1',
+                user_id=mock_whiteboard['users'][0]['id'],
+            )[0]
+
+        with override_config(app, 'WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS', 250):
+            assert _patch({'left': 5}, 1) == {'uuid': existing['uuid'], 'version': 2}
+            assert _patch({'top': 7}, 2) == {'uuid': existing['uuid'], 'version': 3}
+            # A client that missed the last patch gets the full element back.
+            outdated = _patch({'fill': 'rgb(255,0,0)'}, 2)
+            assert outdated['version'] == 4
+            assert outdated['asset_id'] == existing['assetId']
+            assert outdated['element'] == {**existing['element'], 'fill': 'rgb(255,0,0)', 'left': 5, 'top': 7}
+            assert _patch({'left': 1}, 1, uuid=str(uuid4())) is None
+            assert get_pending_edit_count(whiteboard_id) == 1
+            assert WhiteboardElement.find_all(uuids=[existing['uuid']], whiteboard_id=whiteboard_id)[0].version == 1
+            assert flush_whiteboard_edits() == 1
+
+        saved = WhiteboardElement.find_all(uuids=[existing['uuid']], whiteboard_id=whiteboard_id)[0]
+        assert saved.version == 4
+        assert saved.element == outdated['element']
+        # Without the buffer, a patch is saved as it arrives.
+        assert _patch({'width': 10}, 4) == {'uuid': existing['uuid'], 'version': 5}
+        db.session.refresh(saved)
+        assert (saved.version, saved.element['width'], saved.element['left']) == (5, 10, 5)
+
+    def test_bad_edit_does_not_block_others(self, app, mock_whiteboard):
+        user = User.find_by_id(mock_whiteboard['users'][0]['id'])
+        other_whiteboard = Whiteboard.create(course_id=user.course_id, created_by=user.id, title='Other whiteboard', users=[user])
+        poisoned = _mock_edit(mock_whiteboard)
+        WhiteboardElement.create(element=poisoned['element'], uuid=poisoned['uuid'], whiteboard_id=mock_whiteboard['id'], z_index=99)
+        std_commit(allow_test_environment=True)
+        good_edits = {mock_whiteboard['id']: _mock_edit(mock_whiteboard), other_whiteboard['id']: _mock_edit(mock_whiteboard)}
+
+        with override_config(app, 'WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS', 250):
+            # Postgres will not take a NUL character into jsonb.
+            edits_per_whiteboard = [
+                (mock_whiteboard['id'], {**_mock_patch(mock_whiteboard, {'text': 'Nul\u0000'}, poisoned['uuid']), 'from_version': 1}),
+                (mock_whiteboard['id'], good_edits[mock_whiteboard['id']]),
+                (other_whiteboard['id'], good_edits[other_whiteboard['id']]),
+            ]
+            for whiteboard_id, edit in edits_per_whiteboard:
+                buffer_whiteboard_elements(whiteboard_elements=[edit], whiteboard_id=whiteboard_id, socket_id='socket-1', user_id=user.id)
+            assert flush_whiteboard_edits() == 2
+            assert get_pending_edit_count(mock_whiteboard['id']) == 0
+            assert get_pending_edit_count(other_whiteboard['id']) == 0
+            assert flush_whiteboard_edits() == 0
+
+        for whiteboard_id, edit in good_edits.items():
+            assert len(WhiteboardElement.find_all(uuids=[edit['uuid']], whiteboard_id=whiteboard_id)) == 1
+        assert WhiteboardElement.find_versions(uuids=[poisoned['uuid']], whiteboard_id=mock_whiteboard['id']) == {poisoned['uuid']: 1}
+
+    def test_recover_journal_of_dead_process(self, app, mock_whiteboard, tmp_path):
+        whiteboard_id = mock_whiteboard['id']
+        edited_at = isoformat(utc_now())
+        lost = {**_mock_edit(mock_whiteboard), 'edited_at': edited_at, 'whiteboard_id': whiteboard_id}
+        existing = mock_whiteboard['whiteboardElements'][0]
+        # Saved after the dead process journaled it, so the journaled edit is stale.
+        superseded = {**_mock_edit(mock_whiteboard, existing), 'edited_at': '2020-01-01T00:00:00+00:00', 'whiteboard_id': whiteboard_id}
+        (tmp_path / 'elsewhere-1234.lock').touch()
+        with open(tmp_path / 'elsewhere-1234.0000000001.log', 'w') as f:
+            f.write(json.dumps(superseded) + '\n' + json.dumps(lost) + '\n')
+            # A line cut short when the process died
+            f.write('{"asset_id": nu')
+
+        with override_config(app, 'WHITEBOARD_EDITS_JOURNAL_DIR', str(tmp_path)):
+            assert recover_whiteboard_edits() == 1
+        assert os.listdir(tmp_path) == []
+        assert len(WhiteboardElement.find_all(uuids=[lost['uuid']], whiteboard_id=whiteboard_id)) == 1
+
+    def test_recover_redis_journal_of_dead_process(self, app, mock_whiteboard):
+        lost = {**_mock_edit(mock_whiteboard), 'edited_at': isoformat(utc_now()), 'whiteboard_id': mock_whiteboard['id']}
+        redis_client = MagicMock()
+        redis_client.smembers.return_value = {'whiteboard_edits:elsewhere', 'whiteboard_edits:alive'}
+        # The heartbeat of the live journal has yet to expire.
+        redis_client.set.side_effect = lambda key, *args, **kwargs: key == 'whiteboard_edits:elsewhere:heartbeat'
+        redis_client.scan_iter.return_value = ['whiteboard_edits:elsewhere:0000000001']
+        redis_client.lrange.return_value = [json.dumps(lost), '{"asset_id": nu']
+
+        with override_config(app, 'REDIS_HOST', 'redis.example.com'):
+            with patch.object(whiteboard_edits.redis, 'from_url', return_value=redis_client):
+                assert recover_whiteboard_edits() == 1
+        redis_client.scan_iter.assert_called_once_with(match='whiteboard_edits:elsewhere:[0-9]*')
+        redis_client.delete.assert_any_call('whiteboard_edits:elsewhere:0000000001')
+        redis_client.srem.assert_called_once_with('whiteboard_edits:journals', 'whiteboard_edits:elsewhere')
+        assert len(WhiteboardElement.find_all(uuids=[lost['uuid']], whiteboard_id=mock_whiteboard['id'])) == 1
+
+
+def _copy(edit):
+    return json.loads(json.dumps(edit))
+
+
+def _mock_patch(whiteboard, patch, uuid):
+    return {
+        'course_id': whiteboard['courseId'],
+        'patch': patch,
+        'user_id': whiteboard['users'][0]['id'],
+        'uuid': uuid,
+    }
+
+
+def _mock_edit(whiteboard, whiteboard_element=None):
+    if whiteboard_element:
+        return {
+            'asset_id': whiteboard_element['assetId'],
+            'course_id': whiteboard['courseId'],
+            'element': _copy(whiteboard_element['element']),
+            'user_id': whiteboard['users'][0]['id'],
+            'uuid': whiteboard_element['uuid'],
+        }
+    uuid = str(uuid4())
+    return {
+        'asset_id': None,
+        'course_id': whiteboard['courseId'],
+        'element': {
+            'fill': 'rgb(0,0,0)',
+            'fontSize': 14,
+            'text': 'Drag me',
+            'type': 'i-text',
+            'uuid': uuid,
+        },
+        'user_id': whiteboard['users'][0]['id'],
+        'uuid': uuid,
+    }
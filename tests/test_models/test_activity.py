@@ -0,0 +1,136 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.sql import text
+from squiggy import db
+from squiggy.models.activity import Activity
+from squiggy.models.activity_type import ActivityType
+from squiggy.models.user import User
+
+
+class TestActivityBatch:
+    """Batched activity writes."""
+
+    def test_one_insert_per_batch(self, mock_asset):
+        """Writes the batch in one INSERT and adds points once per user."""
+        owner = mock_asset.users[0]
+        commenter = next(u for u in User.query.filter_by(course_id=mock_asset.course_id).all() if u.id != owner.id)
+        points_before = {owner.id: owner.points or 0, commenter.id: commenter.points or 0}
+
+        with _capture_statements() as statements:
+            with Activity.batch():
+                comment_activity = _create_activity(mock_asset, 'asset_comment', commenter.id)
+                replies = [
+                    _create_activity(mock_asset, 'get_asset_comment', owner.id, actor_id=commenter.id, reciprocal_id=comment_activity.id)
+                    for _ in range(3)
+                ]
+                assert comment_activity.id and all(r.id for r in replies)
+        assert len([s for s in statements if s.lstrip().startswith('INSERT INTO activities')]) == 1
+        assert len([s for s in statements if s.lstrip().startswith('UPDATE users')]) == 1
+
+        assert Activity.query.filter_by(reciprocal_id=comment_activity.id).count() == 3
+        points = {c['type']: c['points'] if c['enabled'] else 0 for c in ActivityType.get_activity_type_configuration(mock_asset.course_id)}
+        assert User.find_by_id(commenter.id).points == points_before[commenter.id] + points['asset_comment']
+        assert User.find_by_id(owner.id).points == points_before[owner.id] + 3 * points['get_asset_comment']
+        assert User.find_by_id(owner.id).last_activity
+
+    def test_exception_discards_batch(self, mock_asset):
+        """Nothing is written if the block raises."""
+        owner = mock_asset.users[0]
+        activity_count = Activity.query.filter_by(asset_id=mock_asset.id).count()
+        with pytest.raises(ValueError):
+            with Activity.batch():
+                _create_activity(mock_asset, 'asset_like', owner.id)
+                raise ValueError()
+        assert Activity.query.filter_by(asset_id=mock_asset.id).count() == activity_count
+        assert not Activity.is_batch_open()
+
+
+class TestRecalculatePoints:
+    """Points from maintained activity counts."""
+
+    def test_counts_follow_inserts_and_deletes(self, mock_asset):
+        """Activity counts are kept current as activities come and go."""
+        owner = mock_asset.users[0]
+        _create_activity(mock_asset, 'asset_like', owner.id)
+        assert _get_activity_count(owner.id, 'asset_like') == Activity.query.filter_by(user_id=owner.id, activity_type='asset_like').count()
+        Activity.delete_by_object_id(object_type='asset', object_id=mock_asset.id, course_id=mock_asset.course_id, user_ids=[owner.id])
+        assert _get_activity_count(owner.id, 'asset_like') == Activity.query.filter_by(user_id=owner.id, activity_type='asset_like').count()
+
+    def test_reconfiguration_is_one_update(self, mock_asset):
+        """Reweighting a course recalculates every user's points without reading activities."""
+        ActivityType.update_activity_type_configuration(
+            course_id=mock_asset.course_id,
+            updates=[
+                {'type': 'asset_comment', 'enabled': True, 'points': 10},
+                {'type': 'get_asset_comment', 'enabled': False, 'points': 1},
+            ],
+        )
+        with _capture_statements() as statements:
+            Activity.recalculate_points(course_id=mock_asset.course_id)
+        assert len([s for s in statements if s.lstrip().startswith('WITH totals')]) == 1
+        assert not [s for s in statements if 'FROM activities' in s]
+
+        points = {c['type']: c['points'] if c['enabled'] else 0 for c in ActivityType.get_activity_type_configuration(mock_asset.course_id)}
+        for user in User.query.filter_by(course_id=mock_asset.course_id).all():
+            expected = sum(points.get(a.activity_type) or 0 for a in Activity.query.filter_by(user_id=user.id).all())
+            assert user.points == expected
+
+
+def _create_activity(asset, activity_type, user_id, actor_id=None, reciprocal_id=None):
+    return Activity.create(
+        activity_type=activity_type,
+        course_id=asset.course_id,
+        user_id=user_id,
+        object_type='asset',
+        object_id=asset.id,
+        asset_id=asset.id,
+        actor_id=actor_id,
+        reciprocal_id=reciprocal_id,
+    )
+
+
+def _get_activity_count(user_id, activity_type):
+    sql = 'SELECT count FROM activity_counts WHERE user_id = :user_id AND activity_type = :activity_type'
+    row = db.session.execute(text(sql), {'activity_type': activity_type, 'user_id': user_id}).first()
+    return row['count'] if row else 0
+
+
+@contextmanager
+def _capture_statements():
+    statements = []
+
+    def _capture(conn, cursor, statement, *args):
+        statements.append(statement)
+    engine = db.session.get_bind().engine
+    event.listen(engine, 'before_cursor_execute', _capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', _capture)
@@ -0,0 +1,141 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from squiggy import db
+from squiggy.models.asset import Asset
+from squiggy.models.user import User
+
+
+class TestSectionVisibility:
+    """Maintained section visibility of assets."""
+
+    def test_student_asset(self, mock_asset):
+        """A student's asset is visible in the student's sections."""
+        assert mock_asset.is_visible_to_sections(['section A'])
+        assert mock_asset.is_visible_to_sections(['section B', 'section A'])
+        assert not mock_asset.is_visible_to_sections(['section B'])
+        assert not mock_asset.is_visible_to_sections([])
+
+    def test_roster_sync(self, mock_asset):
+        """Visibility follows the owner when a roster sync moves them to another section."""
+        owner = User.find_by_id(mock_asset.created_by)
+        User.sync_roster(
+            course_id=owner.course_id,
+            users_to_create=[],
+            users_to_update=[{**_to_roster_row(owner), 'canvas_course_sections': ['section B']}],
+            user_ids_to_inactivate=[],
+        )
+        assert mock_asset.is_visible_to_sections(['section B'])
+        assert not mock_asset.is_visible_to_sections(['section A'])
+
+        User.sync_roster(
+            course_id=owner.course_id,
+            users_to_create=[],
+            users_to_update=[{**_to_roster_row(owner), 'canvas_course_role': 'TeacherEnrollment'}],
+            user_ids_to_inactivate=[],
+        )
+        assert mock_asset.is_visible_to_sections(['section C'])
+        assert mock_asset.is_visible_to_sections([])
+
+    def test_teacher_asset(self, mock_asset):
+        """An asset created by a teacher is visible in every section."""
+        teacher = User.query.filter_by(course_id=mock_asset.course_id, canvas_course_role='Teacher').first()
+        asset = Asset.create(
+            asset_type='link',
+            course_id=mock_asset.course_id,
+            created_by=teacher.id,
+            title='Teacher asset',
+            url='https://www.example.com',
+            users=[teacher],
+        )
+        assert asset.is_visible_to_sections(['section Z'])
+
+
+class TestToApiJson:
+    """Asset detail JSON."""
+
+    def test_single_round_trip(self, mock_asset):
+        """Owners, categories, likes and whiteboard usage load in one statement, however many owners."""
+        students = User.query.filter_by(course_id=mock_asset.course_id, canvas_course_role='Student').all()
+        asset = Asset.create(
+            asset_type='link',
+            categories=mock_asset.categories,
+            course_id=mock_asset.course_id,
+            created_by=students[0].id,
+            title='Group project',
+            url='https://www.example.com',
+            users=students,
+        )
+        asset.add_like(user_id=mock_asset.created_by)
+        with _capture_statements() as statements:
+            api_json = asset.to_api_json(user_id=mock_asset.created_by)
+        assert len(statements) == 1
+
+        assert api_json['liked'] is True
+        assert api_json['isUsedInWhiteboards'] is False
+        assert api_json['usedInAssets'] == []
+        assert api_json['categories'] == sorted([c.to_api_json() for c in mock_asset.categories], key=lambda c: c['id'])
+        assert [u['id'] for u in api_json['users']] == sorted(s.id for s in students)
+        for user in api_json['users']:
+            assert user['canvasFullName']
+            assert user['isStudent'] is True
+            assert user['isTeaching'] is False
+            assert 'lookingForCollaborators' in user
+            assert 'bookmarkletAuth' not in user
+
+    def test_not_liked(self, mock_asset):
+        """An asset is not liked by the anonymous or by users who have not liked it."""
+        assert mock_asset.to_api_json()['liked'] is False
+        assert mock_asset.to_api_json(user_id=mock_asset.created_by)['liked'] is False
+
+
+def _to_roster_row(user):
+    return {
+        'canvas_course_role': user.canvas_course_role,
+        'canvas_course_sections': user.canvas_course_sections,
+        'canvas_email': user.canvas_email,
+        'canvas_enrollment_state': user.canvas_enrollment_state,
+        'canvas_full_name': user.canvas_full_name,
+        'canvas_image': user.canvas_image,
+        'canvas_user_id': user.canvas_user_id,
+        'id': user.id,
+    }
+
+
+@contextmanager
+def _capture_statements():
+    statements = []
+
+    def _capture(conn, cursor, statement, *args):
+        statements.append(statement)
+    engine = db.session.get_bind().engine
+    event.listen(engine, 'before_cursor_execute', _capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', _capture)
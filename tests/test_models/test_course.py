@@ -0,0 +1,108 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from datetime import timedelta
+
+import pytest
+from squiggy import db, std_commit
+from squiggy.lib.util import utc_now
+from squiggy.models.canvas import Canvas
+from squiggy.models.course import Course
+
+canvas_api_domain = 'poller.instructure.com'
+
+
+@pytest.fixture
+def poller_courses(db_session):
+    db.session.add(Canvas(
+        canvas_api_domain=canvas_api_domain,
+        api_key='api_key',
+        lti_key='poller_lti_key',
+        lti_secret='poller_lti_secret',
+        name='Poller Canvas',
+    ))
+    std_commit()
+    return [Course.create(canvas_api_domain=canvas_api_domain, canvas_course_id=canvas_course_id) for canvas_course_id in range(1, 5)]
+
+
+class TestClaimForPolling:
+    """Course.claim_for_polling."""
+
+    def test_claims_never_polled_courses_first(self, poller_courses):
+        """Claims up to the batch limit and stamps last_polled."""
+        courses = Course.claim_for_polling(canvas_api_domain=canvas_api_domain, limit=3)
+        assert len(courses) == 3
+        assert all(c.last_polled for c in courses)
+
+    def test_lease_keeps_claimed_courses_away(self, poller_courses):
+        """A course claimed within the lease period is not handed out again."""
+        first_batch = Course.claim_for_polling(canvas_api_domain=canvas_api_domain, limit=3, lease_seconds=600)
+        second_batch = Course.claim_for_polling(canvas_api_domain=canvas_api_domain, limit=3, lease_seconds=600)
+        assert len(second_batch) == 1
+        assert second_batch[0].id not in [c.id for c in first_batch]
+        assert Course.claim_for_polling(canvas_api_domain=canvas_api_domain, limit=3, lease_seconds=600) == []
+
+    def test_skips_inactive_courses(self, poller_courses):
+        """Inactive courses are never claimed."""
+        for course in poller_courses:
+            course.active = False
+        std_commit()
+        assert Course.claim_for_polling(canvas_api_domain=canvas_api_domain, limit=10) == []
+
+    def test_waits_for_scheduled_poll(self, poller_courses):
+        """Courses are claimed once their next poll comes due, most overdue first."""
+        now = utc_now()
+        poller_courses[0].next_poll_at = now + timedelta(hours=1)
+        poller_courses[1].next_poll_at = now - timedelta(minutes=5)
+        poller_courses[2].next_poll_at = now - timedelta(hours=2)
+        poller_courses[3].next_poll_at = now + timedelta(minutes=5)
+        std_commit()
+        courses = Course.claim_for_polling(canvas_api_domain=canvas_api_domain, limit=1)
+        assert [c.id for c in courses] == [poller_courses[2].id]
+        courses = Course.claim_for_polling(canvas_api_domain=canvas_api_domain, limit=10)
+        assert [c.id for c in courses] == [poller_courses[1].id]
+
+
+class TestPollSchedule:
+    """Course poll schedule."""
+
+    def test_launch_pulls_next_poll_forward(self, poller_courses):
+        """An LTI launch moves a far-off poll to within the given window."""
+        course = poller_courses[0]
+        course.next_poll_at = utc_now() + timedelta(days=1)
+        std_commit()
+        Course.record_launch(course.id, poll_within_seconds=300)
+        course = Course.query.filter_by(id=course.id).populate_existing().one()
+        assert course.last_launched_at
+        assert course.next_poll_at < utc_now() + timedelta(seconds=301)
+
+    def test_poll_queue(self, poller_courses):
+        """Lists courses in the order they will be polled."""
+        poller_courses[0].next_poll_at = utc_now() + timedelta(hours=1)
+        std_commit()
+        queue = Course.get_poll_queue(canvas_api_domain=canvas_api_domain)
+        assert len(queue) == 4
+        assert queue[-1]['id'] == poller_courses[0].id
+        assert queue[-1]['nextPollAt']
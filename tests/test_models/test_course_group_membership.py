@@ -0,0 +1,52 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from squiggy.models.course_group import CourseGroup
+from squiggy.models.course_group_membership import CourseGroupMembership
+
+
+class TestReconcileMemberships:
+    """Bulk group membership changes."""
+
+    def test_add_and_remove(self, mock_course_group):
+        """Applies membership adds and removes as sets."""
+        course_id = mock_course_group.course_id
+        before = CourseGroupMembership.get_canvas_user_ids_per_group(course_id)[mock_course_group.id]
+        CourseGroupMembership.add_all(course_id=course_id, memberships=[(mock_course_group.id, 11), (mock_course_group.id, 12)])
+        assert CourseGroupMembership.get_canvas_user_ids_per_group(course_id)[mock_course_group.id] == before | {11, 12}
+        CourseGroupMembership.delete_all([(mock_course_group.id, 11), (mock_course_group.id, 12)])
+        assert CourseGroupMembership.get_canvas_user_ids_per_group(course_id)[mock_course_group.id] == before
+
+    def test_add_existing_membership(self, mock_course_group):
+        """Adding a membership that already exists is a no-op."""
+        course_id = mock_course_group.course_id
+        before = CourseGroupMembership.get_canvas_user_ids_per_group(course_id)[mock_course_group.id]
+        CourseGroupMembership.add_all(course_id=course_id, memberships=[(mock_course_group.id, canvas_user_id) for canvas_user_id in before])
+        assert CourseGroupMembership.get_canvas_user_ids_per_group(course_id)[mock_course_group.id] == before
+
+    def test_update_membership_hashes(self, mock_course_group):
+        """Stores membership hashes per group."""
+        CourseGroup.update_membership_hashes({mock_course_group.id: 'abc123'})
+        assert CourseGroup.query.filter_by(id=mock_course_group.id).populate_existing().one().membership_hash == 'abc123'
@@ -23,7 +23,12 @@ SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
 ENHANCEMENTS, OR MODIFICATIONS.
 """
 
+from contextlib import contextmanager
+
 import pytest
+from sqlalchemy import event
+from squiggy import db
+from squiggy.models.course import Course
 from squiggy.models.user import User
 
 
@@ -42,3 +47,55 @@ class TestUser:
         """Returns authorization record to Flask-Login for recognized user_id."""
         loaded_user = User.find_by_id(authorized_user_id)
         assert loaded_user.id == authorized_user_id
+
+
+class TestSyncRoster:
+    """Set-based roster sync."""
+
+    def test_round_trips_flat_with_roster_size(self, app):
+        """Inserts, updates and inactivations cost the same number of statements for a roster of 10 or of 1,000."""
+        course_ids = [course.id for course in Course.query.all()][:2]
+        statement_counts = []
+        for course_id, roster_size in zip(course_ids, [10, 1000]):
+            roster = [_roster_entry(course_id, canvas_user_id) for canvas_user_id in range(1, roster_size + 1)]
+            with _count_statements() as first_sync:
+                users = User.sync_roster(course_id=course_id, users_to_create=roster, users_to_update=[], user_ids_to_inactivate=[])
+            users = [u for u in users if u.canvas_user_id <= roster_size]
+            assert len(users) == roster_size
+
+            updates = [{**_roster_entry(course_id, u.canvas_user_id), 'id': u.id, 'canvas_full_name': 'Renamed'} for u in users[::2]]
+            inactivations = [u.id for u in users[1::2]]
+            with _count_statements() as second_sync:
+                users = User.sync_roster(course_id=course_id, users_to_create=[], users_to_update=updates, user_ids_to_inactivate=inactivations)
+            users_by_id = {u.id: u for u in users}
+            assert all(users_by_id[u['id']].canvas_full_name == 'Renamed' for u in updates)
+            assert all(users_by_id[user_id].canvas_enrollment_state == 'inactive' for user_id in inactivations)
+            statement_counts.append((first_sync['count'], second_sync['count']))
+        assert statement_counts[0] == statement_counts[1]
+
+
+def _roster_entry(course_id, canvas_user_id):
+    return {
+        'canvas_course_role': 'Student',
+        'canvas_course_sections': ['section A'],
+        'canvas_email': f'{canvas_user_id}@berkeley.edu',
+        'canvas_enrollment_state': 'active',
+        'canvas_full_name': f'Student {canvas_user_id}',
+        'canvas_image': None,
+        'canvas_user_id': canvas_user_id,
+        'course_id': course_id,
+    }
+
+
+@contextmanager
+def _count_statements():
+    counter = {'count': 0}
+
+    def _increment(*args, **kwargs):
+        counter['count'] += 1
+    engine = db.session.get_bind().engine
+    event.listen(engine, 'before_cursor_execute', _increment)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', _increment)
@@ -0,0 +1,96 @@
+"""
+Copyright ©2024. The Regents of the University of California (Regents). All Rights Reserved.
+
+Permission to use, copy, modify, and distribute this software and its documentation
+for educational, research, and not-for-profit purposes, without fee and without a
+signed licensing agreement, is hereby granted, provided that the above copyright
+notice, this paragraph and the following two paragraphs appear in all copies,
+modifications, and distributions.
+
+Contact The Office of Technology Licensing, UC Berkeley, 2150 Shattuck Avenue,
+Suite 510, Berkeley, CA 94720-1620, (510) 643-7201, otl@berkeley.edu,
+http://ipira.berkeley.edu/industry-info for commercial licensing opportunities.
+
+IN NO EVENT SHALL REGENTS BE LIABLE TO ANY PARTY FOR DIRECT, INDIRECT, SPECIAL,
+INCIDENTAL, OR CONSEQUENTIAL DAMAGES, INCLUDING LOST PROFITS, ARISING OUT OF
+THE USE OF THIS SOFTWARE AND ITS DOCUMENTATION, EVEN IF REGENTS HAS BEEN ADVISED
+OF THE POSSIBILITY OF SUCH DAMAGE.
+
+REGENTS SPECIFICALLY DISCLAIMS ANY WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE. THE
+SOFTWARE AND ACCOMPANYING DOCUMENTATION, IF ANY, PROVIDED HEREUNDER IS PROVIDED
+"AS IS". REGENTS HAS NO OBLIGATION TO PROVIDE MAINTENANCE, SUPPORT, UPDATES,
+ENHANCEMENTS, OR MODIFICATIONS.
+"""
+
+from flask import request
+from flask_login import login_user, logout_user
+from squiggy.lib.login_session import LoginSession
+from squiggy.lib.whiteboard_edits import flush_whiteboard_edits
+from squiggy.models.whiteboard_element import WhiteboardElement
+from squiggy.sockets import register_sockets
+from tests.util import override_config
+
+
+class TestUpsertWhiteboardElement:
+    """Whiteboard element patches over socket.io."""
+
+    def test_patch_round_trip(self, app, mock_whiteboard):
+        whiteboard_id = mock_whiteboard['id']
+        existing = mock_whiteboard['whiteboardElements'][0]
+        handler = _get_socket_handlers(app)['upsert_whiteboard_element']
+
+        def _upsert(whiteboard_elements, socket_id):
+            with app.test_request_context():
+                login_user(LoginSession(mock_whiteboard['users'][0]['id']))
+                request.sid = socket_id
+                try:
+                    return handler({'whiteboardElements': whiteboard_elements, 'whiteboardId': whiteboard_id})
+                finally:
+                    # The app context, and with it the logged-in user, outlives this request.
+                    logout_user()
+
+        with override_config(app, 'WHITEBOARD_EDITS_FLUSH_INTERVAL_MILLISECONDS', 250):
+            response = _upsert([{'patch': {'left': 5}, 'uuid': existing['uuid'], 'version': existing['version']}], 'socket-1')
+            assert response == {'status': 200, 'whiteboardElements': [{'uuid': existing['uuid'], 'version': 2}]}
+            # Another client, still at the first version, gets the full element back.
+            response = _upsert([{'patch': {'top': 7}, 'uuid': existing['uuid'], 'version': existing['version']}], 'socket-2')
+            assert response['status'] == 200
+            assert response['whiteboardElements'] == [
+                {
+                    'assetId': existing['assetId'],
+                    'element': {**existing['element'], 'left': 5, 'top': 7},
+                    'uuid': existing['uuid'],
+                    'version': 3,
+                },
+            ]
+            assert flush_whiteboard_edits() == 1
+
+        saved = WhiteboardElement.find_all(uuids=[existing['uuid']], whiteboard_id=whiteboard_id)[0]
+        assert saved.version == 3
+        assert saved.element == {**existing['element'], 'left': 5, 'top': 7}
+
+
+class _SocketIO:
+
+    def __init__(self):
+        self.handlers = {}
+
+    def on(self, event):
+        def _register(handler):
+            self.handlers[event] = handler
+            return handler
+        return _register
+
+    def on_error(self):
+        return lambda handler: handler
+
+    def on_error_default(self, handler):
+        return handler
+
+
+def _get_socket_handlers(app):
+    socketio = _SocketIO()
+    with app.app_context():
+        register_sockets(socketio)
+    return socketio.handlers